@@ -0,0 +1,92 @@
+import time
+
+
+class ActiveGameTracker:
+    """Keeps track of the games tracked players are in right now (as seen through spectator-v5), so that match-v5
+    only gets asked for a match once its game has ended.
+
+    - tracked players in the same game share it, and a running game is checked through one of them every
+      check_interval seconds instead of looking every player up on their own
+    - once a game has ended, its match gets fetched every publish_retry_interval seconds until match-v5 has it, or
+      until publish_window seconds have passed (the match-list fallback picks up anything given up on)"""
+
+    def __init__(self, check_interval: float = 60, publish_retry_interval: float = 20, publish_window: float = 10 * 60):
+        self.check_interval = check_interval
+        self.publish_retry_interval = publish_retry_interval
+        self.publish_window = publish_window
+        # match_id -> {"player_names": set, "next_check": ..., "ended_at": None until the game has ended}
+        self.games: dict[str, dict] = {}
+        # player_name -> the match_id of the game they're in
+        self.game_of: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.games)
+
+    def in_game(self, player_name: str) -> bool:
+        match_id = self.game_of.get(player_name)
+        return match_id is not None and self.games[match_id]["ended_at"] is None
+
+    def sync_players(self, player_names) -> None:
+        """Forgets players who aren't tracked anymore, and the games nobody tracked is in anymore."""
+        player_names = set(player_names)
+        for player_name in self.game_of.keys() - player_names:
+            match_id = self.game_of.pop(player_name)
+            game = self.games[match_id]
+            game["player_names"].discard(player_name)
+            if not game["player_names"]:
+                del self.games[match_id]
+
+    def start(self, match_id: str, player_names) -> None:
+        """Records that these tracked players are in a running game. A player still attached to an earlier game
+        (that hasn't been published yet) gets moved over, and keeps being announced for the earlier one.
+        A game without any tracked players doesn't get recorded, since there'd be nobody to check it through."""
+        player_names = list(player_names)
+        if not player_names:
+            return
+        game = self.games.setdefault(match_id, {"player_names": set(), "next_check": 0.0, "ended_at": None})
+        for player_name in player_names:
+            previous_match_id = self.game_of.get(player_name)
+            if previous_match_id is not None and previous_match_id != match_id and self.games[previous_match_id]["ended_at"] is None:
+                # they can't be in two games at once, so the old one is over
+                self.end(previous_match_id)
+            self.game_of[player_name] = match_id
+            game["player_names"].add(player_name)
+        game["next_check"] = time.time() + self.check_interval
+
+    def due_checks(self) -> list[tuple[str, str]]:
+        """(match_id, player_name) for every running game that is due for a check, with the player to look it up through."""
+        now = time.time()
+        return [(match_id, min(game["player_names"])) for match_id, game in self.games.items()
+                if game["ended_at"] is None and game["next_check"] <= now]
+
+    def still_running(self, match_id: str) -> None:
+        if (game := self.games.get(match_id)) is not None:
+            game["next_check"] = time.time() + self.check_interval
+
+    def end(self, match_id: str) -> set[str]:
+        """Marks a game as over, so its match gets fetched right away. Returns the tracked players who were in it."""
+        game = self.games[match_id]
+        if game["ended_at"] is None:
+            game["ended_at"] = game["next_check"] = time.time()
+        return set(game["player_names"])
+
+    def due_fetches(self) -> list[str]:
+        """The match IDs of the ended games whose match should be fetched (again) now."""
+        now = time.time()
+        return [match_id for match_id, game in self.games.items() if game["ended_at"] is not None and game["next_check"] <= now]
+
+    def record_fetch(self, match_id: str, published: bool) -> set[str] | None:
+        """Records how fetching an ended game's match went. Returns the tracked players to announce it for once it's
+        been published, otherwise None (and the game is given up on once the publish window has passed)."""
+        game = self.games.get(match_id)
+        if game is None:
+            return None
+        now = time.time()
+        if not published and now - game["ended_at"] < self.publish_window:
+            game["next_check"] = now + self.publish_retry_interval
+            return None
+        del self.games[match_id]
+        for player_name in game["player_names"]:
+            if self.game_of.get(player_name) == match_id:
+                del self.game_of[player_name]
+        return game["player_names"] if published else None
@@ -1,46 +1,22 @@
 from dotenv import load_dotenv
 from os import getenv
 import aiohttp
+import asyncio
+import random
+import time
 import aiofiles
 import json
+import os
+import tempfile
 import logging
-from groq import AsyncGroq
-import inspect
-
-# logger stuff
-# the idea is to have 2 different log files -- one with every single logging message from discord.py
-# and one with only "higher level" log stuff which is easier to read
-logger = logging.getLogger('bot')
-logger.setLevel(logging.DEBUG)
-full_info_handler = logging.FileHandler(filename='logs/full_info.log', encoding='utf-8', mode='w')
-full_info_handler.setLevel(logging.DEBUG)
-important_stuff_handler = logging.FileHandler(filename='logs/important_stuff.log', encoding='utf-8', mode='w')
-important_stuff_handler.setLevel(logging.INFO)
-logger.addHandler(full_info_handler)
-logger.addHandler(important_stuff_handler)
-# giving the important_stuff_handler the same formatting as discord's full_info_handler
-# 1. Define the discord-style format
-# [%(asctime)s] [%(levelname)-8s] %(name)s: %(message)s
-discord_formatter = logging.Formatter(
-    ' [%(asctime)s] [%(levelname)-8s] %(name)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-important_stuff_handler.setFormatter(discord_formatter)
-
-
-def print_to_log(type_of_message: str, message: str) -> None:
-    """Prints a message to the log file with the specified type (e.g., INFO, WARNING, DEBUG))."""
-    if type_of_message not in ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]:
-        print_to_log("ERROR", f"Invalid log type: {type_of_message}")
-    type_of_message_map = {
-        "DEBUG": logging.DEBUG,
-        "INFO": logging.INFO,
-        "WARNING": logging.WARNING,
-        "ERROR": logging.ERROR,
-        "CRITICAL": logging.CRITICAL
-    }
-    level_int = type_of_message_map[type_of_message]
-    logger.log(level=level_int, msg=f"{inspect.stack()[1].function} -- {message}")
+import hashlib
+from urllib.parse import urlsplit
+from typing import AsyncIterator
+from rate_limiting import RiotRateLimiter, was_throttled
+import metrics
+
+# logging goes through a queue to a background thread, see bot_logging.py
+from bot_logging import logger, print_to_log, full_info_handler, important_stuff_handler, route_discord_logger
 
 
 async def read_json_file(filename: str) -> dict:
@@ -60,63 +36,233 @@ async def read_json_file(filename: str) -> dict:
         return {}
 
 
+def _write_json_file_atomically(filename: str, data: dict) -> None:
+    # compact, since these files are for the bot and not for people
+    content = json.dumps(data, separators=(",", ":")) if data else "{}"
+    # writing to a temporary file and renaming it over the real one means the real one is never half-written,
+    # even if the bot crashes mid-write (the rename is atomic as long as both files are in the same directory)
+    file_descriptor, temp_filename = tempfile.mkstemp(dir=os.path.dirname(filename) or ".", prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(file_descriptor, mode="w", encoding="utf-8") as f:
+            f.write(content + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, filename)
+    except BaseException:
+        os.unlink(temp_filename)
+        raise
+
+
 async def write_json_file(filename: str, data: dict) -> None:
-    """Safely writes a dictionary to a JSON file."""
-    async with aiofiles.open(filename, mode="w") as f:
-        if data:
-            # same thing, you can't json.dump(f) directly
-            # also adding a new line character to make it look better when read in the terminal
-            await f.write(json.dumps(data, indent=4) + "\n")
-        # if there is no data, write an empty dictionary
-        else:
-            await f.write("{}\n")
-
-
-async def get_http_response(url: str) -> dict | None:
-    """Sends a GET request to the specified URL and returns the response. Checks the status code as well."""
-    async with aiohttp.ClientSession() as session:
-        # the next with block automatically releases the response after it's done with it
-        async with session.get(url) as response:
-            response_code_errors = {
-                400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found", 429: "Rate Limit Exceeded",
-                500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable", 504: "Gateway Timeout", 520: "Nonstandard Cloudflare Error (server-side)"
-            }
-            # you do not need to await response.status as it is just an integer, not a coroutine (unlike .json() for example)
-            if response.status != 200:
+    """Safely writes a dictionary to a JSON file. The serializing and writing happen in a worker thread,
+    so don't change `data` until this returns."""
+    await asyncio.to_thread(_write_json_file_atomically, filename, data)
+
+
+# Riot's rate limits are counted separately for every region (americas, europe, asia, na1, euw1, ...), so each region
+# gets its own limiter and its own connection pool -- one region being throttled never holds up requests to another
+riot_rate_limiters: dict[str, RiotRateLimiter] = {}
+# how much of the key's limits this process gets -- the poller processes split them between themselves
+rate_limit_share = 1.0
+# long-lived sessions, so connections (and their TLS handshakes and DNS lookups) get reused
+# they are opened as regions get used (the default one in setup_hook) and all closed when the bot shuts down
+http_sessions: dict[str, aiohttp.ClientSession] = {}
+
+
+def get_riot_rate_limiter(region: str) -> RiotRateLimiter:
+    if region not in riot_rate_limiters:
+        riot_rate_limiters[region] = RiotRateLimiter(share=rate_limit_share)
+    return riot_rate_limiters[region]
+
+
+async def open_http_session(region: str) -> aiohttp.ClientSession:
+    """Opens the region's HTTP session if it isn't open already and returns it."""
+    session = http_sessions.get(region)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=20,
+            limit_per_host=20,  # kept explicit in case a session ever ends up talking to more than its region's host
+            ttl_dns_cache=300,  # seconds
+            keepalive_timeout=60,  # seconds an idle connection is kept around for reuse
+            enable_cleanup_closed=True,
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=20, connect=5, sock_read=15),
+            # sending the key as a header keeps it out of the URLs (and therefore out of the logs)
+            headers={"X-Riot-Token": getenv('RIOT_API_KEY') or ""},
+        )
+        http_sessions[region] = session
+        print_to_log("INFO", f"Opened HTTP session for region {region}")
+    return session
+
+
+async def close_http_sessions() -> None:
+    """Closes every region's HTTP session."""
+    for region, session in list(http_sessions.items()):
+        if not session.closed:
+            await session.close()
+            print_to_log("INFO", f"Closed HTTP session for region {region}")
+    http_sessions.clear()
+
+
+def region_of_url(url: str) -> str:
+    """The region a Riot API URL goes to, e.g. "europe" for https://europe.api.riotgames.com/..."""
+    return (urlsplit(url).hostname or "default").split(".")[0]
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Exponential backoff with full jitter, so retries from concurrent requests don't all line up."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+async def get_http_response(url: str, method: str = "default", max_attempts: int = 3, region: str | None = None,
+                            missing_ok: bool = False) -> dict | None:
+    """Sends a GET request to the specified URL and returns the response. Checks the status code as well.
+    The method is the name of the Riot endpoint being called, which is used for its per-method rate limit bucket,
+    and the region (taken from the URL unless it's given) decides which rate limiter and connection pool get used.
+    429s wait for Retry-After, while 5xx responses, timeouts and bodies that aren't JSON are retried with jittered backoff.
+    With missing_ok, a 404 is an answer rather than an error and comes back as an empty dict."""
+    response_code_errors = {
+        400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found", 429: "Rate Limit Exceeded",
+        500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable", 504: "Gateway Timeout", 520: "Nonstandard Cloudflare Error (server-side)"
+    }
+    region = region or region_of_url(url)
+    riot_rate_limiter = get_riot_rate_limiter(region)
+    session = await open_http_session(region)
+    for attempt in range(1, max_attempts + 1):
+        await riot_rate_limiter.acquire(method)
+        started_at = time.monotonic()
+        try:
+            # the next with block automatically releases the response (and its connection back to the pool) after it's done with it
+            async with session.get(url) as response:
+                metrics.riot_request_seconds.observe(time.monotonic() - started_at, method=method)
+                metrics.riot_requests.inc(method=method, region=region, status=response.status)
+                riot_rate_limiter.update_from_headers(method, response.headers)
+                # you do not need to await response.status as it is just an integer, not a coroutine (unlike .json() for example)
+                if response.status == 429:
+                    retry_after = riot_rate_limiter.handle_429(method, response.headers)
+                    print_to_log("WARNING", f"Rate limited on {method} (attempt {attempt}/{max_attempts}), retrying after {retry_after}s")
+                    continue
+                if response.status == 404 and missing_ok:
+                    return {}
                 response_code = response_code_errors.get(response.status, f"{response.status}: Unknown Error Code")
-                print_to_log("WARNING",
-                             f"Request to Riot API failed with status code {response.status} {response_code}")
-                return None
-            else:
-                return await response.json()
+                if response.status >= 500:
+                    print_to_log("WARNING", f"Riot API returned {response.status} {response_code} on {method} (attempt {attempt}/{max_attempts})")
+                elif response.status != 200:
+                    print_to_log("WARNING",
+                                 f"Request to Riot API failed with status code {response.status} {response_code}")
+                    return None
+                else:
+                    return await response.json()
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+            metrics.riot_requests.inc(method=method, region=region, status="timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+            print_to_log("WARNING", f"Request to Riot API on {method} failed (attempt {attempt}/{max_attempts}): {e!r}")
+        except (aiohttp.ContentTypeError, json.JSONDecodeError) as e:
+            # a 200 that isn't JSON (like a proxy's HTML error page) gets retried like a 5xx
+            metrics.riot_requests.inc(method=method, region=region, status="error")
+            print_to_log("WARNING", f"Riot API returned a response that isn't JSON on {method} (attempt {attempt}/{max_attempts}): {e!r}")
+        if attempt < max_attempts:
+            await asyncio.sleep(backoff_delay(attempt))
+    print_to_log("WARNING", f"Gave up on {method} after {max_attempts} attempts")
+    return None
 
 
 # loading all the environment variables now
 load_dotenv()
 
 # groq
-async_groq_client = AsyncGroq(api_key=getenv('GROQ_API_KEY'))
+# the groq package takes about a third of a second to import, so it (and the client) only get loaded when the first
+# LLM request comes in instead of holding up startup
+async_groq_client = None
+
+
+def get_groq_client():
+    global async_groq_client
+    if async_groq_client is None:
+        from groq import AsyncGroq
+        # retries are handled by create_groq_completion, so the client's own retries are turned off
+        # (the client also reads GROQ_BASE_URL from the environment, which the offline benchmarks use to point it at a stand-in)
+        async_groq_client = AsyncGroq(api_key=getenv('GROQ_API_KEY'), max_retries=0)
+    return async_groq_client
+
+# when groq last told us to slow down, every groq call waits until this (time.monotonic()) before trying again
+groq_paused_until = 0.0
+
+
+async def create_groq_completion(all_prompts: list[dict[str, str]], stream: bool, max_attempts: int = 4):
+    """Creates a chat completion, retrying on 429s (honoring retry-after, and pausing every other groq call too),
+    5xx errors and connection problems with jittered backoff."""
+    global groq_paused_until
+    # already imported by get_groq_client, this just gets the exception types
+    client = get_groq_client()
+    import groq
+    for attempt in range(1, max_attempts + 1):
+        if (pause := groq_paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(pause)
+        started_at = time.monotonic()
+        try:
+            completion = await client.chat.completions.create(
+                model="openai/gpt-oss-120b",
+                messages=all_prompts,
+                # medium temperature for memes
+                temperature=0.5,
+                # the hidden "thinking" tokens also count, which is why this is so much higher
+                max_completion_tokens=8192,
+                top_p=1,
+                reasoning_effort="medium",
+                stream=stream,
+                stop=None
+            )
+            metrics.groq_request_seconds.observe(time.monotonic() - started_at, stream=stream, status="ok")
+            return completion
+        except groq.RateLimitError as e:
+            metrics.groq_request_seconds.observe(time.monotonic() - started_at, stream=stream, status="429")
+            if attempt == max_attempts:
+                raise
+            try:
+                retry_after = float(e.response.headers.get("retry-after", ""))
+            except ValueError:
+                retry_after = backoff_delay(attempt, base=1.0, cap=30.0)
+            groq_paused_until = max(groq_paused_until, time.monotonic() + retry_after)
+            print_to_log("WARNING", f"Groq rate limited us (attempt {attempt}/{max_attempts}), pausing for {retry_after:.1f}s")
+        except (groq.APIConnectionError, groq.InternalServerError) as e:
+            metrics.groq_request_seconds.observe(time.monotonic() - started_at, stream=stream, status="error")
+            if attempt == max_attempts:
+                raise
+            print_to_log("WARNING", f"Groq request failed (attempt {attempt}/{max_attempts}): {e!r}")
+            await asyncio.sleep(backoff_delay(attempt))
+
+
+def record_groq_usage(usage) -> None:
+    if usage is not None:
+        metrics.groq_tokens.inc(usage.prompt_tokens or 0, kind="prompt")
+        metrics.groq_tokens.inc(usage.completion_tokens or 0, kind="completion")
+
 
 async def get_groq_response(all_prompts: list[dict[str, str]]) -> str:
     try:
-        chat_completion = await async_groq_client.chat.completions.create(
-            model="openai/gpt-oss-120b",
-            messages=all_prompts,
-            # medium temperature for memes
-            temperature=0.5,
-            # the hidden "thinking" tokens also count, which is why this is so much higher
-            max_completion_tokens=8192,
-            top_p=1,
-            reasoning_effort="medium",
-            stream=None,
-            stop=None
-        )
+        chat_completion = await create_groq_completion(all_prompts, stream=False)
+        record_groq_usage(chat_completion.usage)
         response_text = chat_completion.choices[0].message.content
         return response_text
 
     except Exception as e:
         return f"Error: {e}"
 
+async def stream_groq_response(all_prompts: list[dict[str, str]]) -> AsyncIterator[str]:
+    """Same as get_groq_response, but yields the answer in pieces as it's generated. Errors are raised, not returned."""
+    stream = await create_groq_completion(all_prompts, stream=True)
+    async for chunk in stream:
+        # groq sends the token usage along with the last chunk
+        if (x_groq := getattr(chunk, "x_groq", None)) is not None and getattr(x_groq, "usage", None) is not None:
+            record_groq_usage(x_groq.usage)
+        # the hidden "thinking" comes through as delta.reasoning, only the actual answer is in delta.content
+        if chunk.choices and (content := chunk.choices[0].delta.content):
+            yield content
+
 # prompts for groq
 with open("prompts/prompt_1.txt", mode="r") as f:
     prompt_1 = f.read()
+# changes whenever the prompt does, so cached LLM responses from an older prompt aren't reused
+prompt_1_version = hashlib.sha256(prompt_1.encode()).hexdigest()[:12]
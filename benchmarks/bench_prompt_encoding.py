@@ -0,0 +1,114 @@
+"""Compares the old prompt format (the match dict pasted in as a Python repr) to the compact match table.
+
+Always reports prompt size (characters and estimated tokens). With --live it also sends both prompts to Groq
+a few times each and reports the real prompt token counts and end-to-end latency (needs GROQ_API_KEY).
+
+    python benchmarks/bench_prompt_encoding.py [--database jsons/bot.db] [--live] [--runs 3] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from match_encoding import encode_match, estimate_tokens  # noqa: E402
+
+ROLES = ["TOP", "JG", "MID", "BOT", "SUPP"]
+CHAMPIONS = ["Ahri", "Lee Sin", "Garen", "Jinx", "Thresh", "Darius", "Graves", "Syndra", "Kai'Sa", "Nautilus"]
+
+
+def sample_match(seed: int = 0) -> tuple[dict, str]:
+    """A made-up match in the same shape get_match_data returns, plus the name of the player to judge."""
+    rng = random.Random(seed)
+    duration = rng.randint(20 * 60, 40 * 60)
+    players = {}
+    for index in range(10):
+        team = "blue" if index < 5 else "red"
+        players[f"SomeLongSummonerName{index}#NA{index:02d}"] = {
+            "puuid": f"{rng.getrandbits(256):064x}{rng.getrandbits(64):014x}",
+            "team": team,
+            "result": "won" if team == "blue" else "lost",
+            "champion": CHAMPIONS[index],
+            "role": ROLES[index % 5],
+            "kills": rng.randint(0, 15), "deaths": rng.randint(0, 12), "assists": rng.randint(0, 20),
+            "level": rng.randint(11, 18), "gold": rng.randint(7000, 18000), "cs": rng.randint(20, 300),
+            "damage_dealt_to_champions": rng.randint(5000, 45000), "damage_dealt_to_epic_monsters": rng.randint(0, 30000),
+            "damage_dealt_to_structures": rng.randint(0, 12000), "damage_healed_and_shielded_to_allies": rng.randint(0, 15000),
+            "vision_score": rng.randint(5, 90),
+        }
+    return {"queue_type": "Ranked Solo/Duo", "duration": duration, "game_end_timestamp": None, "players": players}, list(players)[3]
+
+
+def matches_from_database(path: str, limit: int) -> list[tuple[dict, str]]:
+    connection = sqlite3.connect(path)
+    rows = connection.execute("SELECT data FROM matches LIMIT ?", (limit,)).fetchall()
+    connection.close()
+    return [(match_data, next(iter(match_data["players"]))) for match_data in (json.loads(row[0]) for row in rows)]
+
+
+def old_prompt(match_data: dict, player_name: str) -> list[dict[str, str]]:
+    return [{"role": "user", "content": f"Player Name: {player_name}."}, {"role": "user", "content": f"Match Data: {match_data}."}]
+
+
+def new_prompt(match_data: dict, player_name: str) -> list[dict[str, str]]:
+    return [{"role": "user", "content": f"Player Name: {player_name}."},
+            {"role": "user", "content": f"Match Data:\n{encode_match(match_data, player_name)}"}]
+
+
+def measure_size(prompt: list[dict[str, str]]) -> dict:
+    text = "".join(message["content"] for message in prompt)
+    return {"chars": len(text), "estimated_tokens": estimate_tokens(text)}
+
+
+async def measure_latency(system_prompt: str, prompt: list[dict[str, str]], runs: int) -> dict:
+    from groq import AsyncGroq
+    client = AsyncGroq(api_key=os.environ["GROQ_API_KEY"])
+    latencies, prompt_tokens = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completion = await client.chat.completions.create(
+            model="openai/gpt-oss-120b", messages=[{"role": "system", "content": system_prompt}] + prompt,
+            temperature=0.5, max_completion_tokens=8192, top_p=1, reasoning_effort="medium",
+        )
+        latencies.append(time.perf_counter() - start)
+        prompt_tokens.append(completion.usage.prompt_tokens)
+    return {"latency_p50_s": round(statistics.median(latencies), 3), "latency_max_s": round(max(latencies), 3),
+            "prompt_tokens": round(statistics.mean(prompt_tokens))}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", help="use real matches from this bot database instead of made-up ones")
+    parser.add_argument("--matches", type=int, default=10)
+    parser.add_argument("--live", action="store_true", help="also measure end-to-end Groq latency")
+    parser.add_argument("--runs", type=int, default=3, help="Groq calls per prompt format with --live")
+    parser.add_argument("--output", help="write the JSON results here as well as printing them")
+    args = parser.parse_args()
+
+    samples = matches_from_database(args.database, args.matches) if args.database else [sample_match(seed) for seed in range(args.matches)]
+    results = {"benchmark": "prompt_encoding", "matches": len(samples)}
+    for label, build in [("repr", old_prompt), ("encoded", new_prompt)]:
+        sizes = [measure_size(build(match_data, player_name)) for match_data, player_name in samples]
+        results[label] = {key: round(statistics.mean(size[key] for size in sizes), 1) for key in ["chars", "estimated_tokens"]}
+    results["size_reduction"] = round(1 - results["encoded"]["estimated_tokens"] / results["repr"]["estimated_tokens"], 3)
+
+    if args.live:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "prompts", "prompt_1.txt")) as f:
+            system_prompt = f.read()
+        match_data, player_name = samples[0]
+        for label, build in [("repr", old_prompt), ("encoded", new_prompt)]:
+            results[label].update(await measure_latency(system_prompt, build(match_data, player_name), args.runs))
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, mode="w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
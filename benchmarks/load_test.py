@@ -0,0 +1,251 @@
+"""Offline load test: runs the bot's polling loop, /investigate_player and replies to pings end to end against
+local stand-ins for Riot, Groq and Discord (see stand_ins.py), at one or more numbers of tracked players.
+
+Every scenario runs in its own process (the bot's modules are process-wide singletons) and in a throwaway working
+directory, so nothing touches the real database, caches or logs. Results are printed as JSON.
+
+    python benchmarks/load_test.py [--players 10,100,1000] [--ticks 3] [--throttle-rate 0.01] [--output results.json]
+
+With --ingestion spectator, the players start games that show up in spectator-v5 and end them between ticks instead,
+and the bot follows them the way INGESTION_MODE=spectator does (--publish-delay-ticks holds the ended games' matches
+back from match-v5 for that many ticks, to exercise the retries).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_ins import FakeDiscord, GroqStandIn, RiotStandIn, start_server  # noqa: E402
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Nearest-rank percentile, q between 0 and 100."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))], 4)
+
+
+def latency_summary(values: list[float]) -> dict:
+    return {"count": len(values), "p50_s": percentile(values, 50), "p99_s": percentile(values, 99),
+            "max_s": round(max(values), 4) if values else None}
+
+
+async def run_scenario(args: argparse.Namespace, player_count: int) -> dict:
+    tracemalloc.start()
+    riot = RiotStandIn(latency=args.riot_latency, throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed)
+    groq_stand_in = GroqStandIn(latency=args.groq_latency, chunk_interval=args.groq_chunk_interval)
+    riot_runner, riot_port = await start_server(riot.app())
+    groq_runner, groq_port = await start_server(groq_stand_in.app())
+
+    # the bot reads all of this when it's imported, and keeps its files relative to the working directory
+    working_directory = tempfile.mkdtemp(prefix="lol-kd-bot-load-test-")
+    shutil.copytree(os.path.join(REPO_DIRECTORY, "prompts"), os.path.join(working_directory, "prompts"))
+    os.makedirs(os.path.join(working_directory, "logs"))
+    os.makedirs(os.path.join(working_directory, "jsons"))
+    os.chdir(working_directory)
+    os.environ.update({
+        "RIOT_API_BASE_URL": f"http://127.0.0.1:{riot_port}/{{region}}", "GROQ_BASE_URL": f"http://127.0.0.1:{groq_port}",
+        "RIOT_API_KEY": "load-test", "GROQ_API_KEY": "load-test", "ROUTING_REGION": "americas", "RIOT_IDS": "",
+        "DATABASE_PATH": os.path.join(working_directory, "jsons", "bot.db"), "INGESTION_MODE": args.ingestion,
+        # ticks run back to back, so running games get checked and unpublished matches retried on every tick
+        "SPECTATOR_GAME_CHECK_INTERVAL": "0", "SPECTATOR_PUBLISH_RETRY_INTERVAL": "0",
+    })
+    sys.path.insert(0, REPO_DIRECTORY)
+    import discord_functionality as bot_module
+    import riot_functionality
+
+    # every Riot request the bot makes gets timed, throttling and retries included
+    request_latencies = []
+    untimed_get_http_response = riot_functionality.get_http_response
+
+    async def timed_get_http_response(*a, **kw):
+        start = time.perf_counter()
+        try:
+            return await untimed_get_http_response(*a, **kw)
+        finally:
+            request_latencies.append(time.perf_counter() - start)
+    riot_functionality.get_http_response = timed_get_http_response
+
+    # discord goes to the fake one
+    discord = FakeDiscord()
+    bot = bot_module.bot
+    bot._connection.user = discord.bot_user
+    bot.fetch_channel = discord.fetch_channel
+
+    async def process_commands(_message):
+        # there are no text commands
+        return
+    bot.process_commands = process_commands
+
+    # what setup_hook does, minus logging in and syncing commands
+    await bot_module.open_http_session(bot_module.routing_region)
+    await bot_module.repository.open()
+    await bot_module.state.load()
+    bot_module.llm_queue.start()
+
+    rng = random.Random(args.seed)
+    results = {"players": player_count}
+    channels = [discord.add_channel(1000 + index, f"channel-{index}") for index in range(args.channels)]
+    for channel in channels:
+        bot_module.state.add_channel(str(channel.id), channel.name)
+    riot_ids = [riot.add_player(index) for index in range(player_count)]
+
+    # ---------- adding players ----------
+    add_semaphore = asyncio.Semaphore(20)
+
+    async def add(index: int, riot_id: str):
+        async with add_semaphore:
+            await bot_module.add_player_to_file(riot_id, str(channels[index % len(channels)].id))
+    start = time.perf_counter()
+    await asyncio.gather(*(add(index, riot_id) for index, riot_id in enumerate(riot_ids)))
+    results["add_players_s"] = round(time.perf_counter() - start, 3)
+
+    # ---------- polling ----------
+    ticks = []
+    # the match IDs of the games that ended before each tick, until they get published
+    ended_batches = []
+    for _ in range(args.ticks):
+        if args.ingestion == "spectator":
+            ended_batches.append(set(riot.live_games))
+            games = riot.end_games(publish=False)
+            while len(ended_batches) > args.publish_delay_ticks:
+                riot.publish_matches(ended_batches.pop(0))
+            riot.start_games(args.play_fraction)
+            # every player who isn't in a game is due every tick, the match list fallback keeps its own (hourly) schedule
+            bot_module.spectator_schedulers.clear()
+        else:
+            games = riot.play_games(args.play_fraction)
+            # everyone is due every tick, which is the worst case for a tick
+            bot_module.poll_schedulers.clear()
+        requests_before, sends_before = sum(riot.requests.values()), discord.sends
+        start = time.perf_counter()
+        await bot_module.update_matches_loop()
+        ticks.append({"duration_s": round(time.perf_counter() - start, 3), "games_played": games,
+                      "riot_requests": sum(riot.requests.values()) - requests_before, "announcements": discord.sends - sends_before})
+    results["ticks"] = ticks
+    results["tick_duration"] = latency_summary([tick["duration_s"] for tick in ticks])
+
+    # ---------- /investigate_player ----------
+    tracked = [name for name, player in bot_module.state.get_players().items() if player["most_recent_match_id"]]
+    user = discord.bot_user.__class__(2, "load-tester")
+    investigate_latencies, first_text_latencies = [], []
+
+    async def investigate(player_name: str):
+        channel = rng.choice(channels)
+        reply = bot_module.reply_to_message(channel.post(user, f"/investigate_player {player_name}"))
+        start = time.perf_counter()
+        await bot_module.run_llm_job(bot_module.PRIORITY_COMMAND, reply, bot_module.investigate_player, player_name, reply, False)
+        investigate_latencies.append(time.perf_counter() - start)
+        if reply.time_to_first_text is not None:
+            first_text_latencies.append(reply.time_to_first_text)
+    await asyncio.gather(*(investigate(rng.choice(tracked)) for _ in range(args.investigations if tracked else 0)))
+    results["investigate_player"] = latency_summary(investigate_latencies)
+    results["investigate_player"]["first_text"] = latency_summary(first_text_latencies)
+
+    # ---------- pings: replies to KDA messages, then replies to the bot's answers ----------
+    kda_messages = [message for channel in channels for message in channel.messages.values()
+                    if message.author is discord.bot_user and "KDA:" in message.content]
+    mention_latencies, follow_ups = [], []
+
+    async def ping(parent, question: str):
+        message = parent.channel.post(user, f"<@{discord.bot_user.id}> {question}", reference=parent, mentions=[discord.bot_user])
+        start = time.perf_counter()
+        await bot_module.on_message(message)
+        mention_latencies.append(time.perf_counter() - start)
+        return message
+
+    fetches_before = discord.fetches
+    first_pings = await asyncio.gather(*(ping(rng.choice(kda_messages), "winning league?")
+                                         for _ in range(args.mentions if kda_messages else 0)))
+    for question in first_pings:
+        answers = [message for message in question.channel.messages.values()
+                   if message.reference is not None and message.reference.message_id == question.id]
+        if answers:
+            follow_ups.append(answers[-1])
+    await asyncio.gather(*(ping(answer, "why though?") for answer in follow_ups))
+    results["on_message"] = latency_summary(mention_latencies)
+    results["on_message"]["message_fetches"] = discord.fetches - fetches_before
+
+    # ---------- totals ----------
+    results["riot_requests"] = dict(riot.requests)
+    results["riot_request_latency"] = latency_summary(request_latencies)
+    results["riot_429s_injected"] = riot.throttled
+    results["riot_429s_seen"] = sum(limiter.throttle_count for limiter in bot_module.riot_rate_limiters.values())
+    results["groq_requests"] = groq_stand_in.requests
+    results["llm_cache"] = {"hits": bot_module.llm_response_cache.hits, "misses": bot_module.llm_response_cache.misses}
+    results["discord"] = {"sends": discord.sends, "edits": discord.edits, "fetches": discord.fetches}
+    results["state"] = bot_module.state.storage_report()
+    current, peak = tracemalloc.get_traced_memory()
+    results["memory"] = {"traced_current_mb": round(current / 2 ** 20, 2), "traced_peak_mb": round(peak / 2 ** 20, 2),
+                         # kilobytes on linux
+                         "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)}
+
+    await bot_module.llm_queue.stop()
+    await bot_module.state.flush()
+    await bot_module.repository.close()
+    await bot_module.close_http_sessions()
+    await bot_module.get_groq_client().close()
+    await riot_runner.cleanup()
+    await groq_runner.cleanup()
+    os.chdir(REPO_DIRECTORY)
+    shutil.rmtree(working_directory, ignore_errors=True)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", default="10,100,1000", help="comma separated numbers of tracked players, one scenario each")
+    parser.add_argument("--channels", type=int, default=3)
+    parser.add_argument("--ticks", type=int, default=3, help="polling ticks per scenario")
+    parser.add_argument("--play-fraction", type=float, default=0.3, help="fraction of players who finish a game before each tick")
+    parser.add_argument("--ingestion", choices=["match_list", "spectator"], default="match_list", help="the INGESTION_MODE to run the bot with")
+    parser.add_argument("--publish-delay-ticks", type=int, default=1, help="spectator only: ticks until an ended game's match is published")
+    parser.add_argument("--investigations", type=int, default=10)
+    parser.add_argument("--mentions", type=int, default=10)
+    parser.add_argument("--riot-latency", type=float, default=0.03, help="seconds")
+    parser.add_argument("--throttle-rate", type=float, default=0.01, help="fraction of Riot requests answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="seconds, sent with every injected 429")
+    parser.add_argument("--groq-latency", type=float, default=0.3, help="seconds until Groq starts answering")
+    parser.add_argument("--groq-chunk-interval", type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here as well as printing them")
+    # used internally to run a single scenario in a child process
+    parser.add_argument("--scenario", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--scenario-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        results = asyncio.run(run_scenario(args, args.scenario))
+        with open(args.scenario_output, mode="w") as f:
+            json.dump(results, f)
+        return
+
+    config = {key: value for key, value in vars(args).items() if key not in ["output", "scenario", "scenario_output"]}
+    results = {"benchmark": "load_test", "config": config, "scenarios": []}
+    for player_count in [int(count) for count in args.players.split(",")]:
+        with tempfile.NamedTemporaryFile(suffix=".json") as scenario_output:
+            # the bot prints to stdout here and there, so results come back through a file
+            subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--scenario", str(player_count),
+                            "--scenario-output", scenario_output.name], check=True, stdout=subprocess.DEVNULL)
+            with open(scenario_output.name) as f:
+                results["scenarios"].append(json.load(f))
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, mode="w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
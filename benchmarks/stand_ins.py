@@ -0,0 +1,377 @@
+"""Local stand-ins for the services the bot talks to, used by the offline benchmarks.
+
+- RiotStandIn serves account-v1, match-v5 (ids, match, timeline) and spectator-v5 out of a made-up world of players,
+  with configurable latency, randomly injected 429s and Riot's rate limit headers
+- GroqStandIn is a chat-completions endpoint that answers (streamed or not) after a configurable delay
+- FakeDiscord and friends replace discord channels and messages with an in-memory sink
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+ROLES = ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY"]
+CHAMPIONS = ["Ahri", "LeeSin", "Garen", "Jinx", "Thresh", "Darius", "Graves", "Syndra", "Kaisa", "Nautilus",
+             "Ezreal", "Lux", "Yasuo", "Leona", "Vi", "Orianna", "Sett", "Caitlyn", "Morgana", "Kayn"]
+
+
+async def start_server(app: web.Application) -> tuple[web.AppRunner, int]:
+    """Starts an app on a free local port and returns its runner and the port."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+class RiotStandIn:
+    """A fake Riot API. Its routes look like /{region}/<real Riot path>, so the bot's RIOT_API_BASE_URL
+    should be http://127.0.0.1:<port>/{region}."""
+
+    def __init__(self, latency: float = 0.03, jitter: float = 0.01, throttle_rate: float = 0.0, retry_after: float = 1.0,
+                 app_limits: str = "500:10,30000:600", method_limits: str = "2000:10", seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.app_limits = app_limits
+        self.method_limits = method_limits
+        self.rng = random.Random(seed)
+        # puuid -> (game name, tag line)
+        self.accounts: dict[str, tuple[str, str]] = {}
+        self.puuids_by_riot_id: dict[str, str] = {}
+        # puuid -> [(game start in unix ms, match ID)], newest first
+        self.histories: dict[str, list[tuple[int, str]]] = {}
+        # match ID -> the raw match payload
+        self.matches: dict[str, dict] = {}
+        # games being played right now, and the ones that are over but not published to match-v5 yet
+        # match ID -> (the raw match payload, the tracked players in it)
+        self.live_games: dict[str, tuple[dict, list[str]]] = {}
+        self.unpublished: dict[str, tuple[dict, list[str]]] = {}
+        # puuid -> the match ID of the live game they're in
+        self.live_game_of: dict[str, str] = {}
+        self.match_ids = itertools.count(1)
+        # the world's clock, in unix ms -- every round of games moves it forward by about one game
+        self.clock = 1_700_000_000_000
+        self.requests: Counter[str] = Counter()
+        self.throttled = 0
+        self.recent_requests: deque[float] = deque()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.get("/{region}/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}", self.by_riot_id),
+            web.get("/{region}/riot/account/v1/accounts/by-puuid/{puuid}", self.by_puuid),
+            web.get("/{region}/lol/match/v5/matches/by-puuid/{puuid}/ids", self.match_ids_by_puuid),
+            web.get("/{region}/lol/match/v5/matches/{match_id}", self.match),
+            web.get("/{region}/lol/match/v5/matches/{match_id}/timeline", self.timeline),
+            web.get("/{region}/lol/spectator/v5/active-games/by-summoner/{puuid}", self.active_game),
+        ])
+        return app
+
+    # ---------- the world ----------
+
+    def add_player(self, index: int) -> str:
+        """Creates a tracked account and returns its Riot ID."""
+        puuid = f"{self.rng.getrandbits(256):064x}"
+        game_name, tag_line = f"Player{index}", "BNCH"
+        self.accounts[puuid] = (game_name, tag_line)
+        self.puuids_by_riot_id[f"{game_name}#{tag_line}".casefold()] = puuid
+        self.histories[puuid] = []
+        return f"{game_name}#{tag_line}"
+
+    def play_games(self, fraction: float, max_party: int = 3) -> int:
+        """A random fraction of the players each play one more game, some of them together. Returns how many games were played."""
+        puuids = [puuid for puuid in self.histories if self.rng.random() < fraction]
+        self.rng.shuffle(puuids)
+        games = 0
+        while puuids:
+            party = [puuids.pop() for _ in range(min(len(puuids), self.rng.randint(1, max_party)))]
+            self._create_match(party)
+            games += 1
+        # the next round of games starts after this one's have ended
+        self.clock += 45 * 60 * 1000
+        return games
+
+    def start_games(self, fraction: float, max_party: int = 3) -> int:
+        """A random fraction of the players who aren't in a game start one, some of them together. The games show up
+        in spectator-v5 until end_games is called. Returns how many games were started."""
+        puuids = [puuid for puuid in self.histories if puuid not in self.live_game_of and self.rng.random() < fraction]
+        self.rng.shuffle(puuids)
+        games = 0
+        while puuids:
+            party = [puuids.pop() for _ in range(min(len(puuids), self.rng.randint(1, max_party)))]
+            match_id, match = self._new_match(party)
+            self.live_games[match_id] = (match, party)
+            for puuid in party:
+                self.live_game_of[puuid] = match_id
+            games += 1
+        return games
+
+    def end_games(self, publish: bool = True) -> int:
+        """Ends every live game. Their matches get published to match-v5 right away, or with publish=False only once
+        publish_matches is called, like the real delay between a game ending and match-v5 having it."""
+        ended = len(self.live_games)
+        self.unpublished.update(self.live_games)
+        self.live_games.clear()
+        self.live_game_of.clear()
+        self.clock += 45 * 60 * 1000
+        if publish:
+            self.publish_matches()
+        return ended
+
+    def publish_matches(self, match_ids=None) -> None:
+        """Publishes the given ended games' matches (all of them by default) to match-v5."""
+        for match_id in list(self.unpublished if match_ids is None else match_ids):
+            if match_id in self.unpublished:
+                self._publish(match_id, *self.unpublished.pop(match_id))
+
+    def _create_match(self, party: list[str]) -> None:
+        self._publish(*self._new_match(party), party)
+
+    def _new_match(self, party: list[str]) -> tuple[str, dict]:
+        match_id = f"NA1_{next(self.match_ids)}"
+        duration = self.rng.randint(20 * 60, 40 * 60)
+        start = self.clock + self.rng.randint(0, 5 * 60 * 1000)
+        fillers = [f"filler-{match_id}-{index}" for index in range(10 - len(party))]
+        participants = []
+        for index, puuid in enumerate(party + fillers):
+            game_name, tag_line = self.accounts.get(puuid, (f"Filler{index}", "BOT"))
+            participants.append(self._participant(index, puuid, game_name, tag_line))
+        return match_id, {"metadata": {"matchId": match_id}, "info": {
+            "queueId": 420, "gameDuration": duration, "gameStartTimestamp": start, "gameEndTimestamp": start + duration * 1000,
+            "participants": participants}}
+
+    def _publish(self, match_id: str, match: dict, party: list[str]) -> None:
+        self.matches[match_id] = match
+        for puuid in party:
+            self.histories[puuid].insert(0, (match["info"]["gameStartTimestamp"], match_id))
+
+    def _participant(self, index: int, puuid: str, game_name: str, tag_line: str) -> dict:
+        rng = self.rng
+        return {
+            "participantId": index + 1, "puuid": puuid, "riotIdGameName": game_name, "riotIdTagline": tag_line,
+            "teamId": 100 if index < 5 else 200, "win": index < 5, "gameEndedInEarlySurrender": False,
+            "championName": rng.choice(CHAMPIONS), "championTransform": 0, "teamPosition": ROLES[index % 5],
+            "kills": rng.randint(0, 15), "deaths": rng.randint(0, 12), "assists": rng.randint(0, 20),
+            "champLevel": rng.randint(11, 18), "goldEarned": rng.randint(7000, 18000),
+            "totalMinionsKilled": rng.randint(10, 250), "neutralMinionsKilled": rng.randint(0, 150), "wardsKilled": rng.randint(0, 10),
+            "totalDamageDealtToChampions": rng.randint(5000, 45000), "damageDealtToObjectives": rng.randint(2000, 40000),
+            "damageDealtToBuildings": rng.randint(0, 2000), "totalDamageShieldedOnTeammates": rng.randint(0, 8000),
+            "totalHealsOnTeammates": rng.randint(0, 8000), "visionScore": rng.randint(5, 90),
+        }
+
+    def _timeline(self, match: dict) -> dict:
+        rng = random.Random(match["metadata"]["matchId"])
+        participants = match["info"]["participants"]
+        frames = []
+        for minute in range(match["info"]["gameDuration"] // 60 + 1):
+            frames.append({"participantFrames": {str(p["participantId"]): {
+                "position": {"x": rng.randint(0, 14000), "y": rng.randint(0, 14000)},
+                "totalGold": 500 + minute * rng.randint(250, 450), "xp": minute * rng.randint(300, 500),
+            } for p in participants}})
+        return {"metadata": {"matchId": match["metadata"]["matchId"]},
+                "info": {"participants": [{"participantId": p["participantId"], "puuid": p["puuid"]} for p in participants],
+                         "frames": frames}}
+
+    # ---------- requests ----------
+
+    def _rate_limit_headers(self) -> dict[str, str]:
+        now = time.monotonic()
+        self.recent_requests.append(now)
+        while self.recent_requests and self.recent_requests[0] < now - 10:
+            self.recent_requests.popleft()
+        return {"X-App-Rate-Limit": self.app_limits, "X-Method-Rate-Limit": self.method_limits,
+                "X-App-Rate-Limit-Count": f"{len(self.recent_requests)}:10"}
+
+    async def _respond(self, endpoint: str, body) -> web.Response:
+        self.requests[endpoint] += 1
+        await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+        headers = self._rate_limit_headers()
+        if self.rng.random() < self.throttle_rate:
+            self.throttled += 1
+            return web.json_response({"status": {"message": "Rate limit exceeded", "status_code": 429}}, status=429,
+                                     headers={**headers, "Retry-After": str(self.retry_after), "X-Rate-Limit-Type": "method"})
+        if body is None:
+            return web.json_response({"status": {"message": "Data not found", "status_code": 404}}, status=404, headers=headers)
+        return web.Response(text=json.dumps(body), content_type="application/json", headers=headers)
+
+    async def by_riot_id(self, request: web.Request) -> web.Response:
+        puuid = self.puuids_by_riot_id.get(f"{request.match_info['game_name']}#{request.match_info['tag_line']}".casefold())
+        body = None if puuid is None else {"puuid": puuid, "gameName": self.accounts[puuid][0], "tagLine": self.accounts[puuid][1]}
+        return await self._respond("account-v1.by-riot-id", body)
+
+    async def by_puuid(self, request: web.Request) -> web.Response:
+        puuid = request.match_info["puuid"]
+        body = None if puuid not in self.accounts else {"puuid": puuid, "gameName": self.accounts[puuid][0], "tagLine": self.accounts[puuid][1]}
+        return await self._respond("account-v1.by-puuid", body)
+
+    async def match_ids_by_puuid(self, request: web.Request) -> web.Response:
+        history = self.histories.get(request.match_info["puuid"])
+        if history is None:
+            return await self._respond("match-v5.ids-by-puuid", None)
+        start_time_ms = int(request.query.get("startTime", 0)) * 1000
+        start, count = int(request.query.get("start", 0)), int(request.query.get("count", 20))
+        match_ids = [match_id for game_start, match_id in history if game_start >= start_time_ms]
+        return await self._respond("match-v5.ids-by-puuid", match_ids[start:start + count])
+
+    async def match(self, request: web.Request) -> web.Response:
+        return await self._respond("match-v5.match", self.matches.get(request.match_info["match_id"]))
+
+    async def timeline(self, request: web.Request) -> web.Response:
+        match = self.matches.get(request.match_info["match_id"])
+        return await self._respond("match-v5.timeline", None if match is None else self._timeline(match))
+
+    async def active_game(self, request: web.Request) -> web.Response:
+        match_id = self.live_game_of.get(request.match_info["puuid"])
+        if match_id is None:
+            return await self._respond("spectator-v5.active-games", None)
+        info = self.live_games[match_id][0]["info"]
+        platform_id, game_id = match_id.split("_")
+        return await self._respond("spectator-v5.active-games", {
+            "gameId": int(game_id), "platformId": platform_id, "gameQueueConfigId": info["queueId"], "gameMode": "CLASSIC",
+            "gameStartTime": info["gameStartTimestamp"], "gameLength": 0,
+            "participants": [{"puuid": p["puuid"], "teamId": p["teamId"], "riotId": f"{p['riotIdGameName']}#{p['riotIdTagline']}"}
+                             for p in info["participants"]]})
+
+
+class GroqStandIn:
+    """A fake chat-completions endpoint at /openai/v1/chat/completions, so the bot's GROQ_BASE_URL should be
+    http://127.0.0.1:<port>. It waits `latency` seconds before answering and, when streaming, `chunk_interval`
+    seconds between chunks."""
+
+    ANSWER = ("Looking at the numbers, this player was winning league: solid kill participation, above average damage "
+              "per minute and a lead over their lane opponent for most of the game. Verdict: WINNING LEAGUE.")
+
+    def __init__(self, latency: float = 0.3, chunk_interval: float = 0.02, words_per_chunk: int = 3):
+        self.latency = latency
+        self.chunk_interval = chunk_interval
+        self.words_per_chunk = words_per_chunk
+        self.requests = 0
+        self.prompt_chars = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([web.post("/openai/v1/chat/completions", self.chat_completions)])
+        return app
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        prompt_chars = sum(len(message["content"]) for message in body["messages"])
+        self.prompt_chars += prompt_chars
+        await asyncio.sleep(self.latency)
+        base = {"id": f"chatcmpl-{self.requests}", "created": int(time.time()), "model": body["model"]}
+        if not body.get("stream"):
+            return web.json_response({**base, "object": "chat.completion", "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": self.ANSWER}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(self.ANSWER) // 4,
+                          "total_tokens": (prompt_chars + len(self.ANSWER)) // 4}})
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        words = self.ANSWER.split(" ")
+        for start in range(0, len(words), self.words_per_chunk):
+            text = " ".join(words[start:start + self.words_per_chunk]) + " "
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(self.chunk_interval)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str, bot: bool = False):
+        self.id = user_id
+        self.name = name
+        self.bot = bot
+
+    def mentioned_in(self, message) -> bool:
+        return self in message.mentions
+
+
+class FakeReference:
+    def __init__(self, message):
+        self.message_id = message.id
+        # the same thing discord sends along with a reply
+        self.resolved = message
+        self.cached_message = message
+
+
+class FakeMessage:
+    def __init__(self, discord: "FakeDiscord", channel: "FakeChannel", author: FakeUser, content: str, reference=None, mentions=()):
+        self.id = next(discord.message_ids)
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.reference = FakeReference(reference) if reference is not None else None
+        self.mentions = list(mentions)
+        self.mention_everyone = False
+        self.discord = discord
+
+    async def edit(self, content: str | None = None):
+        self.discord.edits += 1
+        if content is not None:
+            self.content = content
+        return self
+
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeChannel:
+    def __init__(self, discord: "FakeDiscord", channel_id: int, name: str):
+        self.discord = discord
+        self.id = channel_id
+        self.name = name
+        self.messages: dict[int, FakeMessage] = {}
+
+    async def send(self, content: str, reference=None) -> FakeMessage:
+        self.discord.sends += 1
+        message = FakeMessage(self.discord, self, self.discord.bot_user, content, reference)
+        self.messages[message.id] = message
+        return message
+
+    def post(self, author: FakeUser, content: str, reference=None, mentions=()) -> FakeMessage:
+        """A message from a user, as on_message would get it."""
+        message = FakeMessage(self.discord, self, author, content, reference, mentions)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        self.discord.fetches += 1
+        return self.messages[message_id]
+
+    def typing(self) -> FakeTyping:
+        return FakeTyping()
+
+
+class FakeDiscord:
+    """Channels and messages kept in memory, counting every send, edit and fetch."""
+
+    def __init__(self):
+        self.message_ids = itertools.count(10 ** 17)
+        self.bot_user = FakeUser(1, "lol-kd-bot", bot=True)
+        self.channels: dict[int, FakeChannel] = {}
+        self.sends = 0
+        self.edits = 0
+        self.fetches = 0
+
+    def add_channel(self, channel_id: int, name: str) -> FakeChannel:
+        self.channels[channel_id] = FakeChannel(self, channel_id, name)
+        return self.channels[channel_id]
+
+    async def fetch_channel(self, channel_id: int) -> FakeChannel:
+        self.fetches += 1
+        return self.channels[channel_id]
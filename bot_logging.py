@@ -0,0 +1,132 @@
+from dotenv import load_dotenv
+from os import getenv
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+
+# the env has to be loaded before the settings below are read, and this module gets imported before anything else
+load_dotenv()
+# "text" for the discord.py style lines, "json" for one JSON object per line
+log_format = getenv('LOG_FORMAT', 'text')
+# each log file rotates once it reaches LOG_MAX_BYTES, and the last LOG_BACKUP_COUNT rotated files are kept
+log_max_bytes = int(getenv('LOG_MAX_BYTES', str(10 * 2 ** 20)))
+log_backup_count = int(getenv('LOG_BACKUP_COUNT', '5'))
+# the bot's own messages below this level are dropped before anything gets formatted
+log_level = getenv('LOG_LEVEL', 'DEBUG')
+# put in front of the log file names, so every process (the bot, each poller) writes its own files
+log_file_prefix = getenv('LOG_FILE_PREFIX', '')
+
+LOG_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL
+}
+
+
+class TextFormatter(logging.Formatter):
+    """discord.py's log format, with the function that called print_to_log in front of the message"""
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        if (caller := getattr(record, "caller", None)) is not None:
+            record = copy.copy(record)
+            record.message = f"{caller} -- {record.message}"
+        return super().formatMessage(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, so the logs can be fed straight into whatever's reading them"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "caller": getattr(record, "caller", record.funcName),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Puts records on the queue with their message arguments merged in, and leaves all the actual formatting
+    (timestamps, tracebacks, JSON) to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def rotating_file_handler(filename: str, level: int) -> RotatingFileHandler:
+    handler = RotatingFileHandler(filename=filename, encoding='utf-8', maxBytes=log_max_bytes, backupCount=log_backup_count)
+    # every run starts with a fresh file, like it did back when the files were opened with mode='w',
+    # but the previous runs' logs get kept around as backups instead of being thrown away
+    if os.path.getsize(filename) > 0:
+        handler.doRollover()
+    handler.setLevel(level)
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter(datefmt='%Y-%m-%dT%H:%M:%S%z'))
+    else:
+        handler.setFormatter(TextFormatter(' [%(asctime)s] [%(levelname)-8s] %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    return handler
+
+
+# the idea is to have 2 different log files -- one with every single logging message from discord.py
+# and one with only "higher level" log stuff which is easier to read
+full_info_handler = rotating_file_handler(f'logs/{log_file_prefix}full_info.log', logging.DEBUG)
+important_stuff_handler = rotating_file_handler(f'logs/{log_file_prefix}important_stuff.log', logging.INFO)
+# discord.py's records go through the same queue, but only into full_info.log
+important_stuff_handler.addFilter(logging.Filter('bot'))
+
+# logging calls only put the record on this queue, the listener thread does the formatting and file writes,
+# so the event loop never waits on the disk
+log_queue = queue.SimpleQueue()
+queue_handler = DeferredQueueHandler(log_queue)
+log_listener = QueueListener(log_queue, full_info_handler, important_stuff_handler, respect_handler_level=True)
+log_listener.start()
+log_listener_running = True
+
+
+def stop_log_listener() -> None:
+    """Writes out whatever is still on the queue and stops the listener thread, safe to call more than once"""
+    global log_listener_running
+    if log_listener_running:
+        log_listener_running = False
+        log_listener.stop()
+
+
+atexit.register(stop_log_listener)
+
+logger = logging.getLogger('bot')
+logger.setLevel(LOG_LEVELS[log_level])
+logger.addHandler(queue_handler)
+
+
+def route_discord_logger(level: int = logging.DEBUG) -> None:
+    """Sends discord.py's log messages through the same queue, which is what bot.run(log_handler=...) used to do
+    with full_info_handler directly"""
+    discord_logger = logging.getLogger('discord')
+    discord_logger.setLevel(level)
+    discord_logger.addHandler(queue_handler)
+
+
+def print_to_log(type_of_message: str, message: str) -> None:
+    """Prints a message to the log file with the specified type (e.g., INFO, WARNING, DEBUG))."""
+    level_int = LOG_LEVELS.get(type_of_message)
+    if level_int is None:
+        print_to_log("ERROR", f"Invalid log type: {type_of_message}")
+        level_int = logging.INFO
+    if not logger.isEnabledFor(level_int):
+        return
+    # just the caller's frame, instead of inspect.stack() building the whole stack with source lines every call
+    logger.log(level_int, message, extra={"caller": sys._getframe(1).f_code.co_name})
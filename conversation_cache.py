@@ -0,0 +1,49 @@
+from collections import OrderedDict
+from match_encoding import estimate_tokens
+
+
+class ConversationCache:
+    """In-memory index of the messages that make up reply chains, keyed by message ID, so rebuilding the context for
+    the LLM is a few dict lookups instead of a fetch_message per hop.
+
+    Each entry is a turn: {"role": "user" | "assistant" | "kda", "content": ..., "parent_id": ID of the message it
+    replies to (or None), "kda": (player name, match ID) for automated KDA messages, otherwise None}.
+    The least recently used entries are evicted past max_entries."""
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self.turns: OrderedDict[int, dict] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, message_id: int) -> dict | None:
+        turn = self.turns.get(message_id)
+        if turn is None:
+            self.misses += 1
+            return None
+        self.turns.move_to_end(message_id)
+        self.hits += 1
+        return turn
+
+    def put(self, message_id: int, role: str, content: str, parent_id: int | None = None,
+            kda: tuple[str, str | None] | None = None) -> dict:
+        turn = {"role": role, "content": content, "parent_id": parent_id, "kda": kda}
+        self.turns[message_id] = turn
+        self.turns.move_to_end(message_id)
+        while len(self.turns) > self.max_entries:
+            self.turns.popitem(last=False)
+        return turn
+
+    def forget(self, message_id: int) -> None:
+        self.turns.pop(message_id, None)
+
+
+def fit_to_token_budget(conversation: list[dict[str, str]], token_budget: int, keep_first: bool = False) -> list[dict[str, str]]:
+    """Drops the oldest messages until the conversation fits in token_budget (estimated) tokens.
+    The newest message always stays, and so does the first one if keep_first (the match data a chain started from)."""
+    conversation = list(conversation)
+    first = 1 if keep_first else 0
+    total = sum(estimate_tokens(message["content"]) for message in conversation)
+    while total > token_budget and len(conversation) - first > 1:
+        total -= estimate_tokens(conversation.pop(first)["content"])
+    return conversation
@@ -2,6 +2,20 @@ import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 from riot_functionality import *
+from storage import repository
+from state import state_flush_interval, message_retention_days, orphaned_match_grace_hours, stats_window_days
+from player_stats import LEADERBOARD_METRICS, game_record
+from llm_cache import LlmResponseCache, is_reroll
+from match_encoding import MATCH_ENCODING_VERSION, encode_match
+from performance_score import PERFORMANCE_SCORE_VERSION, performance_hint
+from streaming_reply import StreamingReply
+from llm_queue import LlmWorkQueue, PRIORITY_COMMAND, PRIORITY_MENTION
+from conversation_cache import ConversationCache, fit_to_token_budget
+from poller_hub import PollerHub
+import asyncio
+import hashlib
+import json
+import time
 from datetime import datetime, timezone, timedelta
 
 intents = discord.Intents.default()
@@ -9,13 +23,126 @@ intents.message_content = True
 intents.guilds = True
 intents.members = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+
+class LolKdBot(commands.Bot):
+    async def close(self):
+        # runs on shutdown, before discord.py closes its own connections
+        await llm_queue.stop()
+        if poller_hub is not None:
+            await poller_hub.stop()
+        await close_http_sessions()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        # write out anything that hasn't been flushed yet before the database closes
+        flush_state_loop.cancel()
+        await state.flush()
+        await repository.close()
+        await super().close()
+
+
+bot = LolKdBot(command_prefix='!', intents=intents)
+# LLM verdicts, so asking the same thing about the same game again is instant
+# the cached responses depend on the prompt, how the match data is encoded and the score hint that goes with it
+llm_prompt_version = f"{prompt_1_version}.{MATCH_ENCODING_VERSION}.{PERFORMANCE_SCORE_VERSION}"
+# with INVESTIGATE_WITH_LLM=0, /investigate_player answers straight from the local performance score
+investigate_with_llm = getenv('INVESTIGATE_WITH_LLM', '1') == '1'
+# the most (estimated) tokens the match table in a prompt may take up
+llm_match_token_budget = int(getenv('LLM_MATCH_TOKEN_BUDGET', '700'))
+# whether LLM answers get streamed into the reply as they're generated, and how often (in seconds) the reply gets edited
+llm_streaming = getenv('LLM_STREAMING', '1') == '1'
+llm_stream_edit_interval = float(getenv('LLM_STREAM_EDIT_INTERVAL', '1.0'))
+# every LLM call goes through this queue, so there are never more than LLM_WORKERS groq requests going at once
+llm_queue = LlmWorkQueue(workers=int(getenv('LLM_WORKERS', '2')), max_size=int(getenv('LLM_QUEUE_SIZE', '20')))
+llm_response_cache = LlmResponseCache("jsons/llm_responses.json", ttl_seconds=float(getenv('LLM_CACHE_TTL_SECONDS', '604800')))
+# the reply chains the bot has seen, so building the context for a ping doesn't need a fetch_message per hop
+conversation_cache = ConversationCache(max_entries=int(getenv('CONVERSATION_CACHE_SIZE', '5000')))
+# how far back a reply chain gets followed, and the most (estimated) tokens of it that get sent to the LLM
+conversation_max_depth = int(getenv('CONVERSATION_MAX_DEPTH', '25'))
+conversation_token_budget = int(getenv('CONVERSATION_TOKEN_BUDGET', '6000'))
+# how many channels get sent KDA messages at the same time (discord.py waits out discord's rate limits on its own)
+announcement_concurrency = int(getenv('ANNOUNCEMENT_CONCURRENCY', '5'))
+# the channel objects KDA messages get sent to, so announcing doesn't cost a fetch_channel every time
+announcement_channels: dict[int, discord.abc.Messageable] = {}
+# with POLLER_PROCESSES above 0, separate processes do the polling and this one only announces and handles discord
+poller_processes = int(getenv('POLLER_PROCESSES', '0'))
+poller_hub: PollerHub | None = None
+# prometheus metrics get served at http://METRICS_HOST:METRICS_PORT/metrics, a port of 0 turns that off
+metrics_host = getenv('METRICS_HOST', '127.0.0.1')
+metrics_port = int(getenv('METRICS_PORT', '9108'))
+metrics_runner = None
+# the caches' hit rates are read whenever the metrics get rendered
+caches_with_hit_rates = {"llm_response": llm_response_cache, "conversation": conversation_cache,
+                         "identity": identity_cache, "timeline": timeline_cache}
+metrics.registry.gauge("lolkd_cache_hits", "Cache hits since startup", lambda: {(name,): cache.hits for name, cache in caches_with_hit_rates.items()}, ("cache",))
+metrics.registry.gauge("lolkd_cache_misses", "Cache misses since startup", lambda: {(name,): cache.misses for name, cache in caches_with_hit_rates.items()}, ("cache",))
+metrics.registry.gauge("lolkd_coalesced_fetches", "Duplicate Riot fetches saved by single flight", single_flight.coalesced_total)
+metrics.registry.gauge("lolkd_tracked_players", "Players being tracked", lambda: len(state.get_players()))
+metrics.registry.gauge("lolkd_llm_queue_depth", "LLM jobs waiting for a worker", lambda: llm_queue.queue.qsize())
+metrics.registry.gauge("lolkd_active_games", "Games with tracked players in them being followed (spectator mode)", lambda: len(active_games))
+# slash commands only get synced with discord when they changed since the last sync, unless FORCE_COMMAND_SYNC=1
+force_command_sync = getenv('FORCE_COMMAND_SYNC', '0') == '1'
+# phase -> seconds, logged once the bot is ready
+startup_timings: dict[str, float] = {}
 # I want to be able to run the bot in a "testing" mode where it doesn't execute the update matches loop
 bot.is_testing = False
+# when the process started (time.perf_counter()), main() sets it to before the imports
+bot.started_at = time.perf_counter()
 
 
 @bot.event
 async def setup_hook():
+    global metrics_runner, poller_hub
+    # opened here so that it lives (and keeps its connections alive) for as long as the bot does
+    await timed_startup_phase("database", open_database())
+    # everything gets served from memory from here on out, and the caches the first tick needs are loaded alongside it
+    await timed_startup_phase("state and caches", asyncio.gather(state.load(), identity_cache.ensure_loaded(), llm_response_cache.ensure_loaded()))
+    # every region someone's tracked in gets its session now, instead of during the first tick
+    regions = {routing_region} | {routing_region_for(player.get("platform")) for player in state.get_players().values()}
+    await timed_startup_phase("http sessions", asyncio.gather(*(open_http_session(region) for region in regions)))
+    flush_state_loop.start()
+    llm_queue.start()
+    if poller_processes > 0:
+        poller_hub = PollerHub(poller_processes, on_new_matches)
+        await poller_hub.start()
+    if metrics_port:
+        try:
+            metrics_runner = await metrics.registry.serve(metrics_host, metrics_port)
+            print_to_log("INFO", f"Serving metrics at http://{metrics_host}:{metrics_port}/metrics")
+        except OSError as e:
+            print_to_log("ERROR", f"Failed to start the metrics server: {e}")
+    await timed_startup_phase("command sync", sync_commands_if_changed())
+
+
+async def open_database() -> None:
+    await repository.open()
+    # only does anything the first time the bot starts up with a database
+    await repository.migrate_from_json()
+
+
+async def timed_startup_phase(phase: str, awaitable):
+    started_at = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        startup_timings[phase] = time.perf_counter() - started_at
+
+
+def command_tree_hash() -> str:
+    """A hash of every slash command's definition (names, descriptions, options, choices...) as discord would get it,
+    so a restart can tell whether anything about the commands changed"""
+    commands = sorted((command.to_dict(bot.tree) for command in bot.tree.get_commands()), key=lambda command: command["name"])
+    # a different application (e.g. a test bot's token) needs its own sync
+    definition = json.dumps({"application_id": bot.application_id, "commands": commands}, sort_keys=True, default=str)
+    return hashlib.sha256(definition.encode()).hexdigest()
+
+
+async def sync_commands_if_changed() -> None:
+    """Syncs the slash commands with discord, but only if they changed since the last time they were synced,
+    since syncing is a slow, rate limited call"""
+    tree_hash = command_tree_hash()
+    if not force_command_sync and await repository.get_meta("command_tree_hash") == tree_hash:
+        print_to_log("INFO", "Slash commands haven't changed since the last sync, skipping it")
+        return
     try:
         # right now, all the commands are global
         # and they are syncing to the global cache,
@@ -23,6 +150,7 @@ async def setup_hook():
         # it will take longer to update this way
         synced = await bot.tree.sync()  # Sync all slash commands
         print_to_log("INFO", f"Synced {len(synced)} command(s)")
+        await repository.set_meta("command_tree_hash", tree_hash)
     except Exception as e:
         print_to_log("ERROR", f"Failed to sync commands: {e}")
 
@@ -31,21 +159,109 @@ async def setup_hook():
 async def on_ready():
     print_to_log("INFO", f"Logged in as {bot.user}")
     print_to_log("INFO", f"Connected to {len(bot.guilds)} server(s)")
-    if not bot.is_testing:
+    # on_ready runs again after every reconnect, but the startup only gets logged once
+    if startup_timings:
+        phases = ", ".join(f"{phase}: {seconds:.2f}s" for phase, seconds in startup_timings.items())
+        print_to_log("INFO", f"Ready {time.perf_counter() - bot.started_at:.2f}s after starting -- {phases}")
+        startup_timings.clear()
+    if not bot.is_testing and not update_matches_loop.is_running():
         update_matches_loop.start()
     print("Bot is running...")
 
 
-async def send_a_long_message_in_multiple_parts(content: str, reference: discord.Message | None = None):
-    # because discord has a 2000 character limit for non nitro members
-    # note: if the text seems to randomly truncate, it's because it's
-    # exceeding the token limit in the LLM query
-    while len(content) > 1985:
-        remainder_text = content[1985:]
-        # updates message_to_reply_to to the message it just sent, so it can chain replies
-        reference = await reference.channel.send(content[:1985] + " ...(cont.)", reference=reference)
-        content = remainder_text
-    await reference.channel.send(content, reference=reference)
+def reply_to_message(message: discord.Message) -> StreamingReply:
+    """A StreamingReply whose parts are chained replies, starting with a reply to the given message"""
+    async def send(content: str, previous_message: discord.Message | None) -> discord.Message:
+        return await message.channel.send(content, reference=previous_message or message)
+    return StreamingReply(send, edit_interval=llm_stream_edit_interval, on_write=remember_message)
+
+
+def reply_to_interaction(interaction: discord.Interaction) -> StreamingReply:
+    """A StreamingReply whose first part is the interaction's response and whose other parts are followups"""
+    async def send(content: str, _previous_message) -> discord.InteractionMessage | discord.WebhookMessage:
+        if not interaction.response.is_done():
+            await interaction.response.send_message(content)
+            return await interaction.original_response()
+        return await interaction.followup.send(content, wait=True)
+    return StreamingReply(send, edit_interval=llm_stream_edit_interval, on_write=remember_message)
+
+
+@bot.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    # the bot's own edits are the streaming replies, which remember_message has already cached with the new content
+    if bot.user is not None and payload.data.get("author", {}).get("id") == str(bot.user.id):
+        return
+    # the cached turn would be out of date, it gets picked up again the next time it's in a chain
+    conversation_cache.forget(payload.message_id)
+
+
+@bot.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    conversation_cache.forget(payload.message_id)
+
+
+def remember_message(message: discord.Message, content: str | None = None) -> dict:
+    """Adds a message to the conversation cache (as a KDA message, one of the bot's answers or a user message)
+    and returns its turn. content overrides message.content, for bot messages that are still being edited."""
+    content = message.content if content is None else content
+    parent_id = message.reference.message_id if message.reference else None
+    if message.author == bot.user:
+        key_substrings = ["#", "just", "game", "playing", "KDA:"]
+        if all(term in content for term in key_substrings):
+            player_name = content.replace("*", "").split()[0]
+            sent_message = state.get_message(str(message.id))
+            match_id = sent_message["match_id"] if sent_message is not None else None
+            return conversation_cache.put(message.id, "kda", content, parent_id, kda=(player_name, match_id))
+        return conversation_cache.put(message.id, "assistant", content, parent_id)
+    return conversation_cache.put(message.id, "user", content, parent_id)
+
+
+async def build_conversation(message: discord.Message) -> tuple[list[dict[str, str]], tuple[str, str | None] | None]:
+    """Walks the reply chain ending at message (at most conversation_max_depth messages) and returns it as LLM messages,
+    oldest first, plus the (player name, match ID) of the automated KDA message at the start of the chain, if there is one.
+    Turns come from the conversation cache when possible, then from what discord already sent along with the reply,
+    and only as a last resort from a fetch_message call."""
+    turns = []
+    fetches = 0
+    message_id, curr_message = message.id, message
+    while message_id is not None and len(turns) < conversation_max_depth:
+        turn = conversation_cache.get(message_id)
+        if turn is None:
+            if curr_message is None:
+                try:
+                    curr_message = await message.channel.fetch_message(message_id)
+                    fetches += 1
+                # if the original message was deleted, it will throw this exception
+                except discord.NotFound:
+                    print_to_log("WARNING", "Could not find original message that was replied to")
+                    break
+            turn = remember_message(curr_message)
+        turns.append(turn)
+        # discord usually includes the message being replied to, and discord.py keeps recent messages around too
+        next_message = None
+        if curr_message is not None and curr_message.reference:
+            resolved = curr_message.reference.resolved or curr_message.reference.cached_message
+            if isinstance(resolved, discord.Message):
+                next_message = resolved
+        message_id, curr_message = turn["parent_id"], next_message
+    if fetches:
+        print_to_log("DEBUG", f"Built a {len(turns)} message conversation, {fetches} of which had to be fetched")
+
+    conversation = []
+    kda_message_info = None
+    for turn in reversed(turns):
+        if turn["role"] != "kda":
+            conversation.append({"role": turn["role"], "content": turn["content"]})
+            continue
+        player_name, match_id = turn["kda"]
+        match_data = state.get_match(match_id) if match_id is not None else None
+        if match_id is not None:
+            kda_message_info = turn["kda"]
+        if match_data is not None:
+            conversation.append({"role": "user", "content": f"Player: {player_name}.\nMatch data:\n{encode_match_for_llm(match_data, player_name)}"})
+        else:
+            conversation.append({"role": "user", "content": f"Player: {player_name}.\nMatch data: Could not find match data."})
+    return conversation, kda_message_info
 
 
 @bot.event
@@ -53,47 +269,23 @@ async def on_message(message: discord.Message):
     # ignore messages sent by the bot itself to avoid infinite loops
     if message.author == bot.user:
         return
+    # replies might end up in a conversation with the bot later, so they go in the cache now while it's free
+    if message.reference or bot.user.mentioned_in(message):
+        remember_message(message)
     # the bot responds when you ping it
     if bot.user.mentioned_in(message) and not message.mention_everyone:
         # shows the typing indicator
         async with message.channel.typing():
-            conversation = []
-            curr_message = message
-            while curr_message:
-                content = curr_message.content
-                if curr_message.author == bot.user:
-                    key_substrings = ["#", "just", "game", "playing", "KDA:"]
-                    if all(term in content for term in key_substrings):
-                        message_ids = await read_json_file("jsons/message_ids.json")
-                        player_name = content.replace("*", "").split()[0]
-                        curr_message_id = str(curr_message.id)
-                        match_data = None
-                        if curr_message_id in message_ids:
-                            matches = await read_json_file("jsons/matches.json")
-                            match_id = message_ids[curr_message_id]["match_id"]
-                            if match_id in matches:
-                                match_data = matches[match_id]
-                            conversation = [{"role": "user", "content": f"Player: {player_name}.\nMatch data: {match_data}"}] + conversation
-                        if match_data is None:
-                            conversation = [{"role": "user", "content": f"Player: {player_name}.\nMatch data: Could not find match data."}] + conversation
-                    else:
-                        conversation = [{"role": "assistant", "content": content}] + conversation
-                else:
-                    conversation = [{"role": "user", "content": content}] + conversation
-                if curr_message.reference:
-                    try:
-                        prev_message = await message.channel.fetch_message(curr_message.reference.message_id)
-                    # if the original message was deleted, it will throw this exception
-                    except discord.NotFound:
-                        print_to_log("WARNING", "Could not find original message that was replied to")
-                        prev_message = None
-                else:
-                    prev_message = None
-                curr_message = prev_message
+            conversation, kda_message_info = await build_conversation(message)
 
+            # "winning league?" straight on a KDA message is the same question every time, so its answer gets cached
+            cache_key = None
+            if kda_message_info is not None and len(conversation) == 2:
+                cache_key = LlmResponseCache.make_key(*kda_message_info, llm_prompt_version, message.content)
+            conversation = fit_to_token_budget(conversation, conversation_token_budget, keep_first=kda_message_info is not None)
             conversation = [{"role": "system", "content": prompt_1}] + conversation
-            response_text = await get_groq_response(conversation)
-            await send_a_long_message_in_multiple_parts(response_text, reference=message)
+            reply = reply_to_message(message)
+            await run_llm_job(PRIORITY_MENTION, reply, answer_with_llm, conversation, reply, cache_key, is_reroll(message.content))
 
         # lets the bot process other commands? idk if it's necessary since there are no text (non-slash) commands yet
         await bot.process_commands(message)
@@ -101,14 +293,11 @@ async def on_message(message: discord.Message):
 
 @bot.tree.command(name="add_channel", description="Registers this channel to the bot, allowing you to add players to be tracked")
 async def add_channel(interaction: discord.Interaction):
-    # JSON keys must be strings, not ints
+    # IDs are stored as strings, not ints
     channel_id = str(interaction.channel.id)
-    channels = await read_json_file("jsons/channels.json")
-    if channel_id in channels:
+    if not state.add_channel(channel_id, interaction.channel.name):
         await interaction.response.send_message("This channel is already registered!")
         return
-    channels[channel_id] = {"name": interaction.channel.name, "players": []}
-    await write_json_file("jsons/channels.json", channels)
     await interaction.response.send_message("Channel registered successfully!")
     return
 
@@ -116,16 +305,11 @@ async def add_channel(interaction: discord.Interaction):
 @bot.tree.command(name="remove_channel", description="Removes this channel from tracking, clearing all players")
 async def remove_channel(interaction: discord.Interaction):
     channel_id = str(interaction.channel.id)
-    channels = await read_json_file("jsons/channels.json")
-    if channel_id not in channels:
+    # removes the channel's players (and any player left without a channel) from memory, and flush_state_loop writes
+    # all of it to the database in its next batch
+    if state.remove_channel(channel_id) is None:
         await interaction.response.send_message("This channel is already not registered!")
         return
-
-    for player_name in channels[channel_id]["players"]:
-        await remove_player_from_file(player_name, channel_id)
-    # del might be more dangerous, so pop is used instead
-    channels.pop(channel_id)
-    await write_json_file("jsons/channels.json", channels)
     await interaction.response.send_message("Channel removed successfully!")
     return
 
@@ -133,14 +317,14 @@ async def remove_channel(interaction: discord.Interaction):
 @bot.tree.command(name="list_players", description="Lists all players currently being tracked in this channel")
 async def list_players(interaction: discord.Interaction):
     channel_id = str(interaction.channel.id)
-    channels = await read_json_file("jsons/channels.json")
-    if channel_id not in channels:
+    channel = state.get_channel(channel_id)
+    if channel is None:
         await interaction.response.send_message("This channel is not registered!")
         return
 
     index = 1
     message_string = ""
-    for player_name in channels[channel_id]["players"]:
+    for player_name in channel["players"]:
         message_string += f"{index}. {player_name}\n"
         index += 1
     if index == 1:
@@ -151,61 +335,48 @@ async def list_players(interaction: discord.Interaction):
         await interaction.response.send_message(message_string)
 
 
-async def add_player_to_file(player_name, channel_id) -> str:
-    channels = await read_json_file("jsons/channels.json")
-    players = await read_json_file("jsons/players.json")
-    if channel_id not in channels:
+async def add_player_to_file(player_name, channel_id, platform: str | None = None) -> str:
+    channel = state.get_channel(channel_id)
+    if channel is None:
         return "Channel not registered!"
 
-    if player_name in channels[channel_id]["players"]:
+    if player_name in channel["players"]:
         return "Player already registered in this channel!"
     # need to check that the player is real by verifying that it has a PUUID
-    puuid = await get_puuid_from_riot_id(player_name)
+    puuid = await get_puuid_from_riot_id(player_name, platform)
     if puuid is None:
         return f"Player {player_name} not found!"
 
-    channels[channel_id]["players"].append(player_name)
-    # if the player isn't already in the players.json file, add them
-    if player_name not in players:
-        players[player_name] = {"puuid": puuid, "channels": [channel_id], "most_recent_match_id": None}
-    else:
-        players[player_name]["channels"].append(channel_id)
-
-    await write_json_file("jsons/channels.json", channels)
-    await write_json_file("jsons/players.json", players)
+    # creates the player if they aren't tracked anywhere yet -- both changes only touch memory, and reach the database
+    # together in flush_state_loop's next batch
+    state.add_player(player_name, puuid, channel_id, platform)
     return f"{player_name} added successfully!"
 
 
 async def remove_player_from_file(player_name, channel_id):
-    channels = await read_json_file("jsons/channels.json")
-    players = await read_json_file("jsons/players.json")
-    if channel_id not in channels:
+    if state.get_channel(channel_id) is None:
         return "Channel not registered!"
-    if player_name not in channels[channel_id]["players"]:
+    # if the player doesn't exist in any channels afterwards, they get deleted too
+    if not state.remove_player(player_name, channel_id):
         return "Player already not registered in this channel!"
-
-    channels[channel_id]["players"].remove(player_name)
-    players[player_name]["channels"].remove(channel_id)
-    # if the player doesn't exist in any channels, delete them
-    if not players[player_name]["channels"]:
-        players.pop(player_name)
-
-    await write_json_file("jsons/channels.json", channels)
-    await write_json_file("jsons/players.json", players)
     return f"{player_name} removed successfully!"
 
 
 @bot.tree.command(name="add_player", description="Adds a player to be tracked in this channel (channel must be registered")
-async def add_player(interaction: discord.Interaction, player_name: str):
+@app_commands.describe(region="The region the player plays on (defaults to the bot's region)")
+@app_commands.choices(region=[app_commands.Choice(name=name, value=platform) for name, platform in REGION_PLATFORMS.items()])
+async def add_player(interaction: discord.Interaction, player_name: str, region: app_commands.Choice[str] | None = None):
     channel_id = str(interaction.channel.id)
-    result = await add_player_to_file(player_name, channel_id)
-    await interaction.response.send_message(result)
+    # looking the player up can take a while if we're rate limited, so answer with a followup
+    await interaction.response.defer(thinking=True)
+    result = await add_player_to_file(player_name, channel_id, region.value if region else None)
+    await interaction.followup.send(result)
 
 
-async def player_autocomplete(_: discord.Interaction, current: str):
-    players = await read_json_file("jsons/players.json")
-    player_names = list(players.keys())
-    return [app_commands.Choice(name=name, value=name) for name in player_names if current.lower() in name.lower()][:25]
+async def player_autocomplete(interaction: discord.Interaction, current: str):
+    # runs on every keystroke, so it's a lookup in the channel's name index -- only players in this channel get suggested
+    player_names = state.search_player_names(str(interaction.channel_id), current, limit=25)
+    return [app_commands.Choice(name=name, value=name) for name in player_names]
 
 
 @bot.tree.command(name="remove_player", description="Removes a player from being tracked in this channel (channel must be registered)")
@@ -216,30 +387,98 @@ async def remove_player(interaction: discord.Interaction, player_name: str):
     await interaction.response.send_message(result)
 
 
-async def investigate_player(player_name: str) -> str:
-    """actually performs the functionality of investigating a player"""
-    players = await read_json_file("jsons/players.json")
-    if player_name not in players:
-        return f"Player {player_name} not found!"
-    most_recent_match_id = players[player_name]["most_recent_match_id"]
-    matches = await read_json_file("jsons/matches.json")
-    if most_recent_match_id in matches:
-        match_data = matches[most_recent_match_id]
+def encode_match_for_llm(match_data: dict, player_name: str) -> str:
+    """The compact table form of the match data that goes into LLM prompts (a lot fewer tokens than the raw dict),
+    with the player's local performance score in front of it as a hint"""
+    if player_name not in match_data["players"]:
+        return encode_match(match_data, None, token_budget=llm_match_token_budget)
+    text = encode_match(match_data, player_name, token_budget=llm_match_token_budget)
+    if (performance := player_performance(match_data, player_name)) is not None:
+        text = f"{player_name}'s {performance_hint(performance)}\n{text}"
+    return text
+
+
+async def run_llm_job(priority: int, reply: StreamingReply, coroutine_function, *args) -> None:
+    """Puts an LLM job on the work queue and waits for it to finish, telling the user if the queue is full"""
+    job = llm_queue.submit(priority, coroutine_function, *args)
+    if job is None:
+        await reply.send_text("I'm a bit overwhelmed right now, try again in a minute!")
+        return
+    try:
+        await job
+    except Exception:
+        # already logged by the worker
+        await reply.send_text("Something went wrong while I was thinking about that, sorry!")
+
+
+async def answer_with_llm(conversation: list[dict[str, str]], reply: StreamingReply, cache_key: str | None = None, reroll: bool = False) -> None:
+    """Sends the cached response for cache_key if there is one (unless it's a reroll), otherwise asks groq
+    (streaming the answer into the reply as it's generated, if streaming is on) and caches the answer"""
+    started_at = time.monotonic()
+    if cache_key is not None and not reroll:
+        if (cached_response := await llm_response_cache.get(cache_key)) is not None:
+            print_to_log("INFO", "Answered from the LLM response cache")
+            await reply.send_text(cached_response)
+            metrics.llm_answer_seconds.observe(time.monotonic() - started_at, source="cache")
+            return
+    if llm_streaming:
+        response_text, succeeded = await reply.stream(stream_groq_response(conversation))
+        print_to_log("INFO", f"Streamed LLM response, first text was visible after {reply.time_to_first_text:.2f}s")
     else:
+        response_text = await get_groq_response(conversation)
+        succeeded = not response_text.startswith("Error:")
+        await reply.send_text(response_text)
+    metrics.llm_answer_seconds.observe(time.monotonic() - started_at, source="groq" if succeeded else "error")
+    # errors shouldn't get stuck in the cache
+    if cache_key is not None and succeeded:
+        await llm_response_cache.put(cache_key, response_text)
+
+
+def local_verdict_text(player_name: str, match_data: dict, name_in_match: str) -> str:
+    """The answer to /investigate_player without the LLM, from the performance score computed when the match came in"""
+    if name_in_match not in match_data["players"]:
+        return f"Could not find {player_name} in their most recent match"
+    if (performance := player_performance(match_data, name_in_match)) is None:
+        return f"{player_name}'s most recent game was a remake, so there's nothing to judge"
+    return (f"Verdict on **{player_name}**'s most recent game: **{performance['verdict']}** (score: **{performance['score']}/100**). "
+            f"Their {performance['best']} stood out the most, their {performance['worst']} held them back the most.")
+
+
+async def investigate_player(player_name: str, reply: StreamingReply, reroll: bool = False) -> None:
+    """actually performs the functionality of investigating a player, sending the verdict through the reply"""
+    player = state.get_player(player_name)
+    if player is None:
+        await reply.send_text(f"Player {player_name} not found!")
+        return
+    match_data = state.get_match(player["most_recent_match_id"])
+    if match_data is None:
         print_to_log("WARNING", f"Could not find match data for player {player_name}")
-        return f"Could not find match data for player {player_name}"
+        await reply.send_text(f"Could not find match data for player {player_name}")
+        return
+    found = find_player_in_match(match_data, player_name, player["puuid"])
+    name_in_match = found[0] if found else player_name
+    if not investigate_with_llm:
+        await reply.send_text(local_verdict_text(player_name, match_data, name_in_match))
+        return
     conversation = [{"role": "system", "content": prompt_1}]
-    conversation += [{"role": "user", "content": f"Player Name: {player_name}."}]
-    conversation += [{"role": "user", "content": f"Match Data: {match_data}."}]
-    response_text = await get_groq_response(conversation)
-    return response_text
+    conversation += [{"role": "user", "content": f"Player Name: {name_in_match}."}]
+    conversation += [{"role": "user", "content": f"Match Data:\n{encode_match_for_llm(match_data, name_in_match)}"}]
+    cache_key = LlmResponseCache.make_key(player_name, player["most_recent_match_id"], llm_prompt_version, "investigate")
+    await answer_with_llm(conversation, reply, cache_key, reroll=reroll)
 
 
 @bot.tree.command(name="investigate_player", description="Checks player's most recent game to determine winning/losing league")
 @app_commands.autocomplete(player_name=player_autocomplete)
-async def investigate_player_command(interaction: discord.Interaction | discord.Message, player_name: str):
-    text = await investigate_player(player_name)
-    await interaction.response.send_message(text)
+@app_commands.describe(reroll="Ask for a fresh verdict instead of the cached one")
+async def investigate_player_command(interaction: discord.Interaction | discord.Message, player_name: str, reroll: bool = False):
+    # deferring right away means discord's 3 second deadline doesn't matter, the answer comes as followups
+    await interaction.response.defer(thinking=True)
+    reply = reply_to_interaction(interaction)
+    if not investigate_with_llm:
+        # nothing to wait on, so it doesn't need a spot in the LLM queue
+        await investigate_player(player_name, reply, reroll)
+        return
+    await run_llm_job(PRIORITY_COMMAND, reply, investigate_player, player_name, reply, reroll)
 
 
 class ConfirmView(discord.ui.View):
@@ -262,7 +501,7 @@ class ConfirmView(discord.ui.View):
 
 @bot.tree.command(name="clear_all_data", description="Clears all data stored by the bot, including players and matches")
 async def clear_all_data(interaction: discord.Interaction):
-    """Clears all the JSON files -- only designated users can use"""
+    """Clears all the stored data -- only designated users can use"""
     # put your discord username in here if you want permission to use this command
     if interaction.user.name not in ["duckoverl0rd"]:
         await interaction.response.send_message("Sorry, you don't have the permission to use this command")
@@ -280,16 +519,102 @@ async def clear_all_data(interaction: discord.Interaction):
     if view.value is None:
         await interaction.followup.send(f"Timed out.")
     elif view.value is True:
-        await write_json_file("jsons/channels.json", {})
-        await write_json_file("jsons/players.json", {})
-        await write_json_file("jsons/matches.json", {})
+        state.clear_all()
         await interaction.followup.send(f"Successfully cleared all data!")
     else:
         await interaction.followup.send(f"HE CANCELLED IT!")
 
 
-async def automated_kda_message(player_name) -> str:
-    relevant_information = await get_relevant_information_from_match_so_ai_can_determine_winning_or_losing_league(player_name)
+@bot.tree.command(name="storage_report", description="Shows how much data the bot is storing")
+async def storage_report(interaction: discord.Interaction):
+    """Shows what's in memory and how big the database is -- only designated users can use"""
+    if interaction.user.name not in ["duckoverl0rd"]:
+        await interaction.response.send_message("Sorry, you don't have the permission to use this command")
+        return
+    report = {**state.storage_report(), **await repository.storage_report()}
+    lines = [f"{key}: {value / 1024:.1f} KiB" if key.endswith("_bytes") else f"{key}: {value}" for key, value in report.items()]
+    await interaction.response.send_message("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+
+@bot.tree.command(name="stats", description="Shows a player's stats (or the whole channel's) over the last few days")
+@app_commands.autocomplete(player_name=player_autocomplete)
+@app_commands.describe(player_name="Leave empty for everyone tracked in this channel")
+async def stats(interaction: discord.Interaction, player_name: str | None = None):
+    window = f"the last {stats_window_days:g} days"
+    if player_name is None:
+        channel_id = str(interaction.channel.id)
+        if state.get_channel(channel_id) is None:
+            await interaction.response.send_message("This channel is not registered!")
+            return
+        channel_totals = state.stats.channel_totals[channel_id]
+        await interaction.response.send_message(f"**This channel** in {window}: {channel_totals.summary()}")
+        return
+    totals = state.stats.totals.get(player_name)
+    if totals is None:
+        await interaction.response.send_message(f"No games from {player_name} in {window}!")
+        return
+    lines = [f"**{player_name}** in {window}: {totals.summary()}"]
+    for title, splits in [("Champions", state.stats.by_champion.get(player_name, {})), ("Roles", state.stats.by_role.get(player_name, {}))]:
+        # the most played first
+        lines.append(f"{title}:")
+        lines += [f"- {name}: {split.summary()}" for name, split in sorted(splits.items(), key=lambda item: -item[1].games)[:5]]
+    await interaction.response.send_message("\n".join(lines))
+
+
+@bot.tree.command(name="leaderboard", description="Ranks the players in this channel over the last few days")
+@app_commands.choices(metric=[app_commands.Choice(name=label, value=metric) for metric, (label, _) in LEADERBOARD_METRICS.items()])
+async def leaderboard(interaction: discord.Interaction, metric: app_commands.Choice[str]):
+    channel_id = str(interaction.channel.id)
+    if state.get_channel(channel_id) is None:
+        await interaction.response.send_message("This channel is not registered!")
+        return
+    ranking = state.stats.top(channel_id, metric.value, k=10)
+    if not ranking:
+        await interaction.response.send_message(f"Nobody here has played {state.stats.min_games}+ games in the last {stats_window_days:g} days!")
+        return
+    value_format = LEADERBOARD_METRICS[metric.value][1]
+    lines = [f"**{metric.name}** over the last {stats_window_days:g} days:"]
+    lines += [f"{index}. {player_name} -- {value_format.format(value)}" for index, (player_name, value) in enumerate(ranking, start=1)]
+    await interaction.response.send_message("\n".join(lines))
+
+
+def format_seconds(seconds: float | None) -> str:
+    return "n/a" if seconds is None else f"{seconds:.2f}s"
+
+
+@bot.tree.command(name="bot_stats", description="Shows how fast the bot has been polling, fetching and answering")
+async def bot_stats(interaction: discord.Interaction):
+    """Summarizes the runtime metrics since startup -- only designated users can use"""
+    if interaction.user.name not in ["duckoverl0rd"]:
+        await interaction.response.send_message("Sorry, you don't have the permission to use this command")
+        return
+    lines = ["Riot requests (count, p50, p99):"]
+    for method in sorted({key[0] for key in metrics.riot_requests.values}):
+        lines.append(f"  {method}: {metrics.riot_requests.total(method=method):.0f}, "
+                     f"{format_seconds(metrics.riot_request_seconds.quantile(0.5, method=method))}, "
+                     f"{format_seconds(metrics.riot_request_seconds.quantile(0.99, method=method))}")
+    lines.append(f"Riot 429s: {metrics.riot_requests.total(status=429):.0f}, "
+                 f"timeouts/errors: {metrics.riot_requests.total(status='timeout') + metrics.riot_requests.total(status='error'):.0f}")
+    lines.append(f"Poll ticks: {metrics.poll_tick_duration.count()}, p50 {format_seconds(metrics.poll_tick_duration.quantile(0.5))}, "
+                 f"p99 {format_seconds(metrics.poll_tick_duration.quantile(0.99))}")
+    players_polled = metrics.players_polled_per_tick.quantile(0.5)
+    lines.append(f"Players polled per tick (p50): {'n/a' if players_polled is None else round(players_polled)}")
+    lines.append(f"Game end to announcement (p50): {format_seconds(metrics.announcement_delay_seconds.quantile(0.5))}")
+    lines.append(f"Groq requests: {metrics.groq_request_seconds.count()}, p50 {format_seconds(metrics.groq_request_seconds.quantile(0.5))}, "
+                 f"429s: {metrics.groq_request_seconds.count(status=429)}")
+    lines.append(f"Groq tokens -- prompt: {metrics.groq_tokens.total(kind='prompt'):.0f}, completion: {metrics.groq_tokens.total(kind='completion'):.0f}")
+    lines.append(f"LLM answers (p50) -- cached: {format_seconds(metrics.llm_answer_seconds.quantile(0.5, source='cache'))}, "
+                 f"groq: {format_seconds(metrics.llm_answer_seconds.quantile(0.5, source='groq'))}")
+    lines.append("Cache hit rates:")
+    for name, cache in caches_with_hit_rates.items():
+        lookups = cache.hits + cache.misses
+        lines.append(f"  {name}: " + (f"{cache.hits / lookups:.0%} of {lookups}" if lookups else "no lookups yet"))
+    lines.append(f"Duplicate fetches saved: {single_flight.coalesced_total()}")
+    await interaction.response.send_message("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+
+async def automated_kda_message(player_name, match_id: str | None = None) -> str:
+    relevant_information = await get_relevant_information_from_match_so_ai_can_determine_winning_or_losing_league(player_name, match_id)
     if relevant_information is None:
         text = f"Error getting KDA for {player_name}"
     else:
@@ -298,53 +623,149 @@ async def automated_kda_message(player_name) -> str:
         text += f"KDA: **{relevant_information['kills']}/{relevant_information['deaths']}/{relevant_information['assists']}**. "
         if sided_text := relevant_information["sided"]:  # google "en walrus operator"
             text += f"{sided_text}"
+        if performance := relevant_information["performance"]:
+            text += f"Verdict: **{performance['verdict']}** ({performance['score']}/100). "
     return text
 
-@tasks.loop(seconds=60)
+async def resolve_channel(channel_id: int) -> discord.abc.Messageable:
+    """The channel object to send to -- from our cache, then discord.py's, and only then from the API"""
+    if (channel := announcement_channels.get(channel_id)) is None:
+        channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+        announcement_channels[channel_id] = channel
+    return channel
+
+
+def combine_kda_texts(texts: list[str]) -> list[list[int]]:
+    """Groups KDA texts (by index) into as few messages as fit in discord's 2000 character limit, keeping their order"""
+    groups = [[]]
+    length = 0
+    for index, text in enumerate(texts):
+        if groups[-1] and length + 1 + len(text) > 2000:
+            groups.append([])
+            length = 0
+        length += len(text) + (1 if groups[-1] else 0)
+        groups[-1].append(index)
+    return groups
+
+
+async def announce_matches(players_with_new_matches: dict[str, list[str]], datetime_sent: str) -> dict:
+    """Sends the KDA messages for everyone's new matches and returns the sent messages for state.add_messages.
+    Each (player, match) text is built once no matter how many channels it goes to, tracked players who were in the
+    same game share one message per channel, every channel gets its messages in the order the games ended
+    (so catch-ups read like a timeline), and different channels get sent to concurrently."""
+    announcements = [(player_name, match_id) for player_name, match_ids in players_with_new_matches.items() for match_id in match_ids]
+    texts = dict(zip(announcements, await asyncio.gather(*(automated_kda_message(player_name, match_id)
+                                                            for player_name, match_id in announcements))))
+    announcements.sort(key=lambda announcement: (state.get_match(announcement[1]) or {}).get("game_end_timestamp") or 0)
+    players_by_match = {}
+    for player_name, match_id in announcements:
+        players_by_match.setdefault(match_id, []).append(player_name)
+
+    # channel_id -> [(match_id, [the channel's players in that match])], copied now since slash commands can change
+    # the channels while the sends are being awaited
+    outbox = {}
+    for channel_id, channel_data in state.get_channels().items():
+        for match_id, player_names in players_by_match.items():
+            if channel_players := [player_name for player_name in player_names if player_name in channel_data["players"]]:
+                outbox.setdefault(channel_id, []).append((match_id, channel_players))
+
+    send_semaphore = asyncio.Semaphore(announcement_concurrency)
+    message_ids = {}
+
+    async def deliver(channel_id: str, matches: list[tuple[str, list[str]]]):
+        channel_name = (state.get_channel(channel_id) or {}).get("name", channel_id)
+        async with send_semaphore:
+            try:
+                channel = await resolve_channel(int(channel_id))
+            except discord.HTTPException as e:
+                print_to_log("ERROR", f"Could not get channel {channel_name} to send KDA messages to: {e}")
+                return
+            for match_id, player_names in matches:
+                for group in combine_kda_texts([texts[(player_name, match_id)] for player_name in player_names]):
+                    text = "\n".join(texts[(player_names[index], match_id)] for index in group)
+                    # replies to a combined message are about its first player
+                    player_name = player_names[group[0]]
+                    print_to_log("INFO", f"Sending KDA message for {', '.join(player_names[index] for index in group)} in channel {channel_name}")
+                    try:
+                        message = await channel.send(text)
+                    except discord.HTTPException as e:
+                        print_to_log("ERROR", f"Failed to send KDA message in channel {channel_name}: {e}")
+                        # the channel might be gone, so it gets looked up again next time
+                        announcement_channels.pop(int(channel_id), None)
+                        continue
+                    if game_end_timestamp := (state.get_match(match_id) or {}).get("game_end_timestamp"):
+                        metrics.announcement_delay_seconds.observe(time.time() - game_end_timestamp / 1000)
+                    message_ids[str(message.id)] = {"player_name": player_name, "match_id": match_id, "datetime_sent": datetime_sent}
+                    conversation_cache.put(message.id, "kda", text, kda=(player_name, match_id))
+
+    await asyncio.gather(*(deliver(channel_id, matches) for channel_id, matches in outbox.items()))
+    return message_ids
+
+
+@tasks.loop(seconds=poll_tick_seconds)
 async def update_matches_loop():
-    """Repeatedly checks all players for new matches, and if one is found, the bot types their KDA in the given discord channels"""
-    print_to_log("INFO", "Checking for new matches...")
-    players = await read_json_file("jsons/players.json")
-    matches = await read_json_file("jsons/matches.json")
-    message_ids = await read_json_file("jsons/message_ids.json")
+    """Repeatedly checks players who are due (according to their region's poll scheduler, or in spectator mode, whose
+    games are due for a look) for new matches, and if one is found, the bot types their KDA in the given discord channels"""
+    # a shallow copy, so that players removed by a slash command mid-tick don't disappear out from under the loop
+    players = dict(state.get_players())
 
     datetime_now = datetime.now(timezone.utc)  # "Aware" UTC
-    # create a static list of keys to avoid changing the size of the dictionary while iterating over it
-    for message_id in list(message_ids.keys()):
-        datetime_sent = datetime.fromisoformat(message_ids[message_id]["datetime_sent"])
-        # deletes old match data after a week
-        if datetime_now - datetime_sent > timedelta(weeks=1):
-            match_id = message_ids[message_id]["match_id"]
-            if match_id in matches:
-                matches.pop(match_id)
-            message_ids.pop(message_id)
-
-    players_with_new_matches = {}
-    for player_name in players.keys():
-        new_match_id = await get_latest_match_id(players[player_name]["puuid"])
-        if new_match_id is None:
-            print_to_log("WARNING", f"Failed to get match ID for player {player_name}, skipping...")
-            break
-        print_to_log("INFO", f"Player {player_name}'s most recent match has ID: {new_match_id}")
-        print_to_log("INFO", f"Their previous most recent match had ID {players[player_name]['most_recent_match_id']}")
-        if new_match_id != players[player_name]["most_recent_match_id"]:
-            players[player_name]["most_recent_match_id"] = new_match_id
-            players_with_new_matches[player_name] = str(new_match_id)  # storing it as a string for use later as a json dictionary key
-            if new_match_id not in matches:
-                matches[new_match_id] = await get_match_data(new_match_id)
-    await write_json_file("jsons/players.json", players)
-    await write_json_file("jsons/matches.json", matches)
+    # forgets old KDA messages -- the timestamps are all UTC isoformat strings, so they compare correctly as text
+    pruned = state.prune_messages_sent_before((datetime_now - timedelta(days=message_retention_days)).isoformat())
+    # then deletes the match data nothing points to anymore
+    collected = state.collect_orphaned_matches(int((datetime_now - timedelta(hours=orphaned_match_grace_hours)).timestamp() * 1000))
+    # and takes the games that fell out of the stats window out of everyone's stats
+    expired = state.expire_games_before(int((datetime_now - timedelta(days=stats_window_days)).timestamp() * 1000))
+    if pruned or collected or expired:
+        print_to_log("INFO", f"Pruned {pruned} expired message(s), {collected} orphaned match(es) and {expired} game(s) from the stats window")
+
+    if poller_hub is not None:
+        # the poller processes do the polling and report back through on_new_matches, they just need to know who to poll
+        await poller_hub.assign(players)
+        return
+    tick_started_at = time.monotonic()
+    if (poll_result := await poll_players(players)) is None:
+        return
+    await ingest_new_matches(*poll_result, datetime_now.isoformat())
+    metrics.poll_tick_duration.observe(time.monotonic() - tick_started_at)
+
+
+async def on_new_matches(players_with_new_matches: dict[str, list[str]], fetched_matches: dict) -> None:
+    """What the poller processes' reports go through"""
+    # the pollers don't write the identity cache, so the name <-> puuid pairs in their matches get remembered here
+    await identity_cache.ensure_loaded()
+    for match_data in fetched_matches.values():
+        for player_name, player_data in match_data["players"].items():
+            identity_cache.put(player_name, player_data["puuid"])
+    await identity_cache.save()
+    await ingest_new_matches(players_with_new_matches, fetched_matches, datetime.now(timezone.utc).isoformat())
+
+
+async def ingest_new_matches(players_with_new_matches: dict[str, list[str]], fetched_matches: dict, datetime_sent: str) -> None:
+    """Stores the new matches, moves the players' high-water marks to their newest match and announces them"""
+    # poller processes that split up the players of one game each send its match, it only needs storing once
+    state.put_matches({match_id: match_data for match_id, match_data in fetched_matches.items() if state.get_match(match_id) is None})
+    # matches whose fetch failed can't be announced, and must not become anyone's high-water mark
+    players_with_new_matches = {player_name: fetched_match_ids for player_name, match_ids in players_with_new_matches.items()
+                                if (fetched_match_ids := [match_id for match_id in match_ids if state.get_match(match_id) is not None])}
+    # every new game goes into the player's rolling stats once, here
+    games = {}
+    for player_name, match_ids in players_with_new_matches.items():
+        player = state.get_player(player_name)
+        for match_id in match_ids:
+            match_data = state.get_match(match_id)
+            if player is None or match_data is None or (found := find_player_in_match(match_data, player_name, player["puuid"])) is None:
+                continue
+            if (game := game_record(match_data, found[1])) is not None:
+                games[(player_name, match_id)] = game
+    state.record_games(games)
+    # the newest (fetched) match is the new high-water mark
+    state.set_most_recent_match_ids({player_name: match_ids[-1] for player_name, match_ids in players_with_new_matches.items()})
     print_to_log("INFO", f"Players with new matches -- {players_with_new_matches}")
+    state.add_messages(await announce_matches(players_with_new_matches, datetime_sent))
+
 
-    channels = await read_json_file("jsons/channels.json")
-    for channel_id in channels:
-        for player_name in channels[channel_id]["players"]:
-            if player_name in players_with_new_matches:
-                text = await automated_kda_message(player_name)
-                channel = await bot.fetch_channel(int(channel_id))
-                print_to_log("INFO", f"Sending KDA message for {player_name} in channel {channels[channel_id]["name"]}")
-                message = await channel.send(text)
-                message_id = str(message.id)
-                datetime_sent = datetime_now.isoformat()
-                message_ids[message_id] = {"player_name": player_name, "match_id": players_with_new_matches[player_name], "datetime_sent": datetime_sent}
-    await write_json_file("jsons/message_ids.json", message_ids)
\ No newline at end of file
+@tasks.loop(seconds=state_flush_interval)
+async def flush_state_loop():
+    """Periodically writes the in-memory state's changes to the database in one batch"""
+    await state.flush()
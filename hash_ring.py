@@ -0,0 +1,21 @@
+import bisect
+import hashlib
+
+
+class HashRing:
+    """Consistent hashing: every node gets `replicas` points on a ring of 64-bit hashes, and a key belongs to the node
+    with the first point at or after the key's own hash. Adding or removing a node only moves about 1/n of the keys,
+    so changing the number of pollers doesn't reshuffle everyone's schedule."""
+
+    def __init__(self, nodes: list[str], replicas: int = 100):
+        self.points: list[tuple[int, str]] = sorted((self._hash(f"{node}#{replica}"), node) for node in nodes for replica in range(replicas))
+        self.hashes = [point_hash for point_hash, _ in self.points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        # not hash(), which is salted differently in every process
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect_left(self.hashes, self._hash(key)) % len(self.points)
+        return self.points[index][1]
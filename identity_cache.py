@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from auxiliary_functions import print_to_log, read_json_file, write_json_file
+
+
+def normalize_riot_id(riot_id: str) -> str:
+    """Riot IDs are case-insensitive, so 'Faker#KR1' and 'faker#kr1' should be the same cache entry."""
+    return riot_id.strip().casefold()
+
+
+class IdentityCache:
+    """Persistent two-way mapping between Riot IDs (GameName#TagLine) and PUUIDs.
+    Entries expire after ttl_seconds because players can change their Riot ID, and the least recently
+    used entries are evicted once there are more than max_entries of them."""
+
+    def __init__(self, filename: str, ttl_seconds: float = 7 * 24 * 60 * 60, max_entries: int = 5000):
+        self.filename = filename
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # normalized riot id -> {"riot_id": ..., "puuid": ..., "updated_at": ...}
+        self.by_riot_id: OrderedDict[str, dict] = OrderedDict()
+        # puuid -> normalized riot id
+        self.by_puuid: dict[str, str] = {}
+        self.loaded = False
+        self.dirty = False
+        # the poller processes only read the file, the bot is the one that writes it
+        self.read_only = False
+        self.hits = 0
+        self.misses = 0
+
+    async def ensure_loaded(self) -> None:
+        if self.loaded:
+            return
+        self.loaded = True
+        entries = await read_json_file(self.filename)
+        # the file is saved least recently used first, so the order survives restarts
+        for key, entry in entries.items():
+            self.by_riot_id[key] = entry
+            self.by_puuid[entry["puuid"]] = key
+        print_to_log("INFO", f"Loaded {len(self.by_riot_id)} cached identities")
+
+    async def save(self) -> None:
+        """Writes the cache to disk, but only if something changed since the last save."""
+        if not self.dirty or self.read_only:
+            return
+        self.dirty = False
+        await write_json_file(self.filename, dict(self.by_riot_id))
+
+    def _is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["updated_at"] < self.ttl_seconds
+
+    def get_puuid(self, riot_id: str) -> str | None:
+        key = normalize_riot_id(riot_id)
+        entry = self.by_riot_id.get(key)
+        if entry is None or not self._is_fresh(entry):
+            self.misses += 1
+            return None
+        self.by_riot_id.move_to_end(key)
+        self.hits += 1
+        return entry["puuid"]
+
+    def get_riot_id(self, puuid: str) -> str | None:
+        key = self.by_puuid.get(puuid)
+        if key is None or not self._is_fresh(self.by_riot_id[key]):
+            self.misses += 1
+            return None
+        self.by_riot_id.move_to_end(key)
+        self.hits += 1
+        return self.by_riot_id[key]["riot_id"]
+
+    def put(self, riot_id: str, puuid: str) -> None:
+        key = normalize_riot_id(riot_id)
+        # if this puuid used to go by a different name (the account was renamed), drop the old name
+        old_key = self.by_puuid.get(puuid)
+        if old_key is not None and old_key != key:
+            self.by_riot_id.pop(old_key, None)
+        # and if this name used to belong to a different account, drop that account's reverse mapping
+        old_entry = self.by_riot_id.get(key)
+        if old_entry is not None and old_entry["puuid"] != puuid:
+            self.by_puuid.pop(old_entry["puuid"], None)
+        self.by_riot_id[key] = {"riot_id": riot_id, "puuid": puuid, "updated_at": time.time()}
+        self.by_riot_id.move_to_end(key)
+        self.by_puuid[puuid] = key
+        while len(self.by_riot_id) > self.max_entries:
+            evicted_key, evicted_entry = self.by_riot_id.popitem(last=False)
+            if self.by_puuid.get(evicted_entry["puuid"]) == evicted_key:
+                self.by_puuid.pop(evicted_entry["puuid"])
+        self.dirty = True
@@ -0,0 +1,70 @@
+import re
+import time
+from collections import OrderedDict
+from auxiliary_functions import print_to_log, read_json_file, write_json_file
+
+# questions containing this word skip the cache and get a fresh answer (which then replaces the cached one)
+REROLL_WORD = "reroll"
+
+
+def question_words(question: str) -> list[str]:
+    question = re.sub(r"<@!?\d+>", " ", question)  # mentions of the bot
+    return re.sub(r"[^\w\s]", " ", question.casefold()).split()
+
+
+def normalize_question(question: str) -> str:
+    """Makes 'Winning league??', '<@123> winning   league' and 'winning league? reroll' the same question, so a
+    reroll's answer replaces the plain question's."""
+    return " ".join(word for word in question_words(question) if word != REROLL_WORD)
+
+
+def is_reroll(question: str) -> bool:
+    return REROLL_WORD in question_words(question)
+
+
+class LlmResponseCache:
+    """Persistent cache of LLM verdicts, keyed by (player, match ID, prompt version, normalized question).
+    Entries expire after ttl_seconds, and the least recently used ones are evicted past max_entries."""
+
+    def __init__(self, filename: str, ttl_seconds: float = 7 * 24 * 60 * 60, max_entries: int = 2000):
+        self.filename = filename
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # key -> {"response": ..., "created_at": ...}, least recently used first
+        self.entries: OrderedDict[str, dict] = OrderedDict()
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(player_name: str, match_id: str, prompt_version: str, question: str) -> str:
+        return "|".join([player_name.casefold(), match_id, prompt_version, normalize_question(question)])
+
+    async def ensure_loaded(self) -> None:
+        if self.loaded:
+            return
+        self.loaded = True
+        now = time.time()
+        for key, entry in (await read_json_file(self.filename)).items():
+            if now - entry["created_at"] < self.ttl_seconds:
+                self.entries[key] = entry
+        print_to_log("INFO", f"Loaded {len(self.entries)} cached LLM responses")
+
+    async def get(self, key: str) -> str | None:
+        await self.ensure_loaded()
+        entry = self.entries.get(key)
+        if entry is None or time.time() - entry["created_at"] >= self.ttl_seconds:
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry["response"]
+
+    async def put(self, key: str, response: str) -> None:
+        await self.ensure_loaded()
+        self.entries[key] = {"response": response, "created_at": time.time()}
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        await write_json_file(self.filename, dict(self.entries))
@@ -0,0 +1,60 @@
+import asyncio
+import itertools
+from auxiliary_functions import print_to_log
+
+# lower numbers get picked up first
+PRIORITY_COMMAND = 0  # slash commands
+PRIORITY_MENTION = 1  # casual pings and replies
+
+
+class LlmWorkQueue:
+    """Bounded priority queue of LLM jobs, worked through by a fixed pool of workers.
+    The pool size is the most groq requests we'll ever have going at once, no matter how many people ask at the same time,
+    and once max_size jobs are waiting, new ones get turned away instead of piling up."""
+
+    def __init__(self, workers: int = 2, max_size: int = 20):
+        self.worker_count = workers
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=max_size)
+        self.workers: list[asyncio.Task] = []
+        # breaks ties between jobs with the same priority, so they're first come first served
+        self.sequence = itertools.count()
+
+    def start(self) -> None:
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._work(), name=f"llm-worker-{i}") for i in range(self.worker_count)]
+
+    async def stop(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def submit(self, priority: int, coroutine_function, *args) -> asyncio.Future | None:
+        """Queues coroutine_function(*args) and returns a future for its result, or None if the queue is full."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((priority, next(self.sequence), coroutine_function, args, future))
+        except asyncio.QueueFull:
+            print_to_log("WARNING", f"LLM queue is full ({self.queue.maxsize} jobs waiting), turning a job away")
+            return None
+        return future
+
+    async def _work(self) -> None:
+        while True:
+            _, _, coroutine_function, args, future = await self.queue.get()
+            try:
+                # whoever submitted it stopped waiting, so don't bother
+                if future.cancelled():
+                    continue
+                result = await coroutine_function(*args)
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                print_to_log("ERROR", f"LLM job {coroutine_function.__name__} failed: {e!r}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.queue.task_done()
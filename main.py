@@ -1,10 +1,16 @@
+import time
+started_at = time.perf_counter()
 from discord_functionality import *
+startup_timings["imports"] = time.perf_counter() - started_at
 
 # load_dotenv() is already executed when importing riot_functionality
 discord_token = getenv('DISCORD_TOKEN')
 
 def main():
-    bot.run(discord_token, log_handler=full_info_handler, log_level=logging.DEBUG)
+    bot.started_at = started_at
+    # discord.py's logging goes through the bot's log queue instead of a handler of its own
+    route_discord_logger(logging.DEBUG)
+    bot.run(discord_token, log_handler=None)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,98 @@
+# bump this whenever the encoded format changes, since cached LLM responses depend on it
+MATCH_ENCODING_VERSION = 1
+
+# rough chars-per-token for this kind of text, used to estimate prompt size without needing a tokenizer
+CHARS_PER_TOKEN = 3.5
+
+# (code, description, priority) -- when a table is over its token budget, the lowest priority columns get dropped first
+COLUMNS = [
+    ("tag", "> = the player being judged, ~ = their lane opponent", 100),
+    ("tm", "team (B/R)", 95),
+    ("res", "result (W/L/D)", 95),
+    ("champ", "champion", 90),
+    ("role", "role", 90),
+    ("kda", "kills/deaths/assists", 90),
+    ("kp", "kill participation %", 70),
+    ("cs/m", "cs per minute", 60),
+    ("g/m", "gold per minute", 60),
+    ("dmg/m", "damage to champions per minute", 60),
+    ("vis/m", "vision score per minute", 40),
+    ("lvl", "champion level", 30),
+    ("heal", "healing+shielding on allies (k)", 25),
+    ("obj", "damage to epic monsters (k)", 20),
+    ("bld", "damage to structures (k)", 15),
+    ("name", "riot name (without tag)", 10),
+]
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def _lane_opponent(match_data: dict, player_name: str) -> str | None:
+    player_data = match_data["players"][player_name]
+    if not player_data["role"]:
+        return None
+    for other_name, other_data in match_data["players"].items():
+        if other_data["team"] != player_data["team"] and other_data["role"] == player_data["role"]:
+            return other_name
+    return None
+
+
+def _rows(match_data: dict, player_name: str | None) -> list[dict[str, str]]:
+    minutes = max(match_data["duration"] / 60, 1)
+    opponent = _lane_opponent(match_data, player_name) if player_name in match_data["players"] else None
+    team_kills = {}
+    for player_data in match_data["players"].values():
+        team_kills[player_data["team"]] = team_kills.get(player_data["team"], 0) + player_data["kills"]
+    rows = []
+    for name, p in match_data["players"].items():
+        kill_participation = (p["kills"] + p["assists"]) / max(team_kills[p["team"]], 1) * 100
+        rows.append({
+            "tag": ">" if name == player_name else "~" if name == opponent else "",
+            "tm": "B" if p["team"] == "blue" else "R",
+            "res": {"won": "W", "lost": "L"}.get(p["result"], "D"),
+            "champ": p["champion"],
+            "role": p["role"] or "-",
+            "kda": f"{p['kills']}/{p['deaths']}/{p['assists']}",
+            "kp": f"{kill_participation:.0f}",
+            "cs/m": f"{p['cs'] / minutes:.1f}",
+            "g/m": f"{p['gold'] / minutes:.0f}",
+            "dmg/m": f"{p['damage_dealt_to_champions'] / minutes:.0f}",
+            "vis/m": f"{p['vision_score'] / minutes:.2f}",
+            "lvl": str(p["level"]),
+            "heal": f"{p['damage_healed_and_shielded_to_allies'] / 1000:.1f}",
+            "obj": f"{p['damage_dealt_to_epic_monsters'] / 1000:.1f}",
+            "bld": f"{p['damage_dealt_to_structures'] / 1000:.1f}",
+            "name": name.split("#")[0],
+        })
+    # the player being judged and their opponent go first, so they're easy to find
+    rows.sort(key=lambda row: {">": 0, "~": 1}.get(row["tag"], 2))
+    return rows
+
+
+def _render(header: str, columns: list[tuple[str, str, int]], rows: list[dict[str, str]]) -> str:
+    legend = "; ".join(f"{code}={description}" for code, description, _ in columns)
+    lines = [header, f"columns: {legend}", "|".join(code for code, _, _ in columns)]
+    lines += ["|".join(row[code] for code, _, _ in columns) for row in rows]
+    return "\n".join(lines)
+
+
+def encode_match(match_data: dict, player_name: str | None = None, token_budget: int = 700) -> str:
+    """Encodes stored match data (as returned by get_match_data) as a dense table with one row per player,
+    with the target player and their lane opponent highlighted and per-minute rates already worked out.
+    Columns are dropped, lowest priority first, until the table fits in token_budget (estimated) tokens."""
+    duration = match_data["duration"]
+    header = f"{match_data['queue_type']}, {duration // 60}:{duration % 60:02d}"
+    if player_name:
+        header += f", judging {player_name}"
+    rows = _rows(match_data, player_name)
+    columns = list(COLUMNS)
+    text = _render(header, columns, rows)
+    while estimate_tokens(text) > token_budget:
+        droppable = [column for column in columns if column[2] < 90]
+        if not droppable:
+            break
+        columns.remove(min(droppable, key=lambda column: column[2]))
+        text = _render(header, columns, rows)
+    return text
@@ -0,0 +1,163 @@
+import bisect
+from typing import Callable
+from aiohttp import web
+
+# seconds -- covers everything from a cached Riot response to a slow LLM answer
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_text(label_names: tuple[str, ...], label_values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self, **labels) -> float:
+        """The sum over every label set matching the given labels."""
+        return sum(value for key, value in self.values.items()
+                   if all(key[self.label_names.index(name)] == str(wanted) for name, wanted in labels.items()))
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_label_text(self.label_names, key)} {value}" for key, value in self.values.items()]
+        return lines
+
+
+class Gauge:
+    """A value that's read when the metrics are rendered, from a function returning either a number
+    or {label value tuple: number}."""
+
+    def __init__(self, name: str, description: str, read: Callable[[], float | dict], label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.read = read
+        self.label_names = label_names
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        values = self.read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines += [f"{self.name}{_label_text(self.label_names, key)} {value}" for key, value in values.items()]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        # label values -> [per-bucket counts (the last one is +Inf), sum, count]
+        self.values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        if key not in self.values:
+            self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry = self.values[key]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def _merged(self, labels: dict) -> tuple[list[int], float, int]:
+        counts, total, count = [0] * (len(self.buckets) + 1), 0.0, 0
+        for key, (bucket_counts, bucket_sum, bucket_count) in self.values.items():
+            if all(key[self.label_names.index(name)] == str(wanted) for name, wanted in labels.items()):
+                counts = [a + b for a, b in zip(counts, bucket_counts)]
+                total += bucket_sum
+                count += bucket_count
+        return counts, total, count
+
+    def count(self, **labels) -> int:
+        return self._merged(labels)[2]
+
+    def quantile(self, q: float, **labels) -> float | None:
+        """Estimates a quantile (0 to 1) from the buckets the same way Prometheus' histogram_quantile does."""
+        counts, _, count = self._merged(labels)
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    # past the last bucket, so the best we can say is "at least the last bound"
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, (bucket_counts, bucket_sum, bucket_count) in self.values.items():
+            cumulative = 0
+            for bound, bucket in zip(list(self.buckets) + ["+Inf"], bucket_counts):
+                cumulative += bucket
+                le = 'le="' + str(bound) + '"'
+                lines.append(f"{self.name}_bucket{_label_text(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.label_names, key)} {bucket_sum}")
+            lines.append(f"{self.name}_count{_label_text(self.label_names, key)} {bucket_count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Every metric the bot keeps, rendered in the Prometheus text format on request."""
+
+    def __init__(self):
+        self.metrics: list[Counter | Gauge | Histogram] = []
+
+    def counter(self, name: str, description: str, label_names: tuple[str, ...] = ()) -> Counter:
+        self.metrics.append(Counter(name, description, label_names))
+        return self.metrics[-1]
+
+    def gauge(self, name: str, description: str, read: Callable[[], float | dict], label_names: tuple[str, ...] = ()) -> Gauge:
+        self.metrics.append(Gauge(name, description, read, label_names))
+        return self.metrics[-1]
+
+    def histogram(self, name: str, description: str, label_names: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        self.metrics.append(Histogram(name, description, label_names, buckets))
+        return self.metrics[-1]
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+    async def serve(self, host: str, port: int) -> web.AppRunner:
+        """Serves the metrics at http://host:port/metrics until the returned runner is cleaned up."""
+        async def handle(_request: web.Request) -> web.Response:
+            return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+        app = web.Application()
+        app.add_routes([web.get("/metrics", handle)])
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+registry = MetricsRegistry()
+
+# the hot paths' metrics live here so every module records into the same ones
+riot_requests = registry.counter("lolkd_riot_requests_total", "Riot API responses by endpoint, region and status", ("method", "region", "status"))
+riot_request_seconds = registry.histogram("lolkd_riot_request_seconds", "Riot API request latency (one attempt, rate limiter wait excluded)", ("method",))
+poll_tick_duration = registry.histogram("lolkd_poll_tick_seconds", "How long a tick of update_matches_loop took")
+players_polled_per_tick = registry.histogram("lolkd_players_polled_per_tick", "Players polled for new matches in one tick",
+                                             buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+announcement_delay_seconds = registry.histogram(
+    "lolkd_announcement_delay_seconds", "Time from a game ending to its KDA message being sent",
+    buckets=(30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 21600, 86400))
+groq_request_seconds = registry.histogram("lolkd_groq_request_seconds", "Time until Groq starts answering", ("stream", "status"))
+groq_tokens = registry.counter("lolkd_groq_tokens_total", "Tokens used on Groq", ("kind",))
+llm_answer_seconds = registry.histogram("lolkd_llm_answer_seconds", "Time from starting an LLM answer until it's fully sent", ("source",))
@@ -0,0 +1,62 @@
+import bisect
+
+
+class PlayerNameIndex:
+    """Case-folded prefix and substring lookup over a set of player names, updated in place as players come and go.
+
+    names holds (folded name, name) sorted, so a prefix lookup is a bisect. suffixes holds every proper suffix of
+    every folded name the same way, which turns a substring lookup into a prefix lookup on it (a Riot ID is at most
+    22 characters, so that's a couple dozen entries per player)."""
+
+    def __init__(self, names=()):
+        # built in one sort, adding the names one at a time would shift the lists for every single one
+        self.names: list[tuple[str, str]] = sorted({(name.casefold(), name) for name in names})
+        self.suffixes: list[tuple[str, str]] = sorted((folded[start:], name) for folded, name in self.names
+                                                      for start in range(1, len(folded)))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str) -> None:
+        folded = name.casefold()
+        index = bisect.bisect_left(self.names, (folded, name))
+        if index < len(self.names) and self.names[index] == (folded, name):
+            return
+        self.names.insert(index, (folded, name))
+        for start in range(1, len(folded)):
+            bisect.insort(self.suffixes, (folded[start:], name))
+
+    def remove(self, name: str) -> None:
+        folded = name.casefold()
+        index = bisect.bisect_left(self.names, (folded, name))
+        if index == len(self.names) or self.names[index] != (folded, name):
+            return
+        del self.names[index]
+        for start in range(1, len(folded)):
+            del self.suffixes[bisect.bisect_left(self.suffixes, (folded[start:], name))]
+
+    @staticmethod
+    def _starting_with(entries: list[tuple[str, str]], prefix: str):
+        index = bisect.bisect_left(entries, (prefix,))
+        while index < len(entries) and entries[index][0].startswith(prefix):
+            yield entries[index][1]
+            index += 1
+
+    def search(self, query: str, limit: int = 25) -> list[str]:
+        """Up to limit names containing query (ignoring case), with the ones that start with it first."""
+        query = query.casefold()
+        results = []
+        for name in self._starting_with(self.names, query):
+            if len(results) == limit:
+                return results
+            results.append(name)
+        if not query:
+            return results
+        seen = set(results)
+        for name in self._starting_with(self.suffixes, query):
+            if len(results) == limit:
+                break
+            if name not in seen:
+                seen.add(name)
+                results.append(name)
+        return results
@@ -0,0 +1,121 @@
+import numpy as np
+
+# bump this whenever the scoring changes, since cached LLM responses get the score as a hint
+PERFORMANCE_SCORE_VERSION = 1
+
+# (field in the match data, label) -- the stats every player gets compared on, per minute
+SCORED_STATS = [
+    ("kills", "kills"),
+    ("deaths", "deaths"),
+    ("assists", "assists"),
+    ("cs", "cs"),
+    ("gold", "gold"),
+    ("damage_dealt_to_champions", "damage"),
+    ("vision_score", "vision"),
+    ("damage_healed_and_shielded_to_allies", "healing/shielding"),
+]
+# dying more is worse, everything else is better
+STAT_SIGNS = np.array([1, -1, 1, 1, 1, 1, 1, 1], dtype=np.float64)
+
+ROLES = ["TOP", "JG", "MID", "BOT", "SUPP"]
+# roughly what each role gets per minute in an average game, in SCORED_STATS order -- stats are divided by these
+# before players in different roles get compared, so a support isn't punished for not farming
+ROLE_BASELINES = np.array([
+    [0.20, 0.17, 0.22, 7.0, 400, 750, 0.7, 50],
+    [0.22, 0.18, 0.28, 6.0, 380, 550, 1.1, 60],
+    [0.24, 0.17, 0.24, 7.5, 410, 850, 0.8, 60],
+    [0.26, 0.17, 0.22, 8.0, 420, 850, 0.7, 40],
+    [0.06, 0.20, 0.40, 1.2, 270, 350, 2.2, 350],
+], dtype=np.float64)
+# how much each stat counts for each role, in SCORED_STATS order (the last row is for games without roles)
+ROLE_WEIGHTS = np.array([
+    [1.0, 1.0, 0.6, 1.0, 1.0, 1.0, 0.3, 0.2],
+    [1.0, 1.0, 1.0, 0.7, 1.0, 0.8, 0.6, 0.2],
+    [1.0, 1.0, 0.7, 1.0, 1.0, 1.0, 0.3, 0.2],
+    [1.0, 1.0, 0.6, 1.2, 1.0, 1.2, 0.3, 0.1],
+    [0.4, 1.0, 1.2, 0.1, 0.4, 0.6, 1.2, 1.0],
+    [1.0, 1.0, 1.0, 0.5, 1.0, 1.0, 0.2, 0.5],
+], dtype=np.float64)
+
+# how much the comparison with the lane opponent counts, the rest is the comparison with the whole lobby
+LANE_WEIGHT = 0.5
+# added to the lane comparison's denominator (in baseline units), so 1 kill vs 0 isn't a total stomp
+LANE_FLOOR = 0.5
+# the lobby comparison is a z-score, and a lobby where everyone did about the same shouldn't blow small gaps up
+LOBBY_STD_FLOOR = 0.25
+LOBBY_Z_CLIP = 2.0
+# how much of the team's average gets taken off -- going even on a winning team is worse than it looks
+TEAM_CONTEXT = 0.5
+# how steeply the combined comparison maps onto 0-100
+SCORE_SPREAD = 4.0
+# scores at or above/below these are winning/losing league, anything between is neither
+WINNING_SCORE = 60
+LOSING_SCORE = 40
+
+
+def verdict_for(score: int) -> str:
+    if score >= WINNING_SCORE:
+        return "winning league"
+    if score <= LOSING_SCORE:
+        return "losing league"
+    return "pulling their weight"
+
+
+def score_match(match_data: dict) -> dict[str, dict]:
+    """Scores every player in a match (as stored by get_match_data) at once, comparing their per-minute stats with
+    their lane opponent's and the lobby's after scaling them by what their role usually gets.
+    Returns {player_name: {"score": 0-100, "verdict": ..., "best": stat label, "worst": stat label}},
+    or {} for remakes, which don't say anything about anyone."""
+    players = match_data["players"]
+    if not players or any(player_data["result"] == "drew" for player_data in players.values()):
+        return {}
+    names = list(players)
+    minutes = max(match_data["duration"] / 60, 1)
+    per_minute = np.array([[players[name][field] for field, _ in SCORED_STATS] for name in names], dtype=np.float64) / minutes
+    teams = np.array([players[name]["team"] for name in names])
+    roles = np.array([players[name]["role"] for name in names])
+    role_index = np.array([ROLES.index(role) if role in ROLES else len(ROLES) for role in roles])
+    has_role = role_index < len(ROLES)
+
+    # players without a role (ARAM, arena, ...) get compared with the lobby average instead
+    lobby_mean = per_minute.mean(axis=0)
+    baselines = np.where(has_role[:, None], ROLE_BASELINES[np.clip(role_index, 0, len(ROLES) - 1)], lobby_mean[None, :])
+    normalized = per_minute / np.maximum(baselines, 1e-9)
+
+    # the lobby comparison -- (10, stats), each in [-1, 1]
+    lobby_std = np.maximum(normalized.std(axis=0), LOBBY_STD_FLOOR)
+    lobby = np.clip((normalized - normalized.mean(axis=0)) / lobby_std, -LOBBY_Z_CLIP, LOBBY_Z_CLIP) / LOBBY_Z_CLIP
+
+    # the lane comparison, for players who have a lane opponent (same role, other team)
+    same_team = teams[:, None] == teams[None, :]
+    opponent_mask = (roles[:, None] == roles[None, :]) & has_role[:, None] & ~same_team
+    has_opponent = opponent_mask.any(axis=1)
+    opponent = normalized[opponent_mask.argmax(axis=1)]
+    lane = (normalized - opponent) / (normalized + opponent + LANE_FLOOR)
+    combined = np.where(has_opponent[:, None], LANE_WEIGHT * lane + (1 - LANE_WEIGHT) * lobby, lobby)
+
+    # weighted by what matters for each role, then compared with the rest of the team
+    weights = ROLE_WEIGHTS[role_index]
+    contributions = weights * STAT_SIGNS * combined
+    raw = contributions.sum(axis=1) / weights.sum(axis=1)
+    team_mean = (same_team * raw[None, :]).sum(axis=1) / same_team.sum(axis=1)
+    adjusted = raw - TEAM_CONTEXT * team_mean
+    scores = np.rint(100 / (1 + np.exp(-SCORE_SPREAD * adjusted))).astype(int)
+    best, worst = contributions.argmax(axis=1), contributions.argmin(axis=1)
+
+    performance = {}
+    for i, name in enumerate(names):
+        score = int(scores[i])
+        performance[name] = {
+            "score": score,
+            "verdict": verdict_for(score),
+            "best": SCORED_STATS[best[i]][1],
+            "worst": SCORED_STATS[worst[i]][1],
+        }
+    return performance
+
+
+def performance_hint(performance: dict) -> str:
+    """One line describing a player's score, short enough to go in front of the match table in an LLM prompt"""
+    return (f"local score {performance['score']}/100 ({performance['verdict']}), "
+            f"best: {performance['best']}, worst: {performance['worst']}")
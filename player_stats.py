@@ -0,0 +1,183 @@
+import bisect
+
+# what /leaderboard can rank by -- name -> (label, how it's shown)
+LEADERBOARD_METRICS = {
+    "winrate": ("Winrate", "{:.0%}"),
+    "kda": ("KDA", "{:.2f}"),
+    "deaths_per_game": ("Deaths per game", "{:.1f}"),
+    "damage_per_minute": ("Damage per minute", "{:.0f}"),
+    "gold_per_minute": ("Gold per minute", "{:.0f}"),
+    "games": ("Games", "{:.0f}"),
+}
+# the parts of a player's match data that go into the running sums
+SUMMED_FIELDS = ["kills", "deaths", "assists", "damage", "gold", "seconds"]
+
+
+def game_record(match_data: dict, player_data: dict) -> dict | None:
+    """The small part of a match one player's stats need, or None for remakes (which don't count for anything)."""
+    if player_data["result"] == "drew" or match_data.get("game_end_timestamp") is None:
+        return None
+    return {
+        "game_end_timestamp": match_data["game_end_timestamp"],
+        "won": player_data["result"] == "won",
+        "champion": player_data["champion"],
+        "role": player_data["role"],
+        "kills": player_data["kills"],
+        "deaths": player_data["deaths"],
+        "assists": player_data["assists"],
+        "damage": player_data["damage_dealt_to_champions"],
+        "gold": player_data["gold"],
+        "seconds": match_data["duration"],
+    }
+
+
+class StatTotals:
+    """Running sums over a set of games. Everything is an integer, so adding and later subtracting a game
+    leaves the sums exactly where they were."""
+
+    __slots__ = ["games", "wins", *SUMMED_FIELDS]
+
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        for field in SUMMED_FIELDS:
+            setattr(self, field, 0)
+
+    def add(self, record: dict, sign: int = 1) -> None:
+        self.games += sign
+        self.wins += sign * record["won"]
+        for field in SUMMED_FIELDS:
+            setattr(self, field, getattr(self, field) + sign * record[field])
+
+    def merge(self, other: "StatTotals", sign: int = 1) -> None:
+        self.games += sign * other.games
+        self.wins += sign * other.wins
+        for field in SUMMED_FIELDS:
+            setattr(self, field, getattr(self, field) + sign * getattr(other, field))
+
+    def value(self, metric: str) -> float:
+        minutes = self.seconds / 60 or 1
+        match metric:
+            case "winrate":
+                return self.wins / self.games
+            case "kda":
+                return (self.kills + self.assists) / max(1, self.deaths)
+            case "deaths_per_game":
+                return self.deaths / self.games
+            case "damage_per_minute":
+                return self.damage / minutes
+            case "gold_per_minute":
+                return self.gold / minutes
+            case "games":
+                return self.games
+        raise ValueError(f"Unknown metric: {metric}")
+
+    def summary(self) -> str:
+        if not self.games:
+            return "no games"
+        return (f"{self.games} games, {self.value('winrate'):.0%} winrate, "
+                f"{self.kills / self.games:.1f}/{self.deaths / self.games:.1f}/{self.assists / self.games:.1f} ({self.value('kda'):.2f} KDA), "
+                f"{self.value('damage_per_minute'):.0f} dmg/min, {self.value('gold_per_minute'):.0f} gold/min")
+
+
+class Leaderboard:
+    """Players kept sorted by one metric, highest first, so the top k is a slice. Moving a player is a bisect plus
+    a list insert/delete, which is nothing at the size of a channel."""
+
+    def __init__(self):
+        self.ranking: list[tuple[float, str]] = []
+        self.values: dict[str, float] = {}
+
+    def update(self, player_name: str, value: float | None) -> None:
+        """Sets a player's value, or takes them off the board if value is None."""
+        if (old_value := self.values.pop(player_name, None)) is not None:
+            del self.ranking[bisect.bisect_left(self.ranking, (-old_value, player_name))]
+        if value is not None:
+            self.values[player_name] = value
+            bisect.insort(self.ranking, (-value, player_name))
+
+    def top(self, k: int) -> list[tuple[str, float]]:
+        return [(player_name, -negative_value) for negative_value, player_name in self.ranking[:k]]
+
+
+class PlayerStats:
+    """Rolling stats for every tracked player and channel, kept as running sums: a game is added once when its match
+    is ingested and subtracted once when it falls out of the window, so reading them never rescans any games.
+    Every channel also has a Leaderboard per metric, kept up to date as its players' sums change. Only players with
+    at least min_games games in the window get ranked."""
+
+    def __init__(self, min_games: int = 3):
+        self.min_games = min_games
+        self.totals: dict[str, StatTotals] = {}
+        # player_name -> champion/role -> their sums on it
+        self.by_champion: dict[str, dict[str, StatTotals]] = {}
+        self.by_role: dict[str, dict[str, StatTotals]] = {}
+        self.channel_totals: dict[str, StatTotals] = {}
+        self.channels_of: dict[str, set[str]] = {}
+        # channel_id -> metric -> leaderboard
+        self.leaderboards: dict[str, dict[str, Leaderboard]] = {}
+
+    def add_game(self, player_name: str, record: dict, sign: int = 1) -> None:
+        totals = self.totals.setdefault(player_name, StatTotals())
+        totals.add(record, sign)
+        for splits, key in [(self.by_champion, record["champion"]), (self.by_role, record["role"] or "no role")]:
+            player_splits = splits.setdefault(player_name, {})
+            split = player_splits.setdefault(key, StatTotals())
+            split.add(record, sign)
+            if not split.games:
+                del player_splits[key]
+        if not totals.games:
+            del self.totals[player_name]
+            self.by_champion.pop(player_name, None)
+            self.by_role.pop(player_name, None)
+        for channel_id in self.channels_of.get(player_name, ()):
+            self.channel_totals[channel_id].add(record, sign)
+            self._rank(channel_id, player_name)
+
+    def remove_game(self, player_name: str, record: dict) -> None:
+        self.add_game(player_name, record, -1)
+
+    def add_channel(self, channel_id: str) -> None:
+        """Starts a channel off with empty sums, so a channel nobody has been added to yet still has stats."""
+        self.channel_totals.setdefault(channel_id, StatTotals())
+
+    def join_channel(self, channel_id: str, player_name: str) -> None:
+        channels = self.channels_of.setdefault(player_name, set())
+        if channel_id in channels:
+            return
+        channels.add(channel_id)
+        self.add_channel(channel_id)
+        if player_name in self.totals:
+            self.channel_totals[channel_id].merge(self.totals[player_name])
+        self._rank(channel_id, player_name)
+
+    def leave_channel(self, channel_id: str, player_name: str) -> None:
+        channels = self.channels_of.get(player_name, set())
+        if channel_id not in channels:
+            return
+        channels.discard(channel_id)
+        if not channels:
+            del self.channels_of[player_name]
+        if player_name in self.totals:
+            self.channel_totals[channel_id].merge(self.totals[player_name], -1)
+        for leaderboard in self.leaderboards.get(channel_id, {}).values():
+            leaderboard.update(player_name, None)
+
+    def drop_channel(self, channel_id: str) -> None:
+        for player_name, channels in list(self.channels_of.items()):
+            channels.discard(channel_id)
+            if not channels:
+                del self.channels_of[player_name]
+        self.channel_totals.pop(channel_id, None)
+        self.leaderboards.pop(channel_id, None)
+
+    def _rank(self, channel_id: str, player_name: str) -> None:
+        leaderboards = self.leaderboards.setdefault(channel_id, {metric: Leaderboard() for metric in LEADERBOARD_METRICS})
+        totals = self.totals.get(player_name)
+        ranked = totals is not None and totals.games >= self.min_games
+        for metric, leaderboard in leaderboards.items():
+            leaderboard.update(player_name, totals.value(metric) if ranked else None)
+
+    def top(self, channel_id: str, metric: str, k: int = 10) -> list[tuple[str, float]]:
+        leaderboard = self.leaderboards.get(channel_id, {}).get(metric)
+        return leaderboard.top(k) if leaderboard is not None else []
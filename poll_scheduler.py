@@ -0,0 +1,98 @@
+import heapq
+import itertools
+import time
+
+
+class PollScheduler:
+    """Decides when each tracked player gets polled next, instead of polling everyone every minute.
+
+    Every player has their own interval and next-check time, kept in a min-heap so finding who is due is cheap.
+    - a player who just finished a game is expected to be in another one soon, so they get polled at min_interval
+      around when that next game would end
+    - every poll that finds nothing new outside of that window doubles the interval, up to max_interval
+    - if the intervals add up to more requests per second than request_budget allows, every interval gets stretched
+      by the same factor until they fit"""
+
+    def __init__(self, min_interval: float = 60, max_interval: float = 30 * 60, request_budget: float = 0.5,
+                 backoff_factor: float = 2.0, earliest_next_game_end: float = 18 * 60, active_window: float = 45 * 60):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # requests per second we're willing to spend on polling (the rest of the key's limit is left for match fetches)
+        self.request_budget = request_budget
+        self.backoff_factor = backoff_factor
+        # the soonest another game can end after the last one did (queue + champ select + a 15 minute surrender)
+        self.earliest_next_game_end = earliest_next_game_end
+        # how long after the last game ended we keep polling at min_interval before we start backing off
+        self.active_window = active_window
+        # player_name -> {"interval": ..., "next_check": ..., "active_until": ..., "entry_id": ...}
+        self.players: dict[str, dict] = {}
+        # (next_check, entry_id, player_name) -- entries whose entry_id doesn't match the player's are stale and skipped
+        self.heap: list[tuple[float, int, str]] = []
+        self.entry_ids = itertools.count()
+        # sum of 1 / interval over every player, i.e. the requests per second we'd make without the budget stretch
+        self.total_rate = 0.0
+
+    def _schedule(self, player_name: str, next_check: float) -> None:
+        entry_id = next(self.entry_ids)
+        self.players[player_name]["next_check"] = next_check
+        self.players[player_name]["entry_id"] = entry_id
+        heapq.heappush(self.heap, (next_check, entry_id, player_name))
+
+    def _set_interval(self, player_name: str, interval: float) -> None:
+        player = self.players[player_name]
+        self.total_rate += 1 / interval - 1 / player["interval"]
+        player["interval"] = interval
+
+    def budget_stretch(self) -> float:
+        """How much every interval currently gets multiplied by to stay under the request budget."""
+        return max(1.0, self.total_rate / self.request_budget)
+
+    def sync_players(self, player_names) -> None:
+        """Adds newly tracked players (due right away) and forgets players who aren't tracked anymore."""
+        player_names = set(player_names)
+        now = time.time()
+        for player_name in player_names - self.players.keys():
+            self.players[player_name] = {"interval": self.min_interval, "next_check": now, "active_until": 0.0, "entry_id": -1}
+            self.total_rate += 1 / self.min_interval
+            self._schedule(player_name, now)
+        for player_name in self.players.keys() - player_names:
+            # its heap entry becomes stale and gets skipped when it comes up
+            self.total_rate -= 1 / self.players.pop(player_name)["interval"]
+
+    def pop_due(self, limit: int | None = None) -> list[str]:
+        """Returns the players whose next check time has passed, most overdue first."""
+        now = time.time()
+        due = []
+        while self.heap and self.heap[0][0] <= now and (limit is None or len(due) < limit):
+            _, entry_id, player_name = heapq.heappop(self.heap)
+            player = self.players.get(player_name)
+            if player is not None and player["entry_id"] == entry_id:
+                due.append(player_name)
+        return due
+
+    def record_poll(self, player_name: str, found_new_match: bool, game_end_timestamp: float | None = None) -> None:
+        """Reschedules a player after they've been polled. game_end_timestamp (unix seconds) is when the new match
+        ended, if one was found."""
+        player = self.players.get(player_name)
+        if player is None:
+            return
+        now = time.time()
+        if found_new_match:
+            game_end = game_end_timestamp or now
+            player["active_until"] = game_end + self.active_window
+            self._set_interval(player_name, self.min_interval)
+            # no point polling until another game could possibly have ended
+            self._schedule(player_name, max(now + self.min_interval, game_end + self.earliest_next_game_end))
+            return
+        if now >= player["active_until"]:
+            self._set_interval(player_name, min(player["interval"] * self.backoff_factor, self.max_interval))
+        self._schedule(player_name, now + player["interval"] * self.budget_stretch())
+
+    def record_failure(self, player_name: str) -> None:
+        """Reschedules a player whose poll failed, without touching their interval."""
+        self.postpone(player_name)
+
+    def postpone(self, player_name: str) -> None:
+        """Pushes a player's next check back by their interval, without touching the interval itself."""
+        if player_name in self.players:
+            self._schedule(player_name, time.time() + self.players[player_name]["interval"] * self.budget_stretch())
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+import sys
+from os import getenv
+from typing import Awaitable, Callable
+from auxiliary_functions import print_to_log
+from hash_ring import HashRing
+
+# the pollers and the bot talk over this socket, one JSON object per line
+poller_socket = getenv('POLLER_SOCKET', 'jsons/pollers.sock')
+# a line can hold a whole batch of match data
+IPC_LINE_LIMIT = 2 ** 26
+POLLER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "poller_worker.py")
+# how long to wait before restarting a poller that died
+POLLER_RESTART_DELAY = 5.0
+# what pollers need to know about a player -- the rest of it is the bot's business
+POLLED_PLAYER_FIELDS = ["puuid", "platform", "most_recent_match_id", "last_game_end_timestamp"]
+
+
+def send_line(writer: asyncio.StreamWriter, message: dict) -> None:
+    writer.write(json.dumps(message).encode() + b"\n")
+
+
+class PollerHub:
+    """The bot's end of the poller processes. It starts poller_count of them (restarting any that die), hands each one
+    its share of the players -- partitioned by PUUID on a hash ring -- and passes the new matches they report to
+    on_new_matches(players_with_new_matches, fetched_matches).
+
+    Messages on the socket:
+        poller -> bot: {"type": "hello", "index": ...} once, then {"type": "new_matches", "players_with_new_matches": ..., "matches": ...}
+        bot -> poller: {"type": "players", "players": {player_name: player}} whenever its share changes"""
+
+    def __init__(self, poller_count: int, on_new_matches: Callable[[dict, dict], Awaitable[None]], socket_path: str = poller_socket):
+        self.poller_count = poller_count
+        self.on_new_matches = on_new_matches
+        self.socket_path = socket_path
+        self.ring = HashRing([str(index) for index in range(poller_count)])
+        self.server: asyncio.Server | None = None
+        self.supervisors: list[asyncio.Task] = []
+        # poller index -> its connection, and what it was last told to poll
+        self.connections: dict[int, asyncio.StreamWriter] = {}
+        self.partitions: dict[int, dict[str, dict]] = {index: {} for index in range(poller_count)}
+        # poller index -> {player_name: (puuid, platform)}, to tell whether a share actually changed
+        self.memberships: dict[int, dict[str, tuple]] = {}
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path, limit=IPC_LINE_LIMIT)
+        self.supervisors = [asyncio.create_task(self._supervise(index), name=f"poller-{index}") for index in range(self.poller_count)]
+        print_to_log("INFO", f"Started {self.poller_count} poller process(es) on {self.socket_path}")
+
+    async def stop(self) -> None:
+        for supervisor in self.supervisors:
+            supervisor.cancel()
+        await asyncio.gather(*self.supervisors, return_exceptions=True)
+        self.supervisors = []
+        for writer in self.connections.values():
+            writer.close()
+        self.connections.clear()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _supervise(self, index: int) -> None:
+        # every poller logs to its own files
+        env = {**os.environ, "LOG_FILE_PREFIX": f"poller-{index}_"}
+        while True:
+            process = await asyncio.create_subprocess_exec(sys.executable, POLLER_SCRIPT, str(index), str(self.poller_count), env=env)
+            try:
+                return_code = await process.wait()
+            except asyncio.CancelledError:
+                if process.returncode is None:
+                    process.terminate()
+                    await process.wait()
+                raise
+            print_to_log("ERROR", f"Poller {index} exited with code {return_code}, restarting it in {POLLER_RESTART_DELAY}s")
+            await asyncio.sleep(POLLER_RESTART_DELAY)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        index = None
+        try:
+            hello = json.loads(await reader.readline())
+            index = hello["index"]
+            self.connections[index] = writer
+            print_to_log("INFO", f"Poller {index} connected")
+            # a poller that just (re)started doesn't know who to poll yet
+            send_line(writer, {"type": "players", "players": self.partitions.get(index, {})})
+            await writer.drain()
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message["type"] != "new_matches":
+                    continue
+                try:
+                    await self.on_new_matches(message["players_with_new_matches"], message["matches"])
+                except Exception as e:
+                    # a report that couldn't be handled (discord being down, a storage error, ...) shouldn't cost
+                    # the poller its connection, or its share of the players would stop being announced
+                    print_to_log("ERROR", f"Failed to handle new matches from poller {index}: {e!r}")
+        except (ConnectionError, json.JSONDecodeError, KeyError) as e:
+            print_to_log("ERROR", f"Connection to poller {index} broke: {e!r}")
+        finally:
+            if index is not None and self.connections.get(index) is writer:
+                del self.connections[index]
+            writer.close()
+
+    async def assign(self, players: dict) -> None:
+        """Splits players ({player_name: player}) between the pollers, and tells the ones whose share changed.
+        The high-water marks only matter for players a poller hasn't seen before -- it keeps its own for the rest,
+        since they're ahead of the bot's until the bot has caught up on what the poller reported."""
+        partitions = {index: {} for index in range(self.poller_count)}
+        for player_name, player in players.items():
+            partition = partitions[int(self.ring.node_for(player["puuid"]))]
+            partition[player_name] = {field: player.get(field) for field in POLLED_PLAYER_FIELDS}
+        self.partitions = partitions
+        for index, partition in partitions.items():
+            membership = {player_name: (player["puuid"], player["platform"]) for player_name, player in partition.items()}
+            if membership == self.memberships.get(index) or index not in self.connections:
+                continue
+            writer = self.connections[index]
+            try:
+                send_line(writer, {"type": "players", "players": partition})
+                await writer.drain()
+            except ConnectionError as e:
+                # the poller is being restarted, and gets its share when it says hello again
+                print_to_log("WARNING", f"Could not send poller {index} its players: {e!r}")
+                continue
+            self.memberships[index] = membership
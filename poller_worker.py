@@ -0,0 +1,78 @@
+"""A poller process: polls its share of the tracked players for new matches and reports them to the bot over the
+poller socket (see poller_hub.py), so the bot's event loop only has to deal with discord.
+
+Started by the bot when POLLER_PROCESSES is above 0, as `python poller_worker.py <index> <poller count>`."""
+from riot_functionality import *
+import auxiliary_functions
+import riot_functionality
+import sys
+from poller_hub import IPC_LINE_LIMIT, poller_socket, send_line
+
+
+async def run_poller(index: int, poller_count: int) -> None:
+    # the pollers share one key, so every poller gets an equal slice of its rate limits and of the polling budget
+    # (syncing with the counts Riot sends back only catches up after the requests have been made)
+    auxiliary_functions.rate_limit_share = 1 / poller_count
+    riot_functionality.poll_budget_share = 1 / poller_count
+    # the identities this poller learns from the matches it fetches get saved by the bot, which gets the matches anyway
+    identity_cache.read_only = True
+    await open_http_session(routing_region)
+    reader, writer = await asyncio.open_unix_connection(poller_socket, limit=IPC_LINE_LIMIT)
+    send_line(writer, {"type": "hello", "index": index})
+    await writer.drain()
+    print_to_log("INFO", f"Poller {index}/{poller_count} connected to {poller_socket}")
+    players = {}
+
+    async def receive_players():
+        nonlocal players
+        while line := await reader.readline():
+            message = json.loads(line)
+            if message["type"] != "players":
+                continue
+            # players we already poll keep our own high-water marks, the bot's might not have caught up yet
+            updated_players = {}
+            for player_name, player in message["players"].items():
+                if (known := players.get(player_name)) is not None:
+                    player = {**player, "most_recent_match_id": known["most_recent_match_id"],
+                              "last_game_end_timestamp": known["last_game_end_timestamp"]}
+                updated_players[player_name] = player
+            players = updated_players
+            print_to_log("INFO", f"Now polling {len(players)} player(s)")
+
+    async def poll():
+        while True:
+            if (poll_result := await poll_players(dict(players))) is not None:
+                players_with_new_matches, fetched_matches = poll_result
+                # this process never loads the bot's state, so it remembers what it sent instead -- that's what keeps
+                # the next player in the same game from fetching (and sending) the match all over again
+                remember_reported_matches(fetched_matches)
+                for player_name, match_ids in players_with_new_matches.items():
+                    # only the newest match that was actually fetched moves the high-water mark, like in the bot
+                    fetched_match_ids = [match_id for match_id in match_ids if match_id in reported_matches]
+                    if player_name in players and fetched_match_ids:
+                        players[player_name] = {**players[player_name], "most_recent_match_id": fetched_match_ids[-1],
+                                                "last_game_end_timestamp": known_game_end(fetched_match_ids[-1])}
+                if players_with_new_matches:
+                    send_line(writer, {"type": "new_matches", "players_with_new_matches": players_with_new_matches, "matches": fetched_matches})
+                    await writer.drain()
+            await asyncio.sleep(poll_tick_seconds)
+
+    # the bot closing the socket means it's shutting down, and if either one fails the bot restarts the whole process
+    tasks = [asyncio.create_task(receive_players()), asyncio.create_task(poll())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None:
+                print_to_log("ERROR", f"Poller {index} failed: {task.exception()!r}")
+                raise task.exception()
+        print_to_log("INFO", f"Poller {index} lost the connection to the bot, shutting down")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        writer.close()
+        await close_http_sessions()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_poller(int(sys.argv[1]), int(sys.argv[2])))
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections import deque
+from contextvars import ContextVar
+
+# set to True whenever a request made from the current task had to wait on the rate limiter or got a 429
+# every task spawned by asyncio.gather() gets its own copy of this, so it works as a per-player flag while polling
+was_throttled: ContextVar[bool] = ContextVar("was_throttled", default=False)
+
+
+def parse_rate_limit_header(header_value: str | None) -> list[tuple[int, int]]:
+    """Parses a Riot rate limit header like '20:1,100:120' into a list of (count, seconds) pairs."""
+    if not header_value:
+        return []
+    pairs = []
+    for part in header_value.split(","):
+        try:
+            count, seconds = part.strip().split(":")
+            pairs.append((int(count), int(seconds)))
+        except ValueError:
+            continue
+    return pairs
+
+
+class RateLimitBucket:
+    """A sliding window that allows at most `limit` requests every `window` seconds."""
+
+    def __init__(self, limit: int, window: int):
+        self.limit = limit
+        self.window = window
+        self.timestamps = deque()
+
+    def _drop_expired(self, now: float) -> None:
+        while self.timestamps and now - self.timestamps[0] >= self.window:
+            self.timestamps.popleft()
+
+    def time_until_available(self, now: float) -> float:
+        self._drop_expired(now)
+        if len(self.timestamps) < self.limit:
+            return 0.0
+        return self.window - (now - self.timestamps[0])
+
+    def record(self, now: float) -> None:
+        self.timestamps.append(now)
+
+    def sync_count(self, server_count: int, now: float) -> None:
+        """If Riot says we've used more of this window than we think we have, pad our local count to match."""
+        self._drop_expired(now)
+        while len(self.timestamps) < min(server_count, self.limit):
+            self.timestamps.append(now)
+
+
+def _buckets_from_spec(spec: list[tuple[int, int]], share: float = 1.0) -> list[RateLimitBucket]:
+    return [RateLimitBucket(max(1, int(count * share)), seconds) for count, seconds in spec]
+
+
+class RiotRateLimiter:
+    """Shared limiter for the Riot API which tracks the app-wide bucket and one bucket per method (endpoint).
+    The limits start out as the development key defaults and are corrected from the response headers.
+    Processes that split one key between them each get `share` of every limit, so together they stay under it."""
+
+    def __init__(self, default_app_limits: str = "20:1,100:120", share: float = 1.0):
+        self.share = share
+        self.app_spec = parse_rate_limit_header(default_app_limits)
+        self.app_buckets = _buckets_from_spec(self.app_spec, share)
+        self.method_specs: dict[str, list[tuple[int, int]]] = {}
+        self.method_buckets: dict[str, list[RateLimitBucket]] = {}
+        # set from Retry-After when we get a 429
+        self.app_blocked_until = 0.0
+        self.method_blocked_until: dict[str, float] = {}
+        self.throttle_count = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, method: str) -> None:
+        """Waits until a request to the given method is allowed by every bucket, then reserves a slot for it."""
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                buckets = self.app_buckets + self.method_buckets.get(method, [])
+                wait = max([bucket.time_until_available(now) for bucket in buckets] + [
+                    self.app_blocked_until - now,
+                    self.method_blocked_until.get(method, 0.0) - now,
+                ])
+                if wait <= 0:
+                    for bucket in buckets:
+                        bucket.record(now)
+                    return
+            was_throttled.set(True)
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, method: str, headers) -> None:
+        """Reads the X-App-Rate-Limit and X-Method-Rate-Limit headers (and their -Count counterparts)."""
+        now = time.monotonic()
+        app_spec = parse_rate_limit_header(headers.get("X-App-Rate-Limit"))
+        if app_spec and app_spec != self.app_spec:
+            self.app_spec = app_spec
+            self.app_buckets = _buckets_from_spec(app_spec, self.share)
+        method_spec = parse_rate_limit_header(headers.get("X-Method-Rate-Limit"))
+        if method_spec and method_spec != self.method_specs.get(method):
+            self.method_specs[method] = method_spec
+            self.method_buckets[method] = _buckets_from_spec(method_spec, self.share)
+        self._sync_counts(self.app_buckets, headers.get("X-App-Rate-Limit-Count"), now)
+        self._sync_counts(self.method_buckets.get(method, []), headers.get("X-Method-Rate-Limit-Count"), now)
+
+    @staticmethod
+    def _sync_counts(buckets: list[RateLimitBucket], count_header: str | None, now: float) -> None:
+        counts = {seconds: count for count, seconds in parse_rate_limit_header(count_header)}
+        for bucket in buckets:
+            if bucket.window in counts:
+                bucket.sync_count(counts[bucket.window], now)
+
+    def handle_429(self, method: str, headers) -> float:
+        """Blocks the offending bucket for as long as Retry-After says to, and returns that delay in seconds."""
+        try:
+            retry_after = float(headers.get("Retry-After", 1))
+        except ValueError:
+            retry_after = 1.0
+        blocked_until = time.monotonic() + retry_after
+        # "service" 429s come from the underlying service rather than our key, so only back off that method
+        if headers.get("X-Rate-Limit-Type") == "application":
+            self.app_blocked_until = max(self.app_blocked_until, blocked_until)
+        else:
+            self.method_blocked_until[method] = max(self.method_blocked_until.get(method, 0.0), blocked_until)
+        self.throttle_count += 1
+        was_throttled.set(True)
+        return retry_after
@@ -1,13 +1,143 @@
 from auxiliary_functions import *
+from identity_cache import IdentityCache
+from poll_scheduler import PollScheduler
+from active_games import ActiveGameTracker
+from single_flight import SingleFlight
+from state import state
+from collections import OrderedDict
+from timeline_analysis import MatchTimeline, TimelineCache, analyze_lanes, reduce_timeline
+from performance_score import score_match
 
-riot_api_key = getenv('RIOT_API_KEY')
+# platform (where an account plays, and what match IDs start with) -> the routing region its account/match requests go through
+PLATFORM_ROUTING = {
+    "na1": "americas", "br1": "americas", "la1": "americas", "la2": "americas",
+    "euw1": "europe", "eun1": "europe", "tr1": "europe", "ru": "europe", "me1": "europe",
+    "kr": "asia", "jp1": "asia",
+    "oc1": "sea", "sg2": "sea", "tw2": "sea", "vn2": "sea",
+}
+# the names people know the regions by, for /add_player
+REGION_PLATFORMS = {
+    "NA": "na1", "EUW": "euw1", "EUNE": "eun1", "KR": "kr", "JP": "jp1", "BR": "br1", "LAN": "la1", "LAS": "la2",
+    "OCE": "oc1", "TR": "tr1", "RU": "ru", "ME": "me1", "SG": "sg2", "TW": "tw2", "VN": "vn2",
+}
+# the platform spectator-v5 gets asked on for a routing region's players who were added without one
+ROUTING_DEFAULT_PLATFORMS = {"americas": "na1", "europe": "euw1", "asia": "kr", "sea": "oc1"}
+# players added without a region (and everyone tracked from before regions existed) use these
 routing_region = getenv('ROUTING_REGION')
+default_platform = getenv('DEFAULT_PLATFORM') or ROUTING_DEFAULT_PLATFORMS.get(routing_region)
+# where Riot API requests go, with {region} filled in -- pointed somewhere else for the offline benchmarks
+riot_api_base_url = getenv('RIOT_API_BASE_URL', 'https://{region}.api.riotgames.com')
 riot_ids = getenv('RIOT_IDS').split(',')
+# how many players update_matches_loop polls at the same time (the rate limiter still has the final say)
+poll_concurrency = int(getenv('POLL_CONCURRENCY', '10'))
+# how often update_matches_loop wakes up to poll whoever is due -- each player's own interval is up to poll_scheduler
+poll_tick_seconds = float(getenv('POLL_TICK_SECONDS', '10'))
+# the most missed matches one poll looks back through, and how many of them get announced (the most recent ones)
+match_backfill_limit = int(getenv('MATCH_BACKFILL_LIMIT', '20'))
+max_catch_up_announcements = max(1, int(getenv('MAX_CATCH_UP_ANNOUNCEMENTS', '5')))
+# every routing region has its own poller, with its own scheduler -- the budget is per region, like Riot's rate limits
+poll_schedulers: dict[str, PollScheduler] = {}
+# the fraction of the polling budget this process gets to spend -- poller processes split it between them
+poll_budget_share = 1.0
+# "match_list" polls every player's match list, "spectator" looks up who is in a game right now through spectator-v5
+# and only goes to match-v5 once a game has ended (with the match lists polled every SPECTATOR_FALLBACK_INTERVAL
+# seconds as a safety net, for games that were too short to be seen)
+ingestion_mode = getenv('INGESTION_MODE', 'match_list')
+spectator_fallback_interval = float(getenv('SPECTATOR_FALLBACK_INTERVAL', '3600'))
+# in spectator mode, every platform gets its own scheduler for looking up the players who aren't in a game
+spectator_schedulers: dict[str, PollScheduler] = {}
+active_games = ActiveGameTracker(
+    check_interval=float(getenv('SPECTATOR_GAME_CHECK_INTERVAL', '60')),
+    publish_retry_interval=float(getenv('SPECTATOR_PUBLISH_RETRY_INTERVAL', '20')),
+    publish_window=float(getenv('SPECTATOR_PUBLISH_WINDOW', '600')),
+)
+
+# poller processes don't load the bot's state, so they remember the matches they've already reported here instead
+# (match_id -> its game_end_timestamp, least recently reported first) -- the bot process never fills this
+reported_matches: OrderedDict[str, int | None] = OrderedDict()
+REPORTED_MATCHES_LIMIT = 10000
+
+# Riot ID <-> PUUID, so that each identity only has to be resolved through account-v1 once
+identity_cache = IdentityCache("jsons/identities.json")
+# in-flight match and timeline requests, so the same one is never being made twice at the same time
+single_flight = SingleFlight()
+# reduced match timelines, so each one is only downloaded once no matter how many tracked players were in the game
+timeline_cache = TimelineCache(max_entries=int(getenv('TIMELINE_CACHE_SIZE', '128')))
+
+
+def get_poll_scheduler(region: str) -> PollScheduler:
+    if region not in poll_schedulers:
+        if ingestion_mode == "spectator":
+            # the match lists are only the safety net, so everyone gets polled on the same slow interval
+            min_interval = max_interval = spectator_fallback_interval
+        else:
+            min_interval, max_interval = float(getenv('POLL_MIN_INTERVAL', '60')), float(getenv('POLL_MAX_INTERVAL', '1800'))
+        poll_schedulers[region] = PollScheduler(
+            min_interval=min_interval,
+            max_interval=max_interval,
+            # requests per second the scheduler may spend on polling (a development key allows 100 every 2 minutes in total)
+            request_budget=float(getenv('RIOT_POLL_BUDGET', '0.5')) * poll_budget_share,
+        )
+    return poll_schedulers[region]
+
+
+def get_spectator_scheduler(platform: str) -> PollScheduler:
+    if platform not in spectator_schedulers:
+        spectator_schedulers[platform] = PollScheduler(
+            # a player who just finished a game usually queues up again right away, so they get looked up soon after
+            min_interval=float(getenv('SPECTATOR_MIN_INTERVAL', '60')),
+            max_interval=float(getenv('SPECTATOR_MAX_INTERVAL', '600')),
+            request_budget=float(getenv('RIOT_POLL_BUDGET', '0.5')) * poll_budget_share,
+            earliest_next_game_end=0,
+        )
+    return spectator_schedulers[platform]
+
+
+def is_match_known(match_id: str) -> bool:
+    """Whether a match is already stored (or, in a poller process, already reported), so it doesn't need fetching."""
+    return state.get_match(match_id) is not None or match_id in reported_matches
+
+
+def known_game_end(match_id: str) -> int | None:
+    if (match_data := state.get_match(match_id)) is not None:
+        return match_data.get("game_end_timestamp")
+    return reported_matches.get(match_id)
+
+
+def remember_reported_matches(matches: dict) -> None:
+    """Takes {match_id: match_data} that a poller process just sent to the bot."""
+    for match_id, match_data in matches.items():
+        reported_matches[match_id] = match_data.get("game_end_timestamp")
+        reported_matches.move_to_end(match_id)
+    while len(reported_matches) > REPORTED_MATCHES_LIMIT:
+        reported_matches.popitem(last=False)
+
+
+def riot_url(region: str, path: str) -> str:
+    """region is a routing region (americas, europe, ...) for most endpoints, and a platform (na1, euw1, ...) for
+    the ones served per platform like spectator-v5"""
+    return riot_api_base_url.format(region=region) + path
+
+
+def routing_region_for(platform: str | None) -> str:
+    """The routing region (americas, europe, asia, sea) for a platform, or the default one if there's no platform."""
+    return PLATFORM_ROUTING.get(platform, routing_region) if platform else routing_region
+
+
+def routing_region_for_match(match_id: str) -> str:
+    """Match IDs start with the platform they were played on (e.g. EUW1_1234567890), which decides where to fetch them."""
+    return routing_region_for(match_id.split("_")[0].lower())
+
+
+def account_region_for(platform: str | None) -> str:
+    # account-v1 isn't served from sea, but any of the other regions can look up any account
+    region = routing_region_for(platform)
+    return "asia" if region == "sea" else region
 
 
 # in general, when a function is unable to return a proper output for whatever reason, it will resort to returning None
 
-async def get_puuid_from_riot_id(riot_id) -> str | None:
+async def get_puuid_from_riot_id(riot_id, platform: str | None = None) -> str | None:
     """Gets the unique PUUID for an account using their Riot ID which looks like GameName#TagLine"""
     if len(riot_id.split('#')) == 2:
         game_name, tag_line = riot_id.split('#')
@@ -15,22 +145,29 @@ async def get_puuid_from_riot_id(riot_id) -> str | None:
         print_to_log("WARNING", f"Invalid Riot ID format: {riot_id}. Should be GameName#TagLine")
         print("Invalid Riot ID format, should be GameName#TagLine")
         return None
-    url = f"https://{routing_region}.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}?api_key={riot_api_key}"
-    data = await get_http_response(url)
+    await identity_cache.ensure_loaded()
+    if puuid := identity_cache.get_puuid(riot_id):
+        return puuid
+    region = account_region_for(platform)
+    url = riot_url(region, f"/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}")
+    data = await get_http_response(url, method="account-v1.by-riot-id", region=region)
     if data:
+        identity_cache.put(f"{data['gameName']}#{data['tagLine']}", data["puuid"])
+        await identity_cache.save()
         return data["puuid"]
     else:
         print_to_log("WARNING", f"Could not find PUUID for Riot ID: {riot_id}")
         return None
 
 
-async def get_latest_match_id(puuid):
+async def get_latest_match_id(puuid, platform: str | None = None):
     """Gets the match ID of the most recent match that the player with the specified PUUID played"""
     if puuid is None:
         print_to_log("WARNING", "PUUID is None")
         return None
-    url = f"https://{routing_region}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids?start=0&count=1&api_key={riot_api_key}"
-    data = await get_http_response(url)
+    region = routing_region_for(platform)
+    url = riot_url(region, f"/lol/match/v5/matches/by-puuid/{puuid}/ids?start=0&count=1")
+    data = await get_http_response(url, method="match-v5.ids-by-puuid", region=region)
     if data:
         return data[0]
     else:
@@ -38,10 +175,71 @@ async def get_latest_match_id(puuid):
         return None
 
 
+async def get_match_ids_since(puuid: str, start_time: int, platform: str | None = None, limit: int = 20) -> list[str] | None:
+    """Gets the IDs of the player's matches that started at or after start_time (unix seconds), newest first,
+    paging through up to limit of them. Returns an empty list if there aren't any, and None if a request failed."""
+    region = routing_region_for(platform)
+    match_ids = []
+    while len(match_ids) < limit:
+        # 100 is the most match-v5 returns per page
+        count = min(100, limit - len(match_ids))
+        url = riot_url(region, f"/lol/match/v5/matches/by-puuid/{puuid}/ids?startTime={start_time}&start={len(match_ids)}&count={count}")
+        data = await get_http_response(url, method="match-v5.ids-by-puuid", region=region)
+        if data is None:
+            print_to_log("WARNING", f"Could not get matches since {start_time} for PUUID: {puuid}")
+            return None
+        match_ids += data
+        if len(data) < count:
+            break
+    return match_ids
+
+
+async def get_new_match_ids(player: dict) -> list[str] | None:
+    """Gets the IDs of every match a tracked player has played since their high-water mark (the most recent match we know
+    of and when it ended), newest first -- so games finished between polls or while the bot was down don't get lost.
+    Players without a high-water mark yet just get their latest match. Returns None if polling failed."""
+    last_match_id = player["most_recent_match_id"]
+    last_game_end = player.get("last_game_end_timestamp")
+    if last_game_end is None and last_match_id is not None:
+        # players from before the high-water mark was stored, whose last match is still around
+        last_game_end = known_game_end(last_match_id)
+    if last_game_end is None:
+        latest_match_id = await get_latest_match_id(player["puuid"], player.get("platform"))
+        if latest_match_id is None:
+            return None
+        return [] if latest_match_id == last_match_id else [latest_match_id]
+    # the next game can't have started before the last one ended
+    match_ids = await get_match_ids_since(player["puuid"], last_game_end // 1000, player.get("platform"), match_backfill_limit)
+    if match_ids is not None and last_match_id in match_ids:
+        match_ids = match_ids[:match_ids.index(last_match_id)]
+    return match_ids
+
+
+async def get_active_game(puuid: str, platform: str | None = None) -> dict | None:
+    """Looks up the game a player is in right now through spectator-v5. Returns {"match_id": ..., "puuids": [...]}
+    (the match ID the game will have in match-v5 once it's over, and everyone in it), {} if they aren't in a game,
+    and None if the request failed."""
+    platform = platform or default_platform
+    url = riot_url(platform, f"/lol/spectator/v5/active-games/by-summoner/{puuid}")
+    data = await get_http_response(url, method="spectator-v5.active-games", region=platform, missing_ok=True)
+    if data is None:
+        print_to_log("WARNING", f"Could not look up the active game for PUUID: {puuid}")
+        return None
+    if not data:
+        return {}
+    return {"match_id": f"{data['platformId']}_{data['gameId']}",
+            "puuids": [participant["puuid"] for participant in data["participants"] if participant.get("puuid")]}
+
+
 async def get_match_data(match_id):
+    """Gets the filtered match data for a match. Concurrent calls for the same match share one request."""
+    return await single_flight.do("match-v5.match", match_id, _fetch_match_data, match_id)
+
+
+async def _fetch_match_data(match_id):
     print_to_log("INFO", f"Getting match data for match ID: {match_id}")
-    url = f"https://{routing_region}.api.riotgames.com/lol/match/v5/matches/{match_id}?api_key={riot_api_key}"
-    raw_data = await get_http_response(url)
+    region = routing_region_for_match(match_id)
+    raw_data = await get_http_response(riot_url(region, f"/lol/match/v5/matches/{match_id}"), method="match-v5.match", region=region)
     if not raw_data:
         print_to_log("WARNING", f"Could not get match data for match ID: {match_id}")
         return None
@@ -51,14 +249,21 @@ async def get_match_data(match_id):
         490: "Quickplay", 700: "SR Clash", 720: "ARAM Clash", 900: "ARURF", 1700: "Arena",
         1710: "Arena", 1900: "Pick URF", 2400: "ARAM: Mayhem"
     }
-    filtered_data["queue_type"] = queue_types[raw_data["info"]["queueId"]]
+    # custom games, co-op vs AI, Swiftplay and whatever queues come out next don't need their own names
+    filtered_data["queue_type"] = queue_types.get(raw_data["info"]["queueId"], "Other")
     filtered_data["duration"] = raw_data["info"]["gameDuration"]
+    # in milliseconds since the epoch
+    filtered_data["game_end_timestamp"] = raw_data["info"].get("gameEndTimestamp")
     filtered_data["players"] = {}
+    await identity_cache.ensure_loaded()
     for player in raw_data["info"]["participants"]:
         player_name = player["riotIdGameName"] + "#" + player["riotIdTagline"]
         filtered_data["players"][player_name] = {}
-        puuid = await get_puuid_from_riot_id(player_name)
+        # the match payload already has every participant's puuid, so there's no need to look them up one by one
+        puuid = player["puuid"]
         filtered_data["players"][player_name]["puuid"] = puuid
+        # and since we got the name <-> puuid pair for free, remember it
+        identity_cache.put(player_name, puuid)
         if player["teamId"] == 100:
             filtered_data["players"][player_name]["team"] = "blue"
         else:
@@ -150,27 +355,290 @@ async def get_match_data(match_id):
         filtered_data["players"][player_name]["damage_healed_and_shielded_to_allies"] = player["totalDamageShieldedOnTeammates"] + player["totalHealsOnTeammates"]
         filtered_data["players"][player_name]["vision_score"] = player["visionScore"]
         # IS THIS ALL THE INFORMATION WE NEED? WHAT DO YOU THINK?
+    # scored once here for all ten players, so the KDA message and /investigate_player have a verdict right away
+    for player_name, performance in score_match(filtered_data).items():
+        filtered_data["players"][player_name]["performance"] = performance
+    await identity_cache.save()
     return filtered_data
 
 
-async def get_relevant_information_from_match_so_ai_can_determine_winning_or_losing_league(player_name: str) -> dict | None:
-    """Gets the KDA of the player with the specified PUUID in their most recent match, returned as a dictionary with keys 'kills', 'deaths', 'assists'"""
+# ---------- polling (shared by update_matches_loop and the poller processes) ----------
+
+async def poll_region(region: str, player_names: list[str], players: dict) -> tuple[dict, dict, dict]:
+    """Polls one region's due players for the matches they've played since the last poll and fetches those matches,
+    all concurrently -- the semaphore bounds how many requests are in flight at once, and the region's rate limiter
+    makes sure we stay under Riot's limits.
+    Returns ({player_name: new match IDs newest first, or None if polling failed},
+             {player_name: the new match IDs that get announced, oldest first}, {match_id: match_data})."""
+    poll_semaphore = asyncio.Semaphore(poll_concurrency)
+    tick_summary = {"polled": 0, "throttled": 0, "failed": 0}
+
+    async def poll_player(player_name: str) -> list[str] | None:
+        async with poll_semaphore:
+            was_throttled.set(False)
+            try:
+                new_match_ids = await get_new_match_ids(players[player_name])
+            except Exception as e:
+                print_to_log("ERROR", f"Error while polling player {player_name}: {e}")
+                new_match_ids = None
+            tick_summary["polled"] += 1
+            if was_throttled.get():
+                tick_summary["throttled"] += 1
+            if new_match_ids is None:
+                # only this player gets skipped, everyone else still gets polled
+                tick_summary["failed"] += 1
+                print_to_log("WARNING", f"Failed to get match IDs for player {player_name}, skipping...")
+            return new_match_ids
+
+    poll_results = dict(zip(player_names, await asyncio.gather(*(poll_player(player_name) for player_name in player_names))))
+
+    players_with_new_matches = {}
+    for player_name, new_match_ids in poll_results.items():
+        if not new_match_ids:
+            continue
+        print_to_log("INFO", f"Player {player_name} has {len(new_match_ids)} new match(es), the latest has ID: {new_match_ids[0]}")
+        print_to_log("INFO", f"Their previous most recent match had ID {players[player_name]['most_recent_match_id']}")
+        if len(new_match_ids) > max_catch_up_announcements:
+            # after a long outage, nobody wants a wall of KDA messages
+            print_to_log("WARNING", f"Only announcing the latest {max_catch_up_announcements} of {player_name}'s {len(new_match_ids)} new matches")
+        # oldest first, so they get announced in the order they were played
+        players_with_new_matches[player_name] = [str(match_id) for match_id in reversed(new_match_ids[:max_catch_up_announcements])]
+
+    # several tracked players can be in the same game, so each new match is only fetched once
+    candidate_match_ids = {match_id for match_ids in players_with_new_matches.values() for match_id in match_ids}
+    new_match_ids = [match_id for match_id in candidate_match_ids if not is_match_known(match_id)]
+
+    async def fetch_match(match_id: str) -> dict | None:
+        async with poll_semaphore:
+            try:
+                return await get_match_data(match_id)
+            except Exception as e:
+                # one broken match only costs the players in it this tick, not everyone else's
+                print_to_log("ERROR", f"Error while fetching match {match_id}: {e}")
+                return None
+
+    fetched_matches = await asyncio.gather(*(fetch_match(match_id) for match_id in new_match_ids))
+    print_to_log("INFO", f"Tick summary for {region} -- polled: {tick_summary['polled']}, throttled: {tick_summary['throttled']}, "
+                         f"failed: {tick_summary['failed']}, new matches: {len(new_match_ids)}, "
+                         f"duplicate fetches saved so far: {single_flight.coalesced_total()}")
+    return poll_results, players_with_new_matches, {match_id: match_data for match_id, match_data in zip(new_match_ids, fetched_matches) if match_data}
+
+
+async def poll_due_players(players: dict) -> tuple[dict, dict] | None:
+    """Polls every player who is due (according to their region's poll scheduler) for new matches, and records how it
+    went on the schedulers. players is {player_name: player}, the ones that can be polled.
+    Returns ({player_name: their new match IDs to announce, oldest first}, {match_id: match_data}),
+    or None if nobody was due."""
+    # one poller per routing region, each with its own scheduler, rate limiter and connection pool,
+    # so a region that's being throttled doesn't hold the others up
+    players_by_region = {}
+    for player_name, player in players.items():
+        players_by_region.setdefault(routing_region_for(player.get("platform")), []).append(player_name)
+    due_by_region = {}
+    for region in poll_schedulers.keys() | players_by_region.keys():
+        scheduler = get_poll_scheduler(region)
+        # players who moved to another region get dropped by their old region's scheduler here
+        scheduler.sync_players(players_by_region.get(region, []))
+        if due := scheduler.pop_due():
+            due_by_region[region] = due
+    if not due_by_region:
+        return None
+    metrics.players_polled_per_tick.observe(sum(len(player_names) for player_names in due_by_region.values()))
+    print_to_log("INFO", "Checking " + ", ".join(f"{len(names)} player(s) in {region}" for region, names in due_by_region.items())
+                 + " for new matches...")
+
+    region_results = await asyncio.gather(*(poll_region(region, player_names, players) for region, player_names in due_by_region.items()))
+    poll_results, players_with_new_matches, fetched_matches = {}, {}, {}
+    for region_poll_results, region_new_matches, region_fetched_matches in region_results:
+        poll_results.update(region_poll_results)
+        players_with_new_matches.update(region_new_matches)
+        fetched_matches.update(region_fetched_matches)
+
+    # active players get polled again around when their next game should end, idle ones less and less often
+    for region, player_names in due_by_region.items():
+        scheduler = get_poll_scheduler(region)
+        for player_name in player_names:
+            if poll_results[player_name] is None:
+                scheduler.record_failure(player_name)
+            elif player_name in players_with_new_matches:
+                newest_match_id = players_with_new_matches[player_name][-1]
+                if (match_data := fetched_matches.get(newest_match_id)) is not None:
+                    game_end_timestamp = match_data.get("game_end_timestamp")
+                else:
+                    game_end_timestamp = known_game_end(newest_match_id)
+                scheduler.record_poll(player_name, True, game_end_timestamp / 1000 if game_end_timestamp else None)
+            else:
+                scheduler.record_poll(player_name, False)
+    return players_with_new_matches, fetched_matches
+
+
+async def poll_active_games(players: dict) -> tuple[dict, dict] | None:
+    """The spectator mode version of poll_due_players: looks up whoever is due through spectator-v5 (the players who
+    aren't in a game on their own schedule, the running games through one of their tracked players), fetches the
+    matches of the games that ended, and polls the match lists of whoever is due for the fallback.
+    Returns the same as poll_due_players, or None if there was nothing to do."""
+    active_games.sync_players(players.keys())
+    tracked_puuids = {player["puuid"]: player_name for player_name, player in players.items()}
+    players_by_platform = {}
+    for player_name, player in players.items():
+        players_by_platform.setdefault(player.get("platform") or default_platform, []).append(player_name)
+    due_lookups = []
+    for platform in spectator_schedulers.keys() | players_by_platform.keys():
+        scheduler = get_spectator_scheduler(platform)
+        scheduler.sync_players(players_by_platform.get(platform, []))
+        for player_name in scheduler.pop_due():
+            if active_games.in_game(player_name):
+                # players in a game get looked up through their game until it ends
+                scheduler.postpone(player_name)
+            else:
+                due_lookups.append(player_name)
+    due_checks = active_games.due_checks()
+
+    lookup_semaphore = asyncio.Semaphore(poll_concurrency)
+
+    async def look_up(player_name: str) -> dict | None:
+        async with lookup_semaphore:
+            player = players[player_name]
+            try:
+                return await get_active_game(player["puuid"], player.get("platform"))
+            except Exception as e:
+                print_to_log("ERROR", f"Error while looking up the active game of player {player_name}: {e}")
+                return None
+
+    lookup_names = due_lookups + [player_name for _, player_name in due_checks]
+    lookups = dict(zip(lookup_names, await asyncio.gather(*(look_up(player_name) for player_name in lookup_names))))
+
+    def players_in(game: dict) -> list[str]:
+        return [tracked_puuids[puuid] for puuid in game["puuids"] if puuid in tracked_puuids]
+
+    def ended(match_id: str) -> None:
+        # everyone who just finished a game is likely to start another one soon
+        for player_name in active_games.end(match_id):
+            if player_name in players:
+                get_spectator_scheduler(players[player_name].get("platform") or default_platform).record_poll(player_name, True)
+
+    for match_id, player_name in due_checks:
+        game = lookups[player_name]
+        if game is None:
+            active_games.still_running(match_id)
+        elif game.get("match_id") == match_id:
+            active_games.still_running(match_id)
+        else:
+            ended(match_id)
+            if game:
+                active_games.start(game["match_id"], players_in(game) or [player_name])
+    for player_name in due_lookups:
+        scheduler = get_spectator_scheduler(players[player_name].get("platform") or default_platform)
+        game = lookups[player_name]
+        if game is None:
+            scheduler.record_failure(player_name)
+        elif game:
+            # teammates who are tracked too come along, so none of them need their own lookups for this game
+            active_games.start(game["match_id"], players_in(game) or [player_name])
+            scheduler.postpone(player_name)
+        else:
+            scheduler.record_poll(player_name, False)
+
+    # the games that ended get their matches fetched, which fails until match-v5 has published them
+    due_fetches = active_games.due_fetches()
+
+    async def fetch_match(match_id: str) -> dict | None:
+        async with lookup_semaphore:
+            try:
+                return await get_match_data(match_id)
+            except Exception as e:
+                print_to_log("ERROR", f"Error while fetching the match of ended game {match_id}: {e}")
+                return None
+
+    # matches we already have (the fallback might have gotten to them first) don't need fetching or sending again
+    to_fetch = [match_id for match_id in due_fetches if not is_match_known(match_id)]
+    fetched = dict(zip(to_fetch, await asyncio.gather(*(fetch_match(match_id) for match_id in to_fetch))))
+    players_with_new_matches, fetched_matches = {}, {}
+    for match_id in due_fetches:
+        match_data = fetched.get(match_id)
+        published = match_data is not None or match_id not in fetched
+        player_names = active_games.record_fetch(match_id, published)
+        if not published:
+            if player_names is None and match_id not in active_games.games:
+                print_to_log("WARNING", f"Gave up waiting for match {match_id} to be published, the match list fallback will pick it up")
+            continue
+        if match_data is not None:
+            fetched_matches[match_id] = match_data
+            game_end_timestamp = match_data.get("game_end_timestamp")
+        else:
+            game_end_timestamp = known_game_end(match_id)
+        for player_name in player_names or ():
+            player = players.get(player_name)
+            if player is None or (player.get("last_game_end_timestamp") or 0) >= (game_end_timestamp or 0):
+                continue
+            players_with_new_matches[player_name] = [match_id]
+    if due_lookups or due_checks or due_fetches:
+        print_to_log("INFO", f"Looked up {len(due_lookups)} player(s) and {len(due_checks)} running game(s), "
+                             f"fetched {len(fetched_matches)} of {len(due_fetches)} ended game(s) -- {len(active_games)} game(s) tracked")
+
+    fallback_result = await poll_due_players(players)
+    if fallback_result is not None:
+        fallback_new_matches, fallback_fetched_matches = fallback_result
+        fetched_matches.update(fallback_fetched_matches)
+        for player_name, match_ids in fallback_new_matches.items():
+            merged = set(match_ids) | set(players_with_new_matches.get(player_name, []))
+            # oldest first, since the last one becomes the high-water mark
+            players_with_new_matches[player_name] = sorted(merged, key=lambda match_id: (fetched_matches[match_id].get("game_end_timestamp") if match_id in fetched_matches else known_game_end(match_id)) or 0)
+    elif not (due_lookups or due_checks or due_fetches):
+        return None
+    return players_with_new_matches, fetched_matches
+
+
+async def poll_players(players: dict) -> tuple[dict, dict] | None:
+    """Polls for new matches the way INGESTION_MODE says to (see poll_due_players and poll_active_games)"""
+    if ingestion_mode == "spectator":
+        return await poll_active_games(players)
+    return await poll_due_players(players)
+
+
+def find_player_in_match(match_data: dict, player_name: str, puuid: str | None) -> tuple[str, dict] | None:
+    """Finds a tracked player's entry in the match data. Looks them up by name first, then by PUUID in case
+    they renamed their account since they were added. Returns (name in the match, player data)."""
+    if player_name in match_data["players"]:
+        return player_name, match_data["players"][player_name]
+    # a renamed player's current name is usually in the identity cache already, since ingesting a match puts
+    # every participant's name <-> puuid pair in it
+    if puuid and (current_name := identity_cache.get_riot_id(puuid)) is not None:
+        if (player_data := match_data["players"].get(current_name)) is not None and player_data["puuid"] == puuid:
+            return current_name, player_data
+    for name_in_match, player_data in match_data["players"].items():
+        if puuid and player_data["puuid"] == puuid:
+            return name_in_match, player_data
+    return None
+
+
+def player_performance(match_data: dict, name_in_match: str) -> dict | None:
+    """A player's local performance score (see score_match), or None for remakes. Matches stored before scores
+    existed get scored on the spot."""
+    player_data = match_data["players"][name_in_match]
+    if "performance" not in player_data:
+        return score_match(match_data).get(name_in_match)
+    return player_data["performance"]
+
+
+async def get_relevant_information_from_match_so_ai_can_determine_winning_or_losing_league(player_name: str, match_id: str | None = None) -> dict | None:
+    """Gets the KDA of the player with the specified PUUID in the given match (their most recent one by default), returned as a dictionary with keys 'kills', 'deaths', 'assists'"""
     try:
-        players = await read_json_file("jsons/players.json")
-        matches = await read_json_file("jsons/matches.json")
-        puuid = players[player_name]["puuid"]
-        match_id = players[player_name]["most_recent_match_id"]
-        match_data = matches[match_id]
-        player_data = match_data["players"][player_name]
+        player = state.get_player(player_name)
+        puuid = player["puuid"]
+        match_id = match_id or player["most_recent_match_id"]
+        match_data = state.get_match(match_id)
+        found = find_player_in_match(match_data, player_name, puuid)
+        if found is None:
+            print_to_log("WARNING", f"Could not find {player_name} in match {match_id}")
+            return None
+        name_in_match, player_data = found
+        if name_in_match != player_name:
+            print_to_log("INFO", f"{player_name} is now known as {name_in_match}")
         sided = ""
         if match_data["queue_type"] in ["Draft Pick", "Ranked Solo/Duo", "Ranked Flex", "Quickplay", "SR Clash"]:
             if player_data["role"] in ["TOP", "BOT"]:
-                jungle_player_puuid = None
-                for player_name in match_data["players"]:
-                    if match_data["players"][player_name]["team"] == player_data["team"] and match_data["players"][player_name]["role"] == "JG":
-                        jungle_player_puuid = match_data["players"][player_name]["puuid"]
-                top_or_bot = "TOP" if player_data["role"] == "TOP" else "BOT"
-                sided = await calc_weakside(match_id, jungle_player_puuid, top_or_bot)
+                sided = await calc_weakside(match_id, match_data, player_data["puuid"])
         team = player_data['team']
         role = player_data['role']
         opponent = ""
@@ -186,55 +654,70 @@ async def get_relevant_information_from_match_so_ai_can_determine_winning_or_los
             'kills': player_data['kills'],
             'deaths': player_data['deaths'],
             'assists': player_data['assists'],
-            'sided': sided
+            'sided': sided,
+            'performance': player_performance(match_data, name_in_match)
         }
     except (TypeError, KeyError) as e:
         print_to_log("ERROR", f"error in getting important match data: {e}")
         return None
 
 
-async def find_jungle_positions(match_id, jungle_player_puuid):
-    if not jungle_player_puuid:
-        print_to_log("WARNING", f"No jungle_player_puuid was provided for match ID: {match_id}")
+async def get_match_timeline(match_id: str) -> MatchTimeline | None:
+    """Gets the reduced timeline for a match, only downloading it the first time it's needed"""
+    if (timeline := timeline_cache.get(match_id)) is not None:
+        return timeline
+    # if this match's timeline is already being downloaded, wait for that download instead of starting another
+    return await single_flight.do("match-v5.timeline", match_id, _fetch_match_timeline, match_id)
+
+
+async def _fetch_match_timeline(match_id: str) -> MatchTimeline | None:
+    region = routing_region_for_match(match_id)
+    data = await get_http_response(riot_url(region, f"/lol/match/v5/matches/{match_id}/timeline"), method="match-v5.timeline", region=region)
+    if not data:
+        print_to_log("WARNING", f"Could not get timeline data for match ID: {match_id}")
         return None
     try:
-        url = f"https://{routing_region}.api.riotgames.com/lol/match/v5/matches/{match_id}/timeline?api_key={riot_api_key}"
-        data = await get_http_response(url)
-        if data:
-            info = data['info']
-        else:
-            print_to_log("WARNING", f"Could not get timeline data for match ID: {match_id}")
-            return None
+        timeline = reduce_timeline(data)
+    except (KeyError, TypeError) as e:
+        print_to_log("ERROR", f"error in reducing timeline for match ID {match_id}: {e}")
+        return None
+    if timeline is None:
+        print_to_log("WARNING", f"Timeline for match ID {match_id} has no frames")
+        return None
+    timeline_cache.put(match_id, timeline)
+    return timeline
 
-        players = info['participants']
-        jg_participant_id = next((str(p['participantId']) for p in players if p['puuid'] == jungle_player_puuid))
 
-        # limit to 20 (approx when laning phase ends)
-        return [
-            list(frame['participantFrames'][jg_participant_id]['position'].values())
-            for frame in info['frames'][:21]
-        ]
-    except (StopIteration, KeyError, TypeError) as e:
-        print_to_log("ERROR", f"error in finding jungle positions: {e}")
+async def get_lane_analysis(match_id: str, match_data: dict) -> dict[str, dict] | None:
+    """Gets the jungle side/proximity and lane lead metrics (see analyze_lanes) for all ten players in a match,
+    keyed by PUUID. They're all computed in one go, so every tracked player in the same game shares one timeline fetch."""
+    if (analysis := timeline_cache.analyses.get(match_id)) is not None:
+        return analysis
+    timeline = await get_match_timeline(match_id)
+    if timeline is None:
+        return None
+    players_by_puuid = {player_data["puuid"]: player_data for player_data in match_data["players"].values()}
+    try:
+        teams = [players_by_puuid[puuid]["team"] for puuid in timeline.puuids]
+        roles = [players_by_puuid[puuid]["role"] for puuid in timeline.puuids]
+    except KeyError as e:
+        print_to_log("ERROR", f"timeline and match data disagree on participants for match ID {match_id}: {e}")
         return None
+    analysis = analyze_lanes(timeline, teams, roles)
+    if analysis is None:
+        return None
+    timeline_cache.analyses[match_id] = analysis
+    return analysis
 
 
-async def calc_weakside(match_id: int, jungle_player_puuid: str, top_or_bot: str) -> str | None:
-    positions = await find_jungle_positions(match_id, jungle_player_puuid)
-    if not positions:
+async def calc_weakside(match_id: str, match_data: dict, puuid: str) -> str | None:
+    analysis = await get_lane_analysis(match_id, match_data)
+    if not analysis or puuid not in analysis or analysis[puuid]["strongsided"] is None:
         print_to_log("WARNING", f"Could not find calculate weakside for match ID: {match_id}")
         return None
 
-    total = len(positions)
-    topside, botside = 0, 0
-    for x, y in positions:
-        if y >= 5000 and y > x and x <= 10000:
-            topside += 1
-        elif x >= 5000 and x > y and y <= 10000:
-            botside += 1
-
-    top_p, bot_p = round((topside / total) * 100, 2), round((botside / total) * 100, 2)
+    player_metrics = analysis[puuid]
+    top_p, bot_p = player_metrics["jungle_top_p"], player_metrics["jungle_bot_p"]
     print_to_log("INFO", f"top_p: {top_p}, bot_p: {bot_p}")
-    strongsided = (top_or_bot == "TOP" and topside >= botside) or (top_or_bot == "BOT" and botside >= topside)
-    side_str = f"**strongsided** ({max(top_p, bot_p)}% jungle proximity)" if strongsided else f"**weaksided** ({min(top_p, bot_p)}% jungle proximity)"
+    side_str = f"**strongsided** ({max(top_p, bot_p)}% jungle proximity)" if player_metrics["strongsided"] else f"**weaksided** ({min(top_p, bot_p)}% jungle proximity)"
     return f"They were {side_str}. "
@@ -0,0 +1,44 @@
+import asyncio
+from collections import defaultdict
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same resource: while a call for a key is in flight,
+    everyone else asking for that key awaits the same result instead of making their own request.
+    Keys look like (endpoint, id), and the counters are kept per endpoint."""
+
+    def __init__(self):
+        self.in_flight: dict[tuple[str, str], asyncio.Future] = {}
+        # endpoint -> {"calls": requests actually made, "coalesced": duplicate calls that were saved}
+        self.counters: dict[str, dict[str, int]] = defaultdict(lambda: {"calls": 0, "coalesced": 0})
+
+    async def do(self, endpoint: str, key: str, coroutine_function, *args):
+        """Returns coroutine_function(*args), unless a call for (endpoint, key) is already running,
+        in which case it returns that call's result."""
+        flight_key = (endpoint, key)
+        if (future := self.in_flight.get(flight_key)) is not None:
+            self.counters[endpoint]["coalesced"] += 1
+            # shielded so that one caller getting cancelled doesn't cancel the result everyone else is waiting on
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[flight_key] = future
+        self.counters[endpoint]["calls"] += 1
+        try:
+            result = await coroutine_function(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # marks the exception as retrieved, so asyncio doesn't complain when nobody else was waiting on it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self.in_flight.pop(flight_key, None)
+
+    def coalesced_total(self) -> int:
+        return sum(counter["coalesced"] for counter in self.counters.values())
@@ -0,0 +1,394 @@
+import asyncio
+import heapq
+from collections import Counter
+from os import getenv
+from auxiliary_functions import print_to_log
+from storage import repository
+from name_index import PlayerNameIndex
+from player_stats import PlayerStats
+
+COLLECTIONS = ["channels", "players", "matches", "message_ids", "player_games"]
+# how often (in seconds) the changes made in memory get written to the database
+state_flush_interval = float(getenv('STATE_FLUSH_SECONDS', '10'))
+# how long KDA messages are remembered (after that, the bot can't talk about them anymore)
+message_retention_days = float(getenv('MESSAGE_RETENTION_DAYS', '7'))
+# how long after its game ended a match nobody points to anymore is kept around before it's deleted
+orphaned_match_grace_hours = float(getenv('ORPHANED_MATCH_GRACE_HOURS', '24'))
+# how far back /stats and /leaderboard look, and how many games a player needs in that window to be on a leaderboard
+stats_window_days = float(getenv('STATS_WINDOW_DAYS', '7'))
+leaderboard_min_games = int(getenv('LEADERBOARD_MIN_GAMES', '3'))
+
+
+class BotState:
+    """Process-wide copy of everything in the database, loaded once at startup and served from memory.
+    Every change marks the keys it touched as dirty, and flush() writes all of them to the database in one
+    transaction (on an interval and at shutdown), so reads never touch the disk and writes get batched.
+
+    None of the methods await anything, so each one is atomic as far as the event loop is concerned.
+    The dicts handed out by the getters are the live ones -- read them, but change them through the methods.
+    Match data is treated as immutable once it has been stored.
+
+    Matches are reference counted -- every player's most recent match and every KDA message's match counts as a
+    reference -- and matches that drop to zero references get collected by collect_orphaned_matches.
+    Messages are kept in a heap ordered by when they were sent, so expiring them only looks at the expired ones.
+    Every channel also has a name index of its players, for autocomplete.
+    Every tracked player's games from the last stats_window_days are kept too (as small records, see player_stats.py),
+    with their rolling stats as running sums that get updated as games come in and expire out of another heap."""
+
+    def __init__(self):
+        self.channels: dict[str, dict] = {}
+        self.players: dict[str, dict] = {}
+        self.matches: dict[str, dict] = {}
+        self.message_ids: dict[str, dict] = {}
+        # (player_name, match_id) -> the game's record for the player's stats
+        self.player_games: dict[tuple[str, str], dict] = {}
+        # match_id -> how many players/messages point to it
+        self.match_references: Counter[str] = Counter()
+        # matches that have had no references at some point, checked by collect_orphaned_matches
+        self.orphan_candidates: set[str] = set()
+        # (game_end_timestamp, match_id) for every orphan candidate, the ones that can be collected first
+        self.orphan_heap: list[tuple[int, str]] = []
+        # (datetime_sent, message_id), oldest first -- entries for messages that are gone by now get skipped when popped
+        self.message_expiry_heap: list[tuple[str, str]] = []
+        # channel_id -> the names of the players in it
+        self.name_indexes: dict[str, PlayerNameIndex] = {}
+        # (game_end_timestamp, player_name, match_id), oldest first
+        self.game_expiry_heap: list[tuple[int, str, str]] = []
+        self.stats = PlayerStats(leaderboard_min_games)
+        self.loaded = False
+        self.cleared = False
+        self.dirty: dict[str, set[str]] = {collection: set() for collection in COLLECTIONS}
+        self.deleted: dict[str, set[str]] = {collection: set() for collection in COLLECTIONS}
+        self._flush_lock = asyncio.Lock()
+
+    async def load(self) -> None:
+        if self.loaded:
+            return
+        everything = await repository.load_everything()
+        self.channels = everything["channels"]
+        self.players = everything["players"]
+        self.matches = everything["matches"]
+        self.message_ids = everything["message_ids"]
+        self.player_games = everything["player_games"]
+        self._rebuild_indexes()
+        self.loaded = True
+        print_to_log("INFO", f"Loaded {len(self.channels)} channels, {len(self.players)} players, "
+                             f"{len(self.matches)} matches, {len(self.message_ids)} message IDs and {len(self.player_games)} games into memory")
+
+    def _mark_dirty(self, collection: str, key: str) -> None:
+        self.dirty[collection].add(key)
+        self.deleted[collection].discard(key)
+
+    def _mark_deleted(self, collection: str, key: str) -> None:
+        self.deleted[collection].add(key)
+        self.dirty[collection].discard(key)
+
+    def _rebuild_indexes(self) -> None:
+        self.match_references = Counter()
+        for player in self.players.values():
+            self._reference_match(player["most_recent_match_id"])
+        for message in self.message_ids.values():
+            self._reference_match(message["match_id"])
+        self.orphan_candidates = set()
+        self.orphan_heap = []
+        for match_id in self.matches:
+            if not self.match_references[match_id]:
+                self._add_orphan_candidate(match_id)
+        self.message_expiry_heap = [(message["datetime_sent"], message_id) for message_id, message in self.message_ids.items()]
+        heapq.heapify(self.message_expiry_heap)
+        self.name_indexes = {channel_id: PlayerNameIndex(channel["players"]) for channel_id, channel in self.channels.items()}
+        self.stats = PlayerStats(leaderboard_min_games)
+        for channel_id, channel in self.channels.items():
+            self.stats.add_channel(channel_id)
+            for player_name in channel["players"]:
+                self.stats.join_channel(channel_id, player_name)
+        for (player_name, match_id), game in self.player_games.items():
+            self.stats.add_game(player_name, game)
+        self.game_expiry_heap = [(game["game_end_timestamp"], player_name, match_id) for (player_name, match_id), game in self.player_games.items()]
+        heapq.heapify(self.game_expiry_heap)
+
+    def _reference_match(self, match_id: str | None) -> None:
+        if match_id is not None:
+            self.match_references[match_id] += 1
+
+    def _dereference_match(self, match_id: str | None) -> None:
+        if match_id is None:
+            return
+        self.match_references[match_id] -= 1
+        if self.match_references[match_id] <= 0:
+            del self.match_references[match_id]
+            self._add_orphan_candidate(match_id)
+
+    def _add_orphan_candidate(self, match_id: str) -> None:
+        if match_id in self.orphan_candidates or (match_data := self.matches.get(match_id)) is None:
+            return
+        self.orphan_candidates.add(match_id)
+        # matches stored before game_end_timestamp existed count as ended long ago
+        heapq.heappush(self.orphan_heap, (match_data.get("game_end_timestamp") or 0, match_id))
+
+    def has_unsaved_changes(self) -> bool:
+        return self.cleared or any(self.dirty.values()) or any(self.deleted.values())
+
+    # ---------- channels ----------
+
+    def get_channels(self) -> dict:
+        return self.channels
+
+    def get_channel(self, channel_id: str) -> dict | None:
+        return self.channels.get(channel_id)
+
+    def add_channel(self, channel_id: str, name: str) -> bool:
+        """Registers a channel, returning False if it was already registered."""
+        if channel_id in self.channels:
+            return False
+        self.channels[channel_id] = {"name": name, "players": []}
+        self.name_indexes[channel_id] = PlayerNameIndex()
+        self.stats.add_channel(channel_id)
+        self._mark_dirty("channels", channel_id)
+        return True
+
+    def remove_channel(self, channel_id: str) -> list[str] | None:
+        """Unregisters a channel along with all of its players, deleting players that are no longer in any channel.
+        Returns the names of the players that were in the channel, or None if it wasn't registered."""
+        channel = self.channels.pop(channel_id, None)
+        if channel is None:
+            return None
+        self._mark_deleted("channels", channel_id)
+        self.name_indexes.pop(channel_id, None)
+        self.stats.drop_channel(channel_id)
+        for player_name in channel["players"]:
+            self._remove_channel_from_player(player_name, channel_id)
+        return channel["players"]
+
+    # ---------- players ----------
+
+    def get_players(self) -> dict:
+        return self.players
+
+    def get_player(self, player_name: str) -> dict | None:
+        return self.players.get(player_name)
+
+    def search_player_names(self, channel_id: str, query: str, limit: int = 25) -> list[str]:
+        """The names of the players in the channel containing query (ignoring case), the ones starting with it first."""
+        name_index = self.name_indexes.get(channel_id)
+        return name_index.search(query, limit) if name_index is not None else []
+
+    def add_player(self, player_name: str, puuid: str, channel_id: str, platform: str | None = None) -> None:
+        """Adds a player to a channel, creating the player if they aren't tracked anywhere yet.
+        A platform (na1, euw1, kr, ...) overrides the one the player was tracked with before, None leaves it alone."""
+        if player_name not in self.players:
+            self.players[player_name] = {"puuid": puuid, "channels": [], "most_recent_match_id": None, "platform": None,
+                                         "last_game_end_timestamp": None}
+        if platform is not None:
+            self.players[player_name]["platform"] = platform
+        if channel_id not in self.players[player_name]["channels"]:
+            self.players[player_name]["channels"].append(channel_id)
+        if player_name not in self.channels[channel_id]["players"]:
+            self.channels[channel_id]["players"].append(player_name)
+            self.name_indexes[channel_id].add(player_name)
+            self.stats.join_channel(channel_id, player_name)
+        self._mark_dirty("players", player_name)
+        self._mark_dirty("channels", channel_id)
+
+    def remove_player(self, player_name: str, channel_id: str) -> bool:
+        """Removes a player from a channel, deleting the player entirely if they aren't in any other channel.
+        Returns False if the player wasn't in the channel."""
+        channel = self.channels.get(channel_id)
+        if channel is None or player_name not in channel["players"]:
+            return False
+        channel["players"].remove(player_name)
+        self.name_indexes[channel_id].remove(player_name)
+        self.stats.leave_channel(channel_id, player_name)
+        self._mark_dirty("channels", channel_id)
+        self._remove_channel_from_player(player_name, channel_id)
+        return True
+
+    def _remove_channel_from_player(self, player_name: str, channel_id: str) -> None:
+        player = self.players.get(player_name)
+        if player is None:
+            return
+        if channel_id in player["channels"]:
+            player["channels"].remove(channel_id)
+        if player["channels"]:
+            self._mark_dirty("players", player_name)
+        else:
+            self.players.pop(player_name)
+            self._mark_deleted("players", player_name)
+            self._dereference_match(player["most_recent_match_id"])
+            # their games go with them (their heap entries get skipped when they come up)
+            for key in [key for key in self.player_games if key[0] == player_name]:
+                self.stats.remove_game(player_name, self.player_games.pop(key))
+                self._mark_deleted("player_games", key)
+
+    def set_most_recent_match_ids(self, match_ids: dict[str, str]) -> None:
+        """Takes {player_name: match_id}. The match's end time (if its data has been stored) becomes the player's
+        last_game_end_timestamp, which is where the next catch-up starts from."""
+        for player_name, match_id in match_ids.items():
+            if player_name in self.players:
+                self._dereference_match(self.players[player_name]["most_recent_match_id"])
+                self._reference_match(match_id)
+                self.players[player_name]["most_recent_match_id"] = match_id
+                # without the match's data there's no end time, and the old one is still a better place to catch up from than none
+                if (game_end_timestamp := (self.matches.get(match_id) or {}).get("game_end_timestamp")) is not None:
+                    self.players[player_name]["last_game_end_timestamp"] = game_end_timestamp
+                self._mark_dirty("players", player_name)
+
+    # ---------- matches ----------
+
+    def get_match(self, match_id: str) -> dict | None:
+        return self.matches.get(match_id)
+
+    def put_matches(self, matches: dict) -> None:
+        """Takes {match_id: match_data}."""
+        for match_id, match_data in matches.items():
+            self.matches[match_id] = match_data
+            self._mark_dirty("matches", match_id)
+            # usually a player or message points to it right after, but if not it'll get collected eventually
+            if not self.match_references[match_id]:
+                self._add_orphan_candidate(match_id)
+
+    # ---------- message ids ----------
+
+    def get_message(self, message_id: str) -> dict | None:
+        return self.message_ids.get(message_id)
+
+    def add_messages(self, messages: dict) -> None:
+        """Takes {message_id: {"player_name": ..., "match_id": ..., "datetime_sent": ...}}."""
+        for message_id, message in messages.items():
+            if (old_message := self.message_ids.get(message_id)) is not None:
+                self._dereference_match(old_message["match_id"])
+            self.message_ids[message_id] = message
+            self._reference_match(message["match_id"])
+            heapq.heappush(self.message_expiry_heap, (message["datetime_sent"], message_id))
+            self._mark_dirty("message_ids", message_id)
+
+    def prune_messages_sent_before(self, cutoff_iso: str) -> int:
+        """Deletes every message sent before the cutoff (an ISO timestamp). The matches they pointed to lose a reference,
+        and get deleted by collect_orphaned_matches once nothing else points to them."""
+        pruned = 0
+        while self.message_expiry_heap and self.message_expiry_heap[0][0] < cutoff_iso:
+            datetime_sent, message_id = heapq.heappop(self.message_expiry_heap)
+            message = self.message_ids.get(message_id)
+            # already gone, or re-added with a newer timestamp (which has its own heap entry)
+            if message is None or message["datetime_sent"] != datetime_sent:
+                continue
+            del self.message_ids[message_id]
+            self._mark_deleted("message_ids", message_id)
+            self._dereference_match(message["match_id"])
+            pruned += 1
+        return pruned
+
+    # ---------- player games (stats) ----------
+
+    def record_games(self, games: dict[tuple[str, str], dict]) -> None:
+        """Takes {(player_name, match_id): game record} and adds each game to its player's stats, once --
+        games that were already recorded and players that aren't tracked anymore get skipped."""
+        for (player_name, match_id), game in games.items():
+            key = (player_name, match_id)
+            if key in self.player_games or player_name not in self.players:
+                continue
+            self.player_games[key] = game
+            self._mark_dirty("player_games", key)
+            heapq.heappush(self.game_expiry_heap, (game["game_end_timestamp"], player_name, match_id))
+            self.stats.add_game(player_name, game)
+
+    def expire_games_before(self, ended_before_ms: int) -> int:
+        """Takes the games that ended before ended_before_ms (unix milliseconds) out of the stats and deletes them."""
+        expired = 0
+        while self.game_expiry_heap and self.game_expiry_heap[0][0] < ended_before_ms:
+            _, player_name, match_id = heapq.heappop(self.game_expiry_heap)
+            # already gone along with its player
+            if (game := self.player_games.pop((player_name, match_id), None)) is None:
+                continue
+            self._mark_deleted("player_games", (player_name, match_id))
+            self.stats.remove_game(player_name, game)
+            expired += 1
+        return expired
+
+    # ---------- retention ----------
+
+    def collect_orphaned_matches(self, ended_before_ms: int) -> int:
+        """Deletes matches that no player or message points to anymore and whose game ended before ended_before_ms
+        (a unix timestamp in milliseconds). The orphan candidates are kept in a heap ordered by when their game ended,
+        so only the ones that can be collected by now get looked at."""
+        collected = 0
+        while self.orphan_heap and self.orphan_heap[0][0] < ended_before_ms:
+            _, match_id = heapq.heappop(self.orphan_heap)
+            self.orphan_candidates.discard(match_id)
+            # gone already, or referenced again since (it gets pushed again if it loses its references again)
+            if match_id not in self.matches or self.match_references[match_id]:
+                continue
+            del self.matches[match_id]
+            self._mark_deleted("matches", match_id)
+            collected += 1
+        return collected
+
+    def storage_report(self) -> dict:
+        """Counts of what's held in memory, for the storage report."""
+        return {
+            "channels": len(self.channels), "players": len(self.players), "matches": len(self.matches),
+            "message_ids": len(self.message_ids), "referenced_matches": len(self.match_references),
+            "orphaned_match_candidates": len(self.orphan_candidates), "orphan_heap": len(self.orphan_heap),
+            "message_expiry_heap": len(self.message_expiry_heap),
+            "player_games": len(self.player_games), "game_expiry_heap": len(self.game_expiry_heap),
+        }
+
+    # ---------- everything ----------
+
+    def clear_all(self) -> None:
+        for collection in COLLECTIONS:
+            getattr(self, collection).clear()
+            self.dirty[collection].clear()
+            self.deleted[collection].clear()
+        self._rebuild_indexes()
+        self.cleared = True
+
+    def _take_snapshot(self) -> dict:
+        """Copies out everything that changed since the last flush, and resets the dirty tracking."""
+        changes = {"cleared": self.cleared}
+        for collection in COLLECTIONS:
+            live = getattr(self, collection)
+            upsert = {}
+            for key in self.dirty[collection]:
+                value = live[key]
+                # channels and players get changed in place later on, so copy their lists now
+                if collection == "channels":
+                    value = {"name": value["name"], "players": list(value["players"])}
+                elif collection == "players":
+                    value = {**value, "channels": list(value["channels"])}
+                upsert[key] = value
+            changes[collection] = {"upsert": upsert, "delete": list(self.deleted[collection])}
+            self.dirty[collection] = set()
+            self.deleted[collection] = set()
+        self.cleared = False
+        return changes
+
+    def _restore_snapshot(self, changes: dict) -> None:
+        """Marks a snapshot's changes as dirty again after a failed flush, unless they've been overwritten since."""
+        self.cleared = self.cleared or changes["cleared"]
+        for collection in COLLECTIONS:
+            for key in changes[collection]["upsert"]:
+                if key not in self.deleted[collection] and key in getattr(self, collection):
+                    self.dirty[collection].add(key)
+            for key in changes[collection]["delete"]:
+                if key not in self.dirty[collection]:
+                    self.deleted[collection].add(key)
+
+    async def flush(self) -> None:
+        """Writes every dirty change to the database in one transaction on the database's worker thread."""
+        async with self._flush_lock:
+            if not self.has_unsaved_changes():
+                return
+            changes = self._take_snapshot()
+            try:
+                await repository.apply_changes(changes)
+            except Exception as e:
+                print_to_log("ERROR", f"Failed to flush state to the database, will retry: {e}")
+                self._restore_snapshot(changes)
+                return
+            print_to_log("DEBUG", "Flushed " + ", ".join(
+                f"{collection}: {len(changes[collection]['upsert'])} changed/{len(changes[collection]['delete'])} deleted"
+                for collection in COLLECTIONS))
+
+
+state = BotState()
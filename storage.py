@@ -0,0 +1,270 @@
+import asyncio
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+from auxiliary_functions import print_to_log
+
+# every entry is one schema version, applied in order and tracked with PRAGMA user_version
+# never edit an entry that has already shipped -- add a new one instead
+SCHEMA_MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS channels (
+        channel_id TEXT PRIMARY KEY,
+        name TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS players (
+        player_name TEXT PRIMARY KEY,
+        puuid TEXT NOT NULL,
+        most_recent_match_id TEXT
+    );
+    CREATE INDEX IF NOT EXISTS players_puuid ON players (puuid);
+    CREATE TABLE IF NOT EXISTS channel_players (
+        channel_id TEXT NOT NULL REFERENCES channels (channel_id) ON DELETE CASCADE,
+        player_name TEXT NOT NULL REFERENCES players (player_name) ON DELETE CASCADE,
+        PRIMARY KEY (channel_id, player_name)
+    );
+    CREATE INDEX IF NOT EXISTS channel_players_player_name ON channel_players (player_name);
+    CREATE TABLE IF NOT EXISTS matches (
+        match_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS message_ids (
+        message_id TEXT PRIMARY KEY,
+        player_name TEXT NOT NULL,
+        match_id TEXT NOT NULL,
+        datetime_sent TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS message_ids_match_id ON message_ids (match_id);
+    CREATE INDEX IF NOT EXISTS message_ids_datetime_sent ON message_ids (datetime_sent);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """,
+    # the platform (na1, euw1, kr, ...) a player plays on, which decides which Riot region they get polled through
+    # NULL means the bot's default region
+    """
+    ALTER TABLE players ADD COLUMN platform TEXT;
+    """,
+    # when the player's most recent match ended (unix milliseconds) -- together with most_recent_match_id it's the
+    # high-water mark that catching up on missed matches starts from
+    """
+    ALTER TABLE players ADD COLUMN last_game_end_timestamp INTEGER;
+    """,
+    # the games that count towards each player's rolling stats (see player_stats.py), deleted once they fall out of the window
+    """
+    CREATE TABLE IF NOT EXISTS player_games (
+        player_name TEXT NOT NULL REFERENCES players (player_name) ON DELETE CASCADE,
+        match_id TEXT NOT NULL,
+        game_end_timestamp INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (player_name, match_id)
+    );
+    CREATE INDEX IF NOT EXISTS player_games_game_end_timestamp ON player_games (game_end_timestamp);
+    """,
+]
+
+
+class Repository:
+    """Async repository on top of a local SQLite database (in WAL mode). BotState (state.py) is what the bot reads and
+    writes, this only loads everything at startup and takes its batches of changes.
+    All queries run on one dedicated worker thread, so they never block the event loop and never race each other,
+    and every method that changes more than one row does so in a single transaction."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection: sqlite3.Connection | None = None
+        # one thread means one connection and strictly ordered writes
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    async def _run(self, function, *args):
+        if self.connection is None:
+            await self.open()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def open(self) -> None:
+        if self.connection is not None:
+            return
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._open)
+
+    def _open(self) -> None:
+        if self.connection is not None:
+            return
+        if directory := os.path.dirname(self.path):
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable enough in WAL mode and a lot faster than FULL
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        for new_version, script in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+            with connection:
+                connection.executescript(script)
+                connection.execute(f"PRAGMA user_version={new_version}")
+            print_to_log("INFO", f"Migrated database schema to version {new_version}")
+        self.connection = connection
+
+    async def close(self) -> None:
+        if self.connection is None:
+            return
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.connection.close)
+        self.connection = None
+
+    # ---------- meta ----------
+
+    async def get_meta(self, key: str) -> str | None:
+        return await self._run(self._get_meta, key)
+
+    def _get_meta(self, key: str) -> str | None:
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    async def set_meta(self, key: str, value: str) -> None:
+        await self._run(self._set_meta, key, value)
+
+    def _set_meta(self, key: str, value: str) -> None:
+        with self.connection:
+            self.connection.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, value))
+
+    # ---------- everything ----------
+
+    async def storage_report(self) -> dict:
+        """Sizes (in bytes) of the database files and the match data in them, plus row counts for every table."""
+        return await self._run(self._storage_report)
+
+    def _storage_report(self) -> dict:
+        page_size = self.connection.execute("PRAGMA page_size").fetchone()[0]
+        report = {
+            "database_bytes": self.connection.execute("PRAGMA page_count").fetchone()[0] * page_size,
+            # space left behind by deleted rows, which sqlite reuses before growing the file
+            "free_bytes": self.connection.execute("PRAGMA freelist_count").fetchone()[0] * page_size,
+            "wal_bytes": os.path.getsize(self.path + "-wal") if os.path.exists(self.path + "-wal") else 0,
+            "match_data_bytes": self.connection.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM matches").fetchone()[0],
+        }
+        for table in ["channels", "players", "channel_players", "matches", "message_ids", "player_games"]:
+            report[f"{table}_rows"] = self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return report
+
+    async def load_everything(self) -> dict:
+        """Reads every table at once, returned as {"channels": ..., "players": ..., "matches": ..., "message_ids": ..., "player_games": ...},
+        where channels are {channel_id: {"name": ..., "players": [...]}} and players are
+        {player_name: {"puuid": ..., "channels": [...], "most_recent_match_id": ..., "platform": ..., "last_game_end_timestamp": ...}}"""
+        return await self._run(self._load_everything)
+
+    def _load_channels(self) -> dict:
+        channels = {row["channel_id"]: {"name": row["name"], "players": []}
+                    for row in self.connection.execute("SELECT channel_id, name FROM channels")}
+        # rowid order is insertion order, so players are listed in the order they were added
+        for row in self.connection.execute("SELECT channel_id, player_name FROM channel_players ORDER BY rowid"):
+            channels[row["channel_id"]]["players"].append(row["player_name"])
+        return channels
+
+    def _load_players(self) -> dict:
+        players = {row["player_name"]: {"puuid": row["puuid"], "channels": [], "most_recent_match_id": row["most_recent_match_id"],
+                                        "platform": row["platform"], "last_game_end_timestamp": row["last_game_end_timestamp"]}
+                   for row in self.connection.execute("SELECT * FROM players")}
+        for row in self.connection.execute("SELECT channel_id, player_name FROM channel_players ORDER BY rowid"):
+            players[row["player_name"]]["channels"].append(row["channel_id"])
+        return players
+
+    def _load_everything(self) -> dict:
+        return {
+            "channels": self._load_channels(),
+            "players": self._load_players(),
+            "matches": {row["match_id"]: json.loads(row["data"]) for row in self.connection.execute("SELECT match_id, data FROM matches")},
+            "message_ids": {row["message_id"]: {"player_name": row["player_name"], "match_id": row["match_id"], "datetime_sent": row["datetime_sent"]}
+                            for row in self.connection.execute("SELECT * FROM message_ids")},
+            "player_games": {(row["player_name"], row["match_id"]): json.loads(row["data"])
+                             for row in self.connection.execute("SELECT player_name, match_id, data FROM player_games")},
+        }
+
+    async def apply_changes(self, changes: dict) -> None:
+        """Writes a batch of changes in one transaction, so either all of it lands on disk or none of it does.
+        `changes` looks like {"cleared": bool, "<collection>": {"upsert": {key: value}, "delete": [key, ...]}}
+        for each of channels, players, matches, message_ids and player_games (the values have the same shapes as in
+        load_everything, player_games are keyed by (player_name, match_id)).
+        Serializing the match data happens here too, so it's off the event loop."""
+        await self._run(self._apply_changes, changes)
+
+    def _apply_changes(self, changes: dict) -> None:
+        channels, players = changes["channels"], changes["players"]
+        matches, message_ids, player_games = changes["matches"], changes["message_ids"], changes["player_games"]
+        with self.connection:
+            if changes["cleared"]:
+                for table in ["player_games", "channel_players", "channels", "players", "matches", "message_ids"]:
+                    self.connection.execute(f"DELETE FROM {table}")
+            # deleting a channel or player also deletes their channel_players rows through ON DELETE CASCADE
+            self.connection.executemany("DELETE FROM channels WHERE channel_id = ?", [(key,) for key in channels["delete"]])
+            self.connection.executemany("DELETE FROM players WHERE player_name = ?", [(key,) for key in players["delete"]])
+            self.connection.executemany("DELETE FROM matches WHERE match_id = ?", [(key,) for key in matches["delete"]])
+            self.connection.executemany("DELETE FROM message_ids WHERE message_id = ?", [(key,) for key in message_ids["delete"]])
+            self.connection.executemany("DELETE FROM player_games WHERE player_name = ? AND match_id = ?", player_games["delete"])
+            # these are upserts rather than INSERT OR REPLACE, because a REPLACE deletes the old row first and that would cascade
+            self.connection.executemany(
+                "INSERT INTO players (player_name, puuid, most_recent_match_id, platform, last_game_end_timestamp) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (player_name) DO UPDATE SET puuid = excluded.puuid, most_recent_match_id = excluded.most_recent_match_id, "
+                "platform = excluded.platform, last_game_end_timestamp = excluded.last_game_end_timestamp",
+                [(player_name, player["puuid"], player["most_recent_match_id"], player.get("platform"), player.get("last_game_end_timestamp"))
+                 for player_name, player in players["upsert"].items()])
+            self.connection.executemany(
+                "INSERT INTO channels (channel_id, name) VALUES (?, ?) ON CONFLICT (channel_id) DO UPDATE SET name = excluded.name",
+                [(channel_id, channel["name"]) for channel_id, channel in channels["upsert"].items()])
+            # a changed channel gets its whole player list rewritten, which also keeps the rowids in list order
+            for channel_id, channel in channels["upsert"].items():
+                self.connection.execute("DELETE FROM channel_players WHERE channel_id = ?", (channel_id,))
+                self.connection.executemany("INSERT INTO channel_players (channel_id, player_name) VALUES (?, ?)",
+                                            [(channel_id, player_name) for player_name in channel["players"]])
+            self.connection.executemany("INSERT OR REPLACE INTO matches (match_id, data) VALUES (?, ?)",
+                                        [(match_id, json.dumps(data, separators=(",", ":"))) for match_id, data in matches["upsert"].items()])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO message_ids (message_id, player_name, match_id, datetime_sent) VALUES (?, ?, ?, ?)",
+                [(message_id, m["player_name"], m["match_id"], m["datetime_sent"]) for message_id, m in message_ids["upsert"].items()])
+            # after the players, which they belong to
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO player_games (player_name, match_id, game_end_timestamp, data) VALUES (?, ?, ?, ?)",
+                [(player_name, match_id, game["game_end_timestamp"], json.dumps(game, separators=(",", ":")))
+                 for (player_name, match_id), game in player_games["upsert"].items()])
+
+    async def migrate_from_json(self, json_directory: str = "jsons") -> None:
+        """One-shot import of the old channels/players/matches/message_ids JSON files.
+        It only ever runs once per database, and the JSON files are left alone afterwards."""
+        await self._run(self._migrate_from_json, json_directory)
+
+    def _migrate_from_json(self, json_directory: str) -> None:
+        if self.connection.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+            return
+
+        def load(name: str) -> dict:
+            try:
+                with open(os.path.join(json_directory, f"{name}.json"), mode="r") as f:
+                    return json.loads(f.read())
+            except (FileNotFoundError, json.JSONDecodeError):
+                return {}
+
+        channels, players, matches, message_ids = load("channels"), load("players"), load("matches"), load("message_ids")
+        with self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO channels (channel_id, name) VALUES (?, ?)",
+                                        [(channel_id, channel["name"]) for channel_id, channel in channels.items()])
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO players (player_name, puuid, most_recent_match_id) VALUES (?, ?, ?)",
+                [(player_name, player["puuid"], player["most_recent_match_id"]) for player_name, player in players.items()])
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO channel_players (channel_id, player_name) VALUES (?, ?)",
+                [(channel_id, player_name) for channel_id, channel in channels.items()
+                 for player_name in channel["players"] if player_name in players])
+            # failed fetches used to be stored as null, there's nothing worth keeping in those
+            self.connection.executemany("INSERT OR IGNORE INTO matches (match_id, data) VALUES (?, ?)",
+                                        [(match_id, json.dumps(data, separators=(",", ":"))) for match_id, data in matches.items() if data])
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO message_ids (message_id, player_name, match_id, datetime_sent) VALUES (?, ?, ?, ?)",
+                [(message_id, m["player_name"], m["match_id"], m["datetime_sent"]) for message_id, m in message_ids.items()])
+            self.connection.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_json', datetime('now'))")
+        print_to_log("INFO", f"Migrated {len(channels)} channels, {len(players)} players, {len(matches)} matches "
+                             f"and {len(message_ids)} message IDs from JSON")
+
+
+repository = Repository(getenv('DATABASE_PATH', 'jsons/bot.db'))
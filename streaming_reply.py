@@ -0,0 +1,94 @@
+import time
+from typing import AsyncIterator, Awaitable, Callable
+
+# discord has a 2000 character limit for non nitro members, and " ...(cont.)" needs some room too
+MESSAGE_LIMIT = 1985
+CONTINUED = " ...(cont.)"
+# shown at the end of a message while more text is still coming in
+CURSOR = " ▌"
+
+
+class StreamingReply:
+    """Sends an LLM answer to discord, either all at once or progressively as it's generated.
+
+    `send(content, previous_message)` posts a new message and returns it -- previous_message is None for the first one,
+    otherwise it's the message being continued (so the parts can be chained as replies). Whatever it returns just needs
+    an async edit(content=...), which discord.Message, WebhookMessage and InteractionMessage all have.
+
+    While streaming, the current message gets edited at most once every edit_interval seconds, which keeps us well
+    under discord's edit rate limit, and a new chained message is started whenever the current one would go over
+    the character limit.
+
+    If given, on_write(message, content) is called after every send or edit, with the message's new content."""
+
+    def __init__(self, send: Callable[[str, object | None], Awaitable[object]], edit_interval: float = 1.0,
+                 placeholder: str = "*thinking...*", on_write: Callable[[object, str], None] | None = None):
+        self.send = send
+        self.on_write = on_write
+        self.edit_interval = edit_interval
+        self.placeholder = placeholder
+        # the message currently being written into, and the one before it (which the next part gets chained to)
+        self.current_message = None
+        self.previous_message = None
+        # seconds from the start of stream() until the first piece of the answer was on screen
+        self.time_to_first_text: float | None = None
+
+    async def start(self) -> None:
+        """Posts the placeholder right away, so there's something on screen while the answer is generated."""
+        if self.current_message is None:
+            await self._write(self.placeholder)
+
+    async def _write(self, content: str) -> None:
+        if self.current_message is None:
+            self.current_message = await self.send(content, self.previous_message)
+        else:
+            await self.current_message.edit(content=content)
+        if self.on_write is not None:
+            self.on_write(self.current_message, content)
+
+    def _next_message(self) -> None:
+        self.previous_message = self.current_message
+        self.current_message = None
+
+    async def send_text(self, text: str) -> None:
+        """Sends a finished piece of text, split into chained messages if it's too long for one."""
+        text = text or "(empty response)"
+        while len(text) > MESSAGE_LIMIT:
+            await self._write(text[:MESSAGE_LIMIT] + CONTINUED)
+            self._next_message()
+            text = text[MESSAGE_LIMIT:]
+        await self._write(text)
+
+    async def stream(self, chunks: AsyncIterator[str]) -> tuple[str, bool]:
+        """Writes the chunks into the reply as they arrive. Returns the full text and whether it finished without errors
+        (if it didn't, the error is shown at the end of the reply)."""
+        started_at = time.monotonic()
+        await self.start()
+        full_text = ""
+        # the part of the text that goes into the current message
+        segment = ""
+        last_edit = time.monotonic()
+        succeeded = True
+        try:
+            async for chunk in chunks:
+                full_text += chunk
+                segment += chunk
+                while len(segment) > MESSAGE_LIMIT:
+                    await self._write(segment[:MESSAGE_LIMIT] + CONTINUED)
+                    self._next_message()
+                    segment = segment[MESSAGE_LIMIT:]
+                    last_edit = time.monotonic()
+                # the first bit of the answer goes up immediately, after that edits are throttled
+                if segment and (self.time_to_first_text is None or time.monotonic() - last_edit >= self.edit_interval):
+                    await self._write(segment + CURSOR)
+                    last_edit = time.monotonic()
+                    if self.time_to_first_text is None:
+                        self.time_to_first_text = last_edit - started_at
+        except Exception as e:
+            succeeded = False
+            segment += f"\nError: {e}"
+        # the error can push the last segment over the limit, so it gets split like any other text
+        await self.send_text(segment)
+        if self.time_to_first_text is None:
+            self.time_to_first_text = time.monotonic() - started_at
+        return full_text, succeeded
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+import numpy as np
+
+# frames are one minute apart, so this is the first 20 minutes (approx when laning phase ends)
+LANING_FRAMES = 21
+# the frame (minute) at which gold/xp leads over the lane opponent are measured
+LEAD_FRAME = 14
+# how close (in map units) the allied jungler has to be to count as being "near" a player in a frame
+PROXIMITY_RADIUS = 3000
+
+
+class MatchTimeline:
+    """The parts of a match timeline we actually use, reduced to a few small arrays.
+    Participants are indexed 0-9 in participantId order; frames are one per minute."""
+    __slots__ = ("puuids", "positions", "gold", "xp")
+
+    def __init__(self, puuids: list[str], positions: np.ndarray, gold: np.ndarray, xp: np.ndarray):
+        self.puuids = puuids
+        self.positions = positions  # (frames, 10, 2) x/y
+        self.gold = gold  # (frames, 10) total gold
+        self.xp = xp  # (frames, 10)
+
+
+def reduce_timeline(raw_timeline: dict) -> MatchTimeline | None:
+    """Turns the (hundreds of KB) timeline payload from match-v5 into a MatchTimeline.
+    Returns None for timelines without any frames, which have nothing to analyze."""
+    info = raw_timeline["info"]
+    participants = sorted(info["participants"], key=lambda p: p["participantId"])
+    participant_ids = [str(p["participantId"]) for p in participants]
+    frames = info["frames"]
+    if not frames:
+        return None
+    positions = np.zeros((len(frames), len(participant_ids), 2), dtype=np.int32)
+    gold = np.zeros((len(frames), len(participant_ids)), dtype=np.int32)
+    xp = np.zeros((len(frames), len(participant_ids)), dtype=np.int32)
+    for frame_index, frame in enumerate(frames):
+        for participant_index, participant_id in enumerate(participant_ids):
+            participant_frame = frame["participantFrames"].get(participant_id)
+            if participant_frame is None:
+                continue
+            position = participant_frame.get("position", {})
+            positions[frame_index, participant_index] = (position.get("x", 0), position.get("y", 0))
+            gold[frame_index, participant_index] = participant_frame.get("totalGold", 0)
+            xp[frame_index, participant_index] = participant_frame.get("xp", 0)
+    return MatchTimeline([p["puuid"] for p in participants], positions, gold, xp)
+
+
+def analyze_lanes(timeline: MatchTimeline, teams: list[str], roles: list[str]) -> dict[str, dict] | None:
+    """Computes jungle side/proximity and lane lead metrics for all ten players at once.
+    `teams` and `roles` are in the same order as timeline.puuids (roles use our names -- TOP, JG, MID, BOT, SUPP).
+    Returns {puuid: metrics}, where metrics has:
+        jungle_top_p / jungle_bot_p -- % of laning frames the allied jungler spent topside / botside
+        jungle_proximity -- % of laning frames the allied jungler was within PROXIMITY_RADIUS of the player
+        strongsided -- True/False for top and bot lane players, None for everyone else
+        gold_diff / xp_diff -- lead over the lane opponent at LEAD_FRAME (None if there is no lane opponent)
+    Returns None if the timeline has no frames."""
+    if len(timeline.gold) == 0:
+        return None
+    count = len(timeline.puuids)
+    teams_array = np.array(teams)
+    roles_array = np.array(roles)
+    positions = timeline.positions[:LANING_FRAMES].astype(np.float64)
+    x, y = positions[..., 0], positions[..., 1]
+
+    # each player's allied jungler and lane opponent, as indices (-1 when there isn't one)
+    same_team = teams_array[:, None] == teams_array[None, :]
+    is_jungler = roles_array == "JG"
+    allied_jungler = np.where((same_team & is_jungler[None, :]).any(axis=1), (same_team & is_jungler[None, :]).argmax(axis=1), -1)
+    same_role = (roles_array[:, None] == roles_array[None, :]) & (roles_array[:, None] != "")
+    opponent_mask = same_role & ~same_team
+    lane_opponent = np.where(opponent_mask.any(axis=1), opponent_mask.argmax(axis=1), -1)
+
+    # which side of the map every player is on in every frame -- (frames, 10)
+    topside = (y >= 5000) & (y > x) & (x <= 10000)
+    botside = (x >= 5000) & (x > y) & (y <= 10000)
+    frame_count = max(len(positions), 1)
+    top_p = np.round(topside.sum(axis=0) / frame_count * 100, 2)
+    bot_p = np.round(botside.sum(axis=0) / frame_count * 100, 2)
+
+    # distance from every player to every other player in every frame -- (frames, 10, 10)
+    distances = np.linalg.norm(positions[:, :, None, :] - positions[:, None, :, :], axis=-1)
+    jungler_index = np.clip(allied_jungler, 0, None)
+    jungler_distance = distances[:, jungler_index, np.arange(count)]  # (frames, 10)
+    proximity = np.round((jungler_distance < PROXIMITY_RADIUS).sum(axis=0) / frame_count * 100, 2)
+
+    lead_frame = min(LEAD_FRAME, len(timeline.gold) - 1)
+    opponent_index = np.clip(lane_opponent, 0, None)
+    gold_diff = timeline.gold[lead_frame] - timeline.gold[lead_frame, opponent_index]
+    xp_diff = timeline.xp[lead_frame] - timeline.xp[lead_frame, opponent_index]
+
+    jungler_top_p, jungler_bot_p = top_p[jungler_index], bot_p[jungler_index]
+    strongsided = np.where(roles_array == "TOP", jungler_top_p >= jungler_bot_p, jungler_bot_p >= jungler_top_p)
+    has_side = np.isin(roles_array, ["TOP", "BOT", "SUPP"]) & (allied_jungler >= 0)
+
+    metrics = {}
+    for i, puuid in enumerate(timeline.puuids):
+        has_jungler = bool(allied_jungler[i] >= 0) and not is_jungler[i]
+        has_opponent = bool(lane_opponent[i] >= 0)
+        metrics[puuid] = {
+            "jungle_top_p": float(jungler_top_p[i]) if has_jungler else None,
+            "jungle_bot_p": float(jungler_bot_p[i]) if has_jungler else None,
+            "jungle_proximity": float(proximity[i]) if has_jungler else None,
+            "strongsided": bool(strongsided[i]) if has_side[i] else None,
+            "gold_diff": int(gold_diff[i]) if has_opponent else None,
+            "xp_diff": int(xp_diff[i]) if has_opponent else None,
+        }
+    return metrics
+
+
+class TimelineCache:
+    """LRU cache of reduced timelines (and the lane analysis computed from them), keyed by match ID."""
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self.timelines: OrderedDict[str, MatchTimeline] = OrderedDict()
+        self.analyses: dict[str, dict[str, dict]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, match_id: str) -> MatchTimeline | None:
+        timeline = self.timelines.get(match_id)
+        if timeline is None:
+            self.misses += 1
+            return None
+        self.timelines.move_to_end(match_id)
+        self.hits += 1
+        return timeline
+
+    def put(self, match_id: str, timeline: MatchTimeline) -> None:
+        self.timelines[match_id] = timeline
+        self.timelines.move_to_end(match_id)
+        while len(self.timelines) > self.max_entries:
+            evicted_match_id, _ = self.timelines.popitem(last=False)
+            self.analyses.pop(evicted_match_id, None)